@@ -0,0 +1,5 @@
+"""
+Local stand-in for the ProtonDB, Steam and YTS web APIs (see server.py)
+"""
+
+from .server import FaultProfile, MockAPIServer, Recordings
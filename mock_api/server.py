@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the ProtonDB, Steam and YTS web APIs
+
+Serves recorded responses (the JSON files in `fixtures/`, or a directory of
+your own) on the same paths as the real APIs, so both plugins and their test
+scripts can run against it without a network connection:
+
+    /api/v1/reports/summaries/<appid>.json      ProtonDB summaries
+    /ISteamApps/GetAppList/v2/                  Steam app list
+    /IStoreService/GetAppList/v1/               Steam app list changes (paged)
+    /api/v2/list_movies.json?query_term=...     YTS movie search
+    /_stats                                     requests served, by route and status
+
+Every response can be delayed (`latency` plus up to `jitter` seconds) or
+replaced by a server error (`error_rate`) or a 429 (`throttle_rate`, or any
+request over `rate_limit` per second). Faults are drawn from a seeded random
+generator, so a run with the same seed and request order is repeatable.
+
+    python3 mock_api/server.py --port 8765 --latency 0.05 --jitter 0.05 --error-rate 0.02
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class FaultProfile:
+    """How responses are delayed and failed"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, rate_limit=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self._random = random.Random(seed)
+        self._window_start = 0.0
+        self._window_count = 0
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Return (delay, status) for the next request; status None means serve it"""
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter) if self.jitter else self.latency
+            roll = self._random.random()
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            if self.rate_limit is not None and self._window_count > self.rate_limit:
+                return delay, 429
+            if roll < self.error_rate:
+                return delay, 503
+            if roll < self.error_rate + self.throttle_rate:
+                return delay, 429
+            return delay, None
+
+
+class Recordings:
+    """The responses replayed by the server"""
+
+    def __init__(self, directory=FIXTURES_DIR, synthetic_apps=0):
+        self.summaries = self._load(directory, 'protondb_summaries.json', {})
+        self.apps = self._load(directory, 'steam_applist.json', {'applist': {'apps': []}})['applist']['apps']
+        self.movies = self._load(directory, 'yts_movies.json', [])
+        if synthetic_apps:
+            # A large app list for load tests, after the recorded apps
+            self.apps = self.apps + [
+                {'appid': 5000000 + index, 'name': f"Synthetic App {index}"}
+                for index in range(synthetic_apps)
+            ]
+        self.app_list_body = json.dumps({'applist': {'apps': self.apps}}).encode('utf-8')
+
+    @staticmethod
+    def _load(directory, name, default):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            return default
+        with open(path, 'rb') as f:
+            return json.load(f)
+
+    def summary(self, appid):
+        return self.summaries.get(str(appid))
+
+    def app_changes(self, params):
+        """Page through the app list like IStoreService/GetAppList"""
+        last_appid = int(params.get('last_appid', 0))
+        max_results = int(params.get('max_results', 10000))
+        apps = sorted((app for app in self.apps if app['appid'] > last_appid), key=lambda app: app['appid'])
+        page = apps[:max_results]
+        response = {'apps': [dict(app, last_modified=0) for app in page]}
+        if len(apps) > max_results:
+            response['have_more_results'] = True
+            response['last_appid'] = page[-1]['appid']
+        return {'response': response}
+
+    def list_movies(self, params):
+        """Search the recorded movies like YTS list_movies.json"""
+        term = params.get('query_term', '').lower()
+        limit = int(params.get('limit', 20))
+        movies = [movie for movie in self.movies if term in movie['title'].lower()]
+        data = {'movie_count': len(movies), 'limit': limit, 'page_number': 1}
+        if movies:
+            data['movies'] = movies[:limit]
+        return {'status': 'ok', 'status_message': 'Query was successful', 'data': data}
+
+
+class MockAPIServer(ThreadingHTTPServer):
+    """Threaded HTTP server replaying recordings with injected faults"""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, recordings=None, faults=None):
+        self.recordings = recordings or Recordings()
+        self.faults = faults or FaultProfile()
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        super().__init__((host, port), _RequestHandler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve on a background thread, returning the base URL"""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-api", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, route, status):
+        with self._stats_lock:
+            by_status = self.stats.setdefault(route, {})
+            by_status[str(status)] = by_status.get(str(status), 0) + 1
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        route, body = self._route(url.path, params)
+
+        if route == '_stats':
+            self._send(200, json.dumps(self.server.stats).encode('utf-8'))
+            return
+        delay, fault = self.server.faults.draw()
+        if delay:
+            time.sleep(delay)
+        if fault is not None:
+            self.server.count(route, fault)
+            headers = {'Retry-After': '1'} if fault == 429 else {}
+            self._send(fault, json.dumps({'error': self.responses[fault][0]}).encode('utf-8'), headers)
+            return
+        status = 200 if body is not None else 404
+        self.server.count(route, status)
+        if body is None:
+            body = b'{"error": "Not Found"}'
+        elif not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self._send(status, body)
+
+    def _route(self, path, params):
+        recordings = self.server.recordings
+        if path.startswith('/api/v1/reports/summaries/') and path.endswith('.json'):
+            appid = path[len('/api/v1/reports/summaries/'):-len('.json')]
+            return 'protondb_summary', recordings.summary(appid)
+        if path.rstrip('/') == '/ISteamApps/GetAppList/v2':
+            return 'steam_app_list', recordings.app_list_body
+        if path.rstrip('/') == '/IStoreService/GetAppList/v1':
+            return 'steam_app_changes', recordings.app_changes(params)
+        if path == '/api/v2/list_movies.json':
+            return 'yts_list_movies', recordings.list_movies(params)
+        if path == '/_stats':
+            return '_stats', None
+        return 'unknown', None
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Load tests make thousands of requests
+        pass
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the ProtonDB, Steam and YTS APIs")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--recordings', default=FIXTURES_DIR, help="directory with the recorded responses")
+    parser.add_argument('--synthetic-apps', type=int, default=0, help="add this many apps to the app list")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many seconds more, at random")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument('--rate-limit', type=int, help="answer requests over this many per second with 429")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server = MockAPIServer(
+        args.host, args.port,
+        Recordings(args.recordings, args.synthetic_apps),
+        FaultProfile(args.latency, args.jitter, args.error_rate, args.throttle_rate, args.rate_limit, args.seed)
+    )
+    print(f"Serving the ProtonDB, Steam and YTS APIs on {server.url}")
+    print(f"  protondb: pdb_api = {server.url}/api/v1/reports/summaries/")
+    print(f"  protondb: steam_api = {server.url}/ISteamApps/GetAppList/v2/")
+    print(f"  movies:   yts_api_base = {server.url}/api/v2")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
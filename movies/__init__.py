@@ -23,43 +23,26 @@ md_bin_dependencies = ["webtorrent"]
 md_lib_dependencies = ["requests"]
 
 import albert
-import requests
+import functools
 import json
-import time
 import os
 import subprocess
 import urllib.parse
 import shutil
 from urllib.parse import quote_plus
 
-# Fallback logging functions for when albert logging is not available
-def safe_warning(message):
-    """Safely log warning message with fallback"""
-    try:
-        albert.warning(message)
-    except AttributeError:
-        print(f"WARNING: {message}")
-
-def safe_debug(message):
-    """Safely log debug message with fallback"""
-    try:
-        albert.debug(message)
-    except AttributeError:
-        print(f"DEBUG: {message}")
-
-def safe_info(message):
-    """Safely log info message with fallback"""
-    try:
-        albert.info(message)
-    except AttributeError:
-        print(f"INFO: {message}")
-
-def safe_critical(message):
-    """Safely log critical message with fallback"""
-    try:
-        albert.critical(message)
-    except AttributeError:
-        print(f"CRITICAL: {message}")
+from .plugin_core.atomic_file import load_json, write_json
+from .plugin_core.background import run_in_background
+from .plugin_core.connectivity import Connectivity
+from .plugin_core.debounce import debounce
+from .plugin_core.diagnostics import Diagnostics
+from .plugin_core.http import HttpClient
+from .plugin_core.log import safe_debug, safe_info, safe_warning
+from .plugin_core.metrics import Metrics
+from .plugin_core.profiler import QueryProfiler, queries_from_env
+from .plugin_core.query_cache import QueryCache
+from .plugin_core.usage_store import UsageStore, on_pick
+
 
 class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
 
@@ -67,15 +50,44 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
         albert.PluginInstance.__init__(self)
         albert.TriggerQueryHandler.__init__(self)
 
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Albert Movie Search Plugin/2.0',
-            'Accept': 'application/json'
-        })
+        # HTTP client, created once the offline mode is configured
+        self.http = None
 
-        # Cache for search results
-        self.search_cache = {}
+        # Cache for search results (limits are overridable in config.json)
         self.cache_timeout = 300  # 5 minutes
+        self.cache_max_entries = 128
+        self.cache_max_bytes = 8 * 1024 * 1024
+        self.search_cache = QueryCache(self.cache_timeout, self.cache_max_entries, self.cache_max_bytes)
+        # Expired results are kept for a day to show while offline
+        self.search_cache.stale_timeout = 86400
+
+        # Seconds to wait for more keystrokes before making network requests
+        self.debounce_delay = 0.15
+
+        # Movies the user picked from the results (decayed counts), listed
+        # first; the searches they were found with are prewarmed on startup
+        self.usage_store_file = os.path.join(str(self.dataLocation()), 'usage.json')
+        self.usage_ranking = True
+        self.usage_store = None
+
+        # Offline mode: "auto" detects it, true never uses the network, false
+        # always tries it; while offline only cached (even expired) results are shown
+        self.offline_mode = "auto"
+        self.connect_timeout = 3  # Seconds before an unanswered request counts as offline
+        self.connectivity = None
+
+        # Per-stage latency histograms, shown by the hidden ":stats" query and
+        # optionally written to metrics.json every minute
+        self.metrics = Metrics()
+        self.metrics_dump = False
+
+        # Profile the next N queries with cProfile and tracemalloc into
+        # data/profiles (also set by MOVIES_PROFILE or the ":profile" query)
+        self.profile_queries = 0
+
+        # Measures queries and answers ":stats" and ":profile", created once
+        # the above are configured
+        self.diagnostics = None
 
         # YTS API configuration (for torrents)
         self.yts_api_base = "https://yts.mx/api/v2"
@@ -121,6 +133,22 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
 
         # Load configuration from file
         self.readConfig()
+        self.connectivity = Connectivity(urllib.parse.urlparse(self.yts_api_base).hostname, mode=self.offline_mode)
+        self.connectivity.start()
+        self.http = HttpClient({
+            'User-Agent': 'Albert Movie Search Plugin/2.0',
+            'Accept': 'application/json'
+        }, self.connect_timeout, self.connectivity, self.metrics)
+        self.diagnostics = Diagnostics(
+            "movie", self.metrics,
+            QueryProfiler(
+                os.path.join(str(self.dataLocation()), 'profiles'),
+                queries_from_env('MOVIES_PROFILE', self.profile_queries)
+            ),
+            os.path.join(str(self.dataLocation()), 'metrics.json'),
+            self._metrics_snapshot, self._stats_summary, self.metrics_dump
+        )
+        self._open_usage_store()
 
     def readConfig(self):
         """Read configuration from config file"""
@@ -133,14 +161,24 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
         self.auto_vpn = False
         self.default_player = "auto"
         self.trackers = self.default_trackers
+        self.cache_timeout = 300
+        self.cache_max_entries = 128
+        self.cache_max_bytes = 8 * 1024 * 1024
+        self.debounce_delay = 0.15
+        self.usage_ranking = True
+        self.offline_mode = "auto"
+        self.connect_timeout = 3
+        self.metrics_dump = False
+        self.profile_queries = 0
         
         try:
             # Try to read from config file
             config_file = os.path.join(str(self.dataLocation()), 'config.json')
             if os.path.exists(config_file):
-                with open(config_file, 'r') as f:
-                    config = json.load(f)
-                    
+                config, from_backup = load_json(config_file)
+                if from_backup:
+                    safe_warning(f"{config_file} is not valid JSON, using its last good copy")
+
                 self.tmdb_api_key = config.get("tmdb_api_key", "")
                 self.download_path = config.get("download_path", os.path.expanduser("~/Downloads/Movies"))
                 self.search_limit = int(config.get("search_limit", 5))
@@ -148,6 +186,15 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
                 self.sort_direction = config.get("sort_direction", "desc")
                 self.auto_vpn = config.get("auto_vpn", False)
                 self.default_player = config.get("default_player", "auto")
+                self.cache_timeout = int(config.get("cache_timeout", 300))
+                self.cache_max_entries = int(config.get("cache_max_entries", 128))
+                self.cache_max_bytes = int(config.get("cache_max_bytes", 8 * 1024 * 1024))
+                self.debounce_delay = float(config.get("debounce_delay", 0.15))
+                self.usage_ranking = bool(config.get("usage_ranking", True))
+                self.offline_mode = config.get("offline_mode", "auto")
+                self.connect_timeout = float(config.get("connect_timeout", 3))
+                self.metrics_dump = bool(config.get("metrics_dump", False))
+                self.profile_queries = int(config.get("profile_queries", 0))
                 
                 custom_trackers = config.get("custom_trackers", [])
                 if custom_trackers:
@@ -162,6 +209,46 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
         except Exception as e:
             safe_warning(f"Failed to read config: {e}")
 
+        self.search_cache.configure(self.cache_timeout, self.cache_max_entries, self.cache_max_bytes)
+
+    def _open_usage_store(self):
+        """Load the record of picked movies and prewarm their searches"""
+        try:
+            self.usage_store = UsageStore(self.usage_store_file)
+        except Exception as e:
+            safe_warning(f"Failed to load usage data, picks will not be remembered: {e}")
+            self.usage_store = None
+            return
+        if not self.usage_ranking:
+            return
+
+        searches = []
+        for _, search_term in self.usage_store.top(10):
+            if search_term and search_term.lower() not in searches:
+                searches.append(search_term.lower())
+        if searches:
+            run_in_background(self._prewarm_searches, searches[:3], name="movies-prewarm")
+
+    def _prewarm_searches(self, searches):
+        """Run the searches picked movies were found with, filling the cache"""
+        if not self.connectivity.check():
+            return
+        for search_term in searches:
+            try:
+                movies = self._search_movies(search_term)
+                if movies:
+                    self.search_cache.put(search_term, self._rank_by_usage(movies))
+            except Exception as e:
+                safe_debug(f"Failed to prewarm search '{search_term}': {e}")
+
+    def _rank_by_usage(self, movies):
+        """Move the movies the user picked before to the top, most picked first"""
+        if not self.usage_ranking or self.usage_store is None:
+            return movies
+        scores = self.usage_store.scores()
+        # sorted() is stable, so the YTS order is kept otherwise
+        return sorted(movies, key=lambda movie: -scores.get(movie.get('id'), 0.0))
+
     def defaultTrigger(self):
         return "movie "
 
@@ -184,12 +271,20 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
                 "sort_direction": "desc",
                 "auto_vpn": False,
                 "default_player": "auto",
+                "cache_timeout": 300,
+                "cache_max_entries": 128,
+                "cache_max_bytes": 8 * 1024 * 1024,
+                "debounce_delay": 0.15,
+                "usage_ranking": True,
+                "offline_mode": "auto",
+                "connect_timeout": 3,
+                "metrics_dump": False,
+                "profile_queries": 0,
                 "custom_trackers": self.default_trackers
             }
             
-            with open(config_file, 'w') as f:
-                json.dump(default_config, f, indent=2)
-                
+            write_json(config_file, default_config)
+
         except Exception as e:
             safe_warning(f"Failed to create default config: {e}")
 
@@ -319,6 +414,13 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
     def handleTriggerQuery(self, query):
         search_term = query.string.strip()
 
+        if self.diagnostics.handle(query, search_term):
+            return
+        with self.diagnostics.measure(search_term):
+            self._handle_query(query, search_term)
+
+    def _handle_query(self, query, search_term):
+        """Answer a query, everything but diagnostics"""
         if not search_term:
             config_file = os.path.join(str(self.dataLocation()), 'config.json')
             
@@ -357,27 +459,41 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
 
         # Check cache first
         cache_key = search_term.lower()
-        cached_result = self._get_cached_result(cache_key)
+        with self.metrics.span('cache_lookup'):
+            cached_result = self.search_cache.get(cache_key)
 
         if cached_result:
-            self._add_results_to_query(query, cached_result, search_term)
+            if query.isValid:
+                with self.metrics.span('items'):
+                    self._add_results_to_query(query, cached_result, search_term)
+            return
+
+        if not self.connectivity.online:
+            self._add_offline_results(query, cache_key, search_term)
             return
 
         try:
+            # Give the user a moment to keep typing before going to the network
+            if not debounce(query, self.debounce_delay):
+                return
+
             # Auto-connect VPN if enabled
             if self.auto_vpn:
                 self._connect_vpn()
 
             # Search for movies
-            movies = self._search_movies(search_term)
+            movies = self._search_movies(search_term, lambda: query.isValid)
+
+            if movies is None or not query.isValid:
+                # Superseded by a newer query
+                return
 
             if movies:
+                movies = self._rank_by_usage(movies)
                 # Cache results
-                self.search_cache[cache_key] = {
-                    'data': movies,
-                    'timestamp': time.time()
-                }
-                self._add_results_to_query(query, movies, search_term)
+                self.search_cache.put(cache_key, movies)
+                with self.metrics.span('items'):
+                    self._add_results_to_query(query, movies, search_term)
             else:
                 query.add(albert.StandardItem(
                     id="movie_no_results",
@@ -394,6 +510,10 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
                 ))
 
         except Exception as e:
+            if not self.connectivity.online:
+                # The request couldn't connect, fall back to older results
+                self._add_offline_results(query, cache_key, search_term)
+                return
             safe_warning(f"Movie search failed: {str(e)}")
             query.add(albert.StandardItem(
                 id="movie_error",
@@ -409,6 +529,21 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
                 ]
             ))
 
+    def _add_offline_results(self, query, cache_key, search_term):
+        """Show the last results of a search (however old) while YTS is unreachable"""
+        movies = self.search_cache.get_stale(cache_key)
+        if movies:
+            with self.metrics.span('items'):
+                self._add_results_to_query(query, movies, search_term)
+        query.add(albert.StandardItem(
+            id="movie_offline",
+            text="Offline",
+            subtext="YTS is unreachable, showing earlier results" if movies
+            else f"YTS is unreachable and there are no earlier results for '{search_term}'",
+            iconUrls=["xdg:network-offline"],
+            actions=[]
+        ))
+
     def _connect_vpn(self):
         """Connect to VPN using mullvad CLI"""
         try:
@@ -418,8 +553,12 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
         except Exception as e:
             safe_warning(f"Failed to connect VPN: {e}")
 
-    def _search_movies(self, query):
-        """Search for movies using YTS API"""
+    def _search_movies(self, query, is_valid=None):
+        """Search for movies using YTS API
+
+        Returns None if `is_valid` reports the query stale while the response
+        is being read; the transfer is then aborted.
+        """
         try:
             url = f"{self.yts_api_base}/list_movies.json"
             params = {
@@ -429,10 +568,20 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
                 'sort_by': self.sort_direction
             }
 
-            response = self.session.get(url, params=params, timeout=15)
+            if is_valid is not None and not is_valid():
+                return None
+
+            response = self.http.get(url, timeout=15, stage='http_yts', params=params, stream=True)
             response.raise_for_status()
 
-            data = response.json()
+            body = bytearray()
+            with response:
+                for chunk in response.iter_content(chunk_size=16384):
+                    if is_valid is not None and not is_valid():
+                        return None
+                    body.extend(chunk)
+
+            data = json.loads(body)
             
             if data.get('status') == 'ok' and data.get('data', {}).get('movies'):
                 movies = data['data']['movies']
@@ -446,17 +595,6 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
             safe_warning(f"YTS API error: {str(e)}")
             raise
 
-    def _get_cached_result(self, key):
-        """Get cached result if still valid"""
-        if key in self.search_cache:
-            cached = self.search_cache[key]
-            if time.time() - cached['timestamp'] < self.cache_timeout:
-                return cached['data']
-            else:
-                # Remove expired cache
-                del self.search_cache[key]
-        return None
-
     def _get_rating_info(self, rating):
         """Get rating icon and description based on rating"""
         if rating >= 8.5:
@@ -526,6 +664,7 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
     def _add_results_to_query(self, query, movies, search_term):
         """Add movie results to Albert query"""
         for movie in movies:
+            movie_id = movie.get('id')
             title = movie.get('title', 'Unknown Title')
             year = movie.get('year', 'Unknown')
             rating = movie.get('rating', 0.0)
@@ -565,8 +704,9 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
                 actions=[]
             )
 
-            # Add actions based on available torrents
+            # Add actions based on available torrents, each of which records the pick
             actions = []
+            picked = functools.partial(on_pick, self.usage_store, movie_id, query=search_term, cache=self.search_cache)
             
             if torrents:
                 # Group torrents by quality
@@ -594,14 +734,14 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
                         actions.append(albert.Action(
                             f"stream_{quality}",
                             f"🎥 Stream {quality} ({size}) [{player_display}]",
-                            lambda uri=magnet_uri: self._stream_movie(uri)
+                            picked(lambda uri=magnet_uri: self._stream_movie(uri))
                         ))
                         
                         # Download action
                         actions.append(albert.Action(
                             f"download_{quality}",
                             f"📥 Download {quality} ({size})",
-                            lambda uri=magnet_uri: self._download_movie(uri)
+                            picked(lambda uri=magnet_uri: self._download_movie(uri))
                         ))
 
             # Add info actions
@@ -610,7 +750,7 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
                 actions.append(albert.Action(
                     "open_imdb",
                     "🌐 Open on IMDb",
-                    lambda url=imdb_url: albert.openUrl(url)
+                    picked(lambda url=imdb_url: albert.openUrl(url))
                 ))
             
             # YTS page
@@ -618,7 +758,7 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
             actions.append(albert.Action(
                 "open_yts",
                 "🌐 Open on YTS",
-                lambda url=yts_url: albert.openUrl(url)
+                picked(lambda url=yts_url: albert.openUrl(url))
             ))
 
             # Copy movie info
@@ -626,7 +766,7 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
             actions.append(albert.Action(
                 "copy_info",
                 "📋 Copy Movie Info",
-                lambda info=movie_info: albert.setClipboardText(info)
+                picked(lambda info=movie_info: albert.setClipboardText(info))
             ))
 
             item.actions = actions
@@ -647,7 +787,24 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
             ]
         ))
 
+    def _metrics_snapshot(self):
+        """Return the stage metrics together with the search cache's counters"""
+        return self.metrics.snapshot(search_cache=self.search_cache.stats(), online=self.connectivity.online)
+
+    def _stats_summary(self, snapshot):
+        """Return the name, text and subtext of the ":stats" item on the search cache"""
+        search_cache = snapshot['search_cache']
+        return (
+            "cache",
+            f"Search cache hit rate: {search_cache['hit_rate']:.0%}",
+            f"{search_cache['entries']} cached searches"
+        )
+
     def finalize(self):
         """Clean up when plugin is disabled"""
-        if hasattr(self, 'session'):
-            self.session.close()
\ No newline at end of file
+        if getattr(self, 'diagnostics', None) is not None:
+            self.diagnostics.close()
+        if getattr(self, 'connectivity', None) is not None:
+            self.connectivity.stop()
+        if getattr(self, 'http', None) is not None:
+            self.http.close()
\ No newline at end of file
@@ -183,9 +183,17 @@ install_plugin() {
     # Create target directory and copy files
     mkdir -p "$TARGET_DIR"
     
-    # Copy main plugin file
+    # Copy plugin code (package modules, the test script is copied below)
     if [ -f "$SCRIPT_DIR/__init__.py" ]; then
-        cp "$SCRIPT_DIR/__init__.py" "$TARGET_DIR/"
+        for file in "$SCRIPT_DIR"/*.py; do
+            case "$(basename "$file")" in
+                test_*) ;;
+                *) cp "$file" "$TARGET_DIR/" ;;
+            esac
+        done
+        # The shared core is a symlink in the repository, copy what it points to
+        mkdir -p "$TARGET_DIR/plugin_core"
+        cp -L "$SCRIPT_DIR"/plugin_core/*.py "$TARGET_DIR/plugin_core/"
         print_success "Copied plugin code"
     else
         print_error "Plugin code not found at $SCRIPT_DIR/__init__.py"
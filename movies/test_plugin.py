@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+Test script for the Movie Search Albert plugin
+
+This script tests the plugin outside of Albert, answering YTS requests with
+fake sessions so that it runs without a network connection.
+"""
+
+import json
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+# Add the plugins directory to Python path so the plugin imports as a package
+plugin_dir = Path(__file__).parent
+sys.path.insert(0, str(plugin_dir.parent))
+
+# Each run gets its own data directory, so no state is left over from the last one
+DATA_DIR = Path(tempfile.mkdtemp(prefix='albert-movies-test-'))
+
+# Mock Albert module for testing
+class MockAlbert:
+    # Where plugins keep their data, see use_data_dir()
+    data_location = DATA_DIR
+
+    class StandardItem:
+        def __init__(self, id, text, subtext, iconUrls=None, actions=None):
+            self.id = id
+            self.text = text
+            self.subtext = subtext
+            self.iconUrls = iconUrls or []
+            self.actions = actions or []
+
+        def __repr__(self):
+            return f"Item(id='{self.id}', text='{self.text}', subtext='{self.subtext}')"
+
+    class Action:
+        def __init__(self, id, text, callback):
+            self.id = id
+            self.text = text
+            self.callback = callback
+
+        def __repr__(self):
+            return f"Action(id='{self.id}', text='{self.text}')"
+
+    class Query:
+        def __init__(self, string):
+            self.string = string
+            self.items = []
+            self.isValid = True
+
+        def add(self, item):
+            self.items.append(item)
+
+    class PluginInstance:
+        def __init__(self):
+            pass
+
+        def dataLocation(self):
+            return MockAlbert.data_location
+
+    class TriggerQueryHandler:
+        pass
+
+    @staticmethod
+    def debug(msg):
+        print(f"[DEBUG] {msg}")
+
+    @staticmethod
+    def info(msg):
+        print(f"[INFO] {msg}")
+
+    @staticmethod
+    def warning(msg):
+        print(f"[WARNING] {msg}")
+
+    @staticmethod
+    def critical(msg):
+        print(f"[CRITICAL] {msg}")
+
+    @staticmethod
+    def openUrl(url):
+        print(f"[ACTION] Open URL: {url}")
+
+    @staticmethod
+    def setClipboardText(text):
+        print(f"[ACTION] Copy to clipboard: {text}")
+
+# Mock the albert module
+sys.modules['albert'] = MockAlbert()
+
+# Now import our plugin
+try:
+    from movies import Plugin
+    from movies.plugin_core.atomic_file import load_json, write_json
+    from movies.plugin_core.connectivity import Connectivity
+    from movies.plugin_core.debounce import debounce
+    from movies.plugin_core.profiler import QueryProfiler
+    from movies.plugin_core.usage_store import UsageStore
+    print("✓ Plugin imported successfully")
+except ImportError as e:
+    print(f"✗ Failed to import plugin: {e}")
+    sys.exit(1)
+
+def use_data_dir(data_dir, **config):
+    """Make plugins created from now on keep their data in data_dir"""
+    data_dir.mkdir(parents=True, exist_ok=True)
+    # Requests are answered by fake sessions, so don't let the plugin go
+    # offline when the test machine has no network
+    write_json(str(data_dir / 'config.json'), {'offline_mode': False, **config})
+    MockAlbert.data_location = data_dir
+
+use_data_dir(DATA_DIR)
+
+def make_movie(movie_id, title, rating=7.5):
+    """Return a movie as listed by the YTS API"""
+    return {
+        'id': movie_id,
+        'title': title,
+        'year': 2010,
+        'rating': rating,
+        'runtime': 148,
+        'genres': ['Action', 'Sci-Fi'],
+        'summary': f"{title} summary",
+        'imdb_code': f"tt{movie_id:07d}",
+        'slug': title.lower().replace(' ', '-'),
+        'torrents': [{'quality': '1080p', 'hash': f"{movie_id:040X}", 'size': '2.1 GB'}],
+    }
+
+MOVIES = [make_movie(1, "Inception"), make_movie(2, "Inception Revisited", 6.1), make_movie(3, "Inceptionism", 5.0)]
+
+class FakeStreamResponse:
+    """Streamed YTS response whose body arrives in small chunks"""
+
+    def __init__(self, body, chunk_size=16, delay=0.0):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.status_code = 200
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=None):
+        for start in range(0, len(self.body), self.chunk_size):
+            time.sleep(self.delay)
+            yield self.body[start:start + self.chunk_size]
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class FakeSession:
+    """Stands in for requests.Session, answering YTS searches with `movies`"""
+
+    def __init__(self, movies, chunk_size=16, delay=0.0):
+        self.movies = movies
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.requests = []
+        self.responses = []
+
+    def get(self, url, timeout=None, params=None, **kwargs):
+        self.requests.append(params)
+        term = params['query_term'].lower()
+        movies = [movie for movie in self.movies if term in movie['title'].lower()]
+        body = json.dumps({'status': 'ok', 'data': {'movie_count': len(movies), 'movies': movies}})
+        response = FakeStreamResponse(body.encode('utf-8'), self.chunk_size, self.delay)
+        self.responses.append(response)
+        return response
+
+    def close(self):
+        pass
+
+class FailingSession:
+    """Stands in for requests.Session when the network is down"""
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, timeout=None, **kwargs):
+        self.requests.append(url)
+        raise requests.ConnectionError("Network is unreachable")
+
+    def close(self):
+        pass
+
+def make_plugin(movies=MOVIES, **session_options):
+    """Create a plugin whose YTS requests are answered by a FakeSession"""
+    plugin = Plugin()
+    plugin.http.session = FakeSession(movies, **session_options)
+    plugin.debounce_delay = 0
+    return plugin
+
+def movie_ids(query):
+    return [item.id for item in query.items if item.id.startswith('movie_') and item.id[6:].isdigit()]
+
+def test_plugin_basic():
+    """Test basic plugin functionality"""
+    print("\n=== Testing Basic Plugin Functionality ===")
+
+    plugin = Plugin()
+    assert plugin.defaultTrigger() == "movie "
+    assert plugin.synopsis("") == "Movie Search: movie <movie title>"
+    assert not plugin.supportsFuzzyMatching()
+
+    query = MockAlbert.Query("")
+    plugin.handleTriggerQuery(query)
+    assert [item.id for item in query.items] == ["movie_help"]
+
+    query = MockAlbert.Query("a")
+    plugin.handleTriggerQuery(query)
+    assert [item.id for item in query.items] == ["movie_short"]
+    plugin.finalize()
+    print("✓ Help and short query items shown")
+
+def test_movie_search():
+    """Test a search answered by a fake YTS session, then from the cache"""
+    print("\n=== Testing Movie Search ===")
+
+    plugin = make_plugin()
+    query = MockAlbert.Query("Inception")
+    plugin.handleTriggerQuery(query)
+    assert movie_ids(query) == ["movie_1", "movie_2", "movie_3"]
+    assert query.items[-1].id == "legal_warning"
+    assert plugin.http.session.requests == [
+        {'query_term': "Inception", 'limit': 5, 'order_by': "rating", 'sort_by': "desc"}
+    ]
+    assert plugin.http.session.responses[0].closed
+    actions = [action.id for action in query.items[0].actions]
+    assert actions == ["stream_1080p", "download_1080p", "open_imdb", "open_yts", "copy_info"]
+
+    # Served from the cache the second time, whatever the case
+    query = MockAlbert.Query("inception")
+    plugin.handleTriggerQuery(query)
+    assert movie_ids(query) == ["movie_1", "movie_2", "movie_3"]
+    assert len(plugin.http.session.requests) == 1
+
+    query = MockAlbert.Query("nothing like it")
+    plugin.handleTriggerQuery(query)
+    assert [item.id for item in query.items] == ["movie_no_results"]
+    plugin.finalize()
+    print("✓ Results listed and cached")
+
+def test_stream_cancellation():
+    """Test that a superseded search stops reading the YTS response"""
+    print("\n=== Testing Stream Cancellation ===")
+
+    plugin = make_plugin(chunk_size=8, delay=0.02)
+    query = MockAlbert.Query("inception")
+    threading.Timer(0.1, lambda: setattr(query, 'isValid', False)).start()
+
+    start_time = time.time()
+    assert plugin._search_movies("inception", lambda: query.isValid) is None
+    elapsed = time.time() - start_time
+    assert elapsed < 0.5, f"cancellation took {elapsed:.2f}s"
+    assert plugin.http.session.responses[0].closed
+
+    # Through the query handler, nothing is shown or cached
+    query = MockAlbert.Query("inception")
+    threading.Timer(0.1, lambda: setattr(query, 'isValid', False)).start()
+    plugin.handleTriggerQuery(query)
+    assert query.items == []
+    assert plugin.http.session.responses[1].closed
+    assert "inception" not in plugin.search_cache
+
+    # A query that was already stale never makes the request
+    query.isValid = False
+    assert plugin._search_movies("inception", lambda: query.isValid) is None
+    assert len(plugin.http.session.requests) == 2
+    plugin.finalize()
+    print(f"✓ Stale stream abandoned after {elapsed:.2f}s")
+
+def test_debounce():
+    """Test that searches wait for the user to stop typing before going to YTS"""
+    print("\n=== Testing Debounce ===")
+
+    plugin = make_plugin()
+    plugin.debounce_delay = 0.3
+
+    query = MockAlbert.Query("incep")
+    start_time = time.time()
+    assert debounce(query, plugin.debounce_delay)
+    assert time.time() - start_time >= 0.3
+
+    # Typing on abandons the query early, without a request
+    query = MockAlbert.Query("incep")
+    threading.Timer(0.05, lambda: setattr(query, 'isValid', False)).start()
+    start_time = time.time()
+    plugin.handleTriggerQuery(query)
+    elapsed = time.time() - start_time
+    assert elapsed < 0.2, f"debounce took {elapsed:.2f}s"
+    assert query.items == [] and plugin.http.session.requests == []
+
+    # Cached searches don't wait at all
+    plugin.search_cache.put("inception", MOVIES[:1])
+    query = MockAlbert.Query("inception")
+    start_time = time.time()
+    plugin.handleTriggerQuery(query)
+    assert time.time() - start_time < 0.1
+    assert movie_ids(query) == ["movie_1"]
+    plugin.finalize()
+    print(f"✓ Stale query dropped during the debounce after {elapsed:.2f}s")
+
+def test_offline_results():
+    """Test that earlier (even expired) results are shown while YTS is unreachable"""
+    print("\n=== Testing Offline Results ===")
+
+    # The probe connects to a port nothing listens on
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+
+    plugin = make_plugin()
+    plugin.search_cache.put("inception", MOVIES[:2])
+    value, stored, size = plugin.search_cache._entries["inception"]
+    plugin.search_cache._entries["inception"] = (value, stored - plugin.cache_timeout - 60, size)
+    assert plugin.search_cache.get("inception") is None
+    plugin.http.session = FailingSession()
+
+    # A request that can't connect marks YTS offline and falls back to the expired results
+    plugin.connectivity = plugin.http.connectivity = Connectivity('127.0.0.1', port)
+    start_time = time.time()
+    query = MockAlbert.Query("inception")
+    plugin.handleTriggerQuery(query)
+    assert not plugin.connectivity.online
+    assert movie_ids(query) == ["movie_1", "movie_2"]
+    assert query.items[-1].id == "movie_offline"
+    assert "earlier results" in query.items[-1].subtext
+
+    # Later searches don't try the network at all
+    query = MockAlbert.Query("the matrix")
+    plugin.handleTriggerQuery(query)
+    assert [item.id for item in query.items] == ["movie_offline"]
+    assert "no earlier results" in query.items[0].subtext
+    assert len(plugin.http.session.requests) == 1
+    assert time.time() - start_time < 1
+
+    # Results older than the stale timeout are gone for good
+    plugin.search_cache._entries["inception"] = (value, stored - plugin.search_cache.stale_timeout - 600, size)
+    query = MockAlbert.Query("inception")
+    plugin.handleTriggerQuery(query)
+    assert [item.id for item in query.items] == ["movie_offline"]
+
+    # Configured offline, the network is never used
+    plugin.connectivity = plugin.http.connectivity = Connectivity('127.0.0.1', port, mode=True)
+    plugin.http.session = FakeSession(MOVIES)
+    query = MockAlbert.Query("inception revisited")
+    plugin.handleTriggerQuery(query)
+    assert [item.id for item in query.items] == ["movie_offline"]
+    assert plugin.http.session.requests == []
+    plugin.finalize()
+    print("✓ Offline searches served from earlier results without requests")
+
+def test_usage_ranking():
+    """Test that picked movies are remembered and listed first"""
+    print("\n=== Testing Usage Ranking ===")
+
+    usage_file = DATA_DIR / 'test_usage.json'
+    usage_file.unlink(missing_ok=True)
+    plugin = make_plugin()
+    plugin.usage_store = UsageStore(str(usage_file))
+    assert plugin._rank_by_usage(MOVIES) == MOVIES
+
+    # Most picked first, the YTS order is kept otherwise
+    plugin.usage_store.record(3)
+    assert [movie['id'] for movie in plugin._rank_by_usage(MOVIES)] == [3, 1, 2]
+    plugin.usage_store.record(2)
+    plugin.usage_store.record(2)
+    assert [movie['id'] for movie in plugin._rank_by_usage(MOVIES)] == [2, 3, 1]
+    plugin.usage_ranking = False
+    assert plugin._rank_by_usage(MOVIES) == MOVIES
+    plugin.usage_ranking = True
+
+    # Running any of the item's actions records the pick and drops the cached order
+    query = MockAlbert.Query("inception")
+    plugin.handleTriggerQuery(query)
+    assert movie_ids(query) == ["movie_2", "movie_3", "movie_1"]
+    item = next(item for item in query.items if item.id == "movie_1")
+    for _ in range(3):
+        next(action for action in item.actions if action.id == "copy_info").callback()
+    assert plugin.usage_store.score(1) > plugin.usage_store.score(2)
+    assert "inception" not in plugin.search_cache
+    assert UsageStore(str(usage_file)).top(1) == [(1, "inception")]
+    query = MockAlbert.Query("inception")
+    plugin.handleTriggerQuery(query)
+    assert movie_ids(query)[0] == "movie_1"
+    plugin.finalize()
+
+    # The searches picked movies were found with are prewarmed, unless usage ranking is off
+    class PrewarmRecorder(Plugin):
+        prewarmed = []
+
+        def _prewarm_searches(self, searches):
+            PrewarmRecorder.prewarmed.append(searches)
+
+    data_dir = DATA_DIR / 'usage'
+    use_data_dir(data_dir, usage_ranking=False)
+    UsageStore(str(data_dir / 'usage.json')).record(1, "Inception")
+    try:
+        PrewarmRecorder().finalize()
+        time.sleep(0.1)
+        assert PrewarmRecorder.prewarmed == []
+        use_data_dir(data_dir)
+        PrewarmRecorder().finalize()
+        deadline = time.time() + 2
+        while not PrewarmRecorder.prewarmed and time.time() < deadline:
+            time.sleep(0.02)
+        assert PrewarmRecorder.prewarmed == [["inception"]]
+    finally:
+        use_data_dir(DATA_DIR)
+    print("✓ Picked movies ranked first")
+
+def test_metrics():
+    """Test per-stage latency metrics and the hidden :stats query"""
+    print("\n=== Testing Metrics ===")
+
+    metrics_file = DATA_DIR / 'test_metrics.json'
+    metrics_file.unlink(missing_ok=True)
+    plugin = make_plugin()
+    plugin.diagnostics.metrics_file = str(metrics_file)
+    plugin.diagnostics.dump = True
+    plugin.diagnostics._dumped = float('-inf')
+    plugin.handleTriggerQuery(MockAlbert.Query("inception"))
+    plugin.handleTriggerQuery(MockAlbert.Query("inception"))
+    # Written when due
+    dumped, _ = load_json(str(metrics_file))
+    assert dumped['stages_ms']['query']['count'] == 1
+    assert dumped['counters']['http_yts_200'] == 1
+
+    query = MockAlbert.Query(":stats")
+    plugin.handleTriggerQuery(query)
+    ids = [item.id for item in query.items]
+    assert ids[0] == "movie_stats_cache"
+    assert "50%" in query.items[0].text
+    assert "1 cached searches" in query.items[0].subtext
+    for stage in ('query', 'cache_lookup', 'http_yts', 'items'):
+        assert f"movie_stats_{stage}" in ids, stage
+    assert [action.id for action in query.items[0].actions] == ["copy_stats", "dump_stats"]
+    # The diagnostics query itself isn't measured
+    assert plugin.metrics.snapshot()['stages_ms']['query']['count'] == 2
+    plugin.finalize()
+    assert load_json(str(metrics_file))[0]['stages_ms']['query']['count'] == 2
+    print("✓ Stage latencies measured and shown by :stats")
+
+def test_profiler():
+    """Test profiling the next N queries from the hidden :profile query"""
+    print("\n=== Testing Query Profiler ===")
+
+    profiles = DATA_DIR / 'test_profiles'
+    shutil.rmtree(profiles, ignore_errors=True)
+    plugin = make_plugin()
+    plugin.diagnostics.profiler = QueryProfiler(str(profiles))
+
+    query = MockAlbert.Query(":profile")
+    plugin.handleTriggerQuery(query)
+    assert [item.id for item in query.items] == ["movie_profile"]
+    assert query.items[0].text == "Profile the next 5 queries"
+    assert "0 queries profiled" in query.items[0].subtext
+
+    query = MockAlbert.Query(":profile 1")
+    plugin.handleTriggerQuery(query)
+    assert [action.id for action in query.items[0].actions] == ["profile_arm", "profile_stop", "profile_copy_dir"]
+    query.items[0].actions[0].callback()
+    assert plugin.diagnostics.profiler.armed
+
+    query = MockAlbert.Query(":profile")
+    plugin.handleTriggerQuery(query)
+    assert "Profiling the next 1 queries" in query.items[0].subtext
+
+    plugin.handleTriggerQuery(MockAlbert.Query("inception"))
+    plugin.handleTriggerQuery(MockAlbert.Query("inception revisited"))
+    assert len(plugin.diagnostics.profiler.written) == 1 and not plugin.diagnostics.profiler.armed
+    assert "_handle_query" in Path(plugin.diagnostics.profiler.written[0] + '.txt').read_text()
+
+    # Stopping disarms it before the next query
+    query = MockAlbert.Query(":profile 3")
+    plugin.handleTriggerQuery(query)
+    query.items[0].actions[0].callback()
+    query.items[0].actions[1].callback()
+    assert not plugin.diagnostics.profiler.armed
+    plugin.finalize()
+    print("✓ The next N queries are profiled into the data directory")
+
+def run_all_tests():
+    """Run all tests"""
+    print("Movie Search Plugin Test Suite")
+    print("=" * 50)
+
+    try:
+        test_plugin_basic()
+        test_movie_search()
+        test_stream_cancellation()
+        test_debounce()
+        test_offline_results()
+        test_usage_ranking()
+        test_metrics()
+        test_profiler()
+
+        print("\n" + "=" * 50)
+        print("✓ All tests completed successfully!")
+
+    except Exception as e:
+        print(f"\n✗ Test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+    return True
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -577,21 +577,27 @@ def main():
     print("   Only use for content you have legal rights to access.")
     print("=" * 50)
 
-    if len(sys.argv) > 1:
+    args = sys.argv[1:]
+    if args[:1] == ["--mock-api"] and len(args) > 1:
+        # A local stand-in server (mock_api/server.py) instead of YTS
+        tester.yts_api_base = f"{args[1].rstrip('/')}/api/v2"
+        args = args[2:]
+
+    if args:
         # Handle command line arguments
-        if sys.argv[1] == "--test-config":
+        if args[0] == "--test-config":
             tester.check_configuration()
-        elif sys.argv[1] == "--test-deps":
+        elif args[0] == "--test-deps":
             tester.check_dependencies()
-        elif sys.argv[1] == "--test-api":
+        elif args[0] == "--test-api":
             tester.test_yts_api()
-        elif sys.argv[1] == "--test-all":
+        elif args[0] == "--test-all":
             tester.run_predefined_tests()
-        elif sys.argv[1] == "--test-workflow":
+        elif args[0] == "--test-workflow":
             tester.test_full_workflow()
         else:
             # Test specific movie from command line
-            query = " ".join(sys.argv[1:])
+            query = " ".join(args)
             tester.test_search(query)
     else:
         # Ask user what to do
@@ -0,0 +1,20 @@
+"""
+Code shared by the Albert plugins in this repository
+
+Each plugin gets its own copy of this package (a symlink in the repository,
+copied by the plugin's install.sh), imported as `.plugin_core`. Nothing is
+imported here, so a plugin only pays for the modules it uses; the modules
+that don't need Albert can also be used by the plugins' command line tools.
+
+- log: Albert logging with a print fallback
+- http: HTTP client with lazily imported requests, offline detection and metrics
+- background: daemon threads for work that mustn't block a query
+- query_cache: bounded in-memory cache for query results
+- atomic_file: crash-safe data files
+- usage_store: decaying record of picked results
+- connectivity: offline detection
+- metrics: per-stage latency histograms
+- profiler: opt-in cProfile/tracemalloc profiling of queries
+- diagnostics: the hidden ":stats" and ":profile" queries (needs Albert)
+- debounce: waiting for the user to stop typing
+"""
@@ -0,0 +1,101 @@
+"""
+Crash-safe writes for the plugin's data files
+
+Files are written to a temporary file next to the target, flushed to disk and
+renamed over the target, so an interrupted write (Albert quitting, a full
+disk) leaves either the old or the new file, never a truncated one. Every
+write gets its own temporary file, so concurrent writers can't clobber each
+other's; the last rename wins.
+"""
+
+import json
+import os
+import stat
+import tempfile
+
+
+def backup_path(path):
+    """Return where the last good copy of a data file is kept"""
+    return f"{path}.bak"
+
+
+def atomic_write(path, data, keep_backup=False):
+    """Atomically replace path with data (bytes or an iterable of byte chunks)
+
+    With `keep_backup` the replaced file is kept as its last good copy.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        try:
+            # mkstemp creates the file private to the user, keep the target's mode
+            os.chmod(temp_path, stat.S_IMODE(os.stat(path).st_mode))
+        except OSError:
+            pass
+        with os.fdopen(fd, 'wb') as f:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                data = [data]
+            for chunk in data:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        if keep_backup and os.path.exists(path):
+            os.replace(path, backup_path(path))
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_directory(directory)
+
+
+def write_json(path, value):
+    """Atomically write a JSON file (pretty-printed, it may be edited by hand)"""
+    atomic_write(path, json.dumps(value, indent=2).encode('utf-8'))
+
+
+def load_json(path):
+    """Load a JSON file, falling back to its last good copy if it is corrupt
+
+    Every successful load refreshes the last good copy. Returns a
+    (value, from_backup) tuple. Raises ValueError if the file is corrupt and
+    there is no readable last good copy either.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        value = json.loads(data)
+    except ValueError:
+        try:
+            with open(backup_path(path), 'rb') as f:
+                return json.loads(f.read()), True
+        except OSError:
+            raise ValueError(f"{os.path.basename(path)} is corrupt and has no backup") from None
+
+    try:
+        with open(backup_path(path), 'rb') as f:
+            unchanged = f.read() == data
+    except OSError:
+        unchanged = False
+    if not unchanged:
+        try:
+            atomic_write(backup_path(path), data)
+        except OSError:
+            pass  # Only the fallback is lost
+    return value, False
+
+
+def _fsync_directory(directory):
+    """Make a rename durable (not supported on every platform)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
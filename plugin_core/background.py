@@ -0,0 +1,16 @@
+"""
+Background work that mustn't block a query
+
+Albert calls a plugin from its query threads, so loading data files,
+downloads and prewarming run on daemon threads, which never keep Albert
+from quitting.
+"""
+
+import threading
+
+
+def run_in_background(target, *args, name=None):
+    """Run `target(*args)` on a new daemon thread, returning the started thread"""
+    thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+    thread.start()
+    return thread
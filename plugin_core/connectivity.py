@@ -0,0 +1,107 @@
+"""
+Offline detection for the plugin's web APIs
+
+Requests made while the network is down only fail after their timeout, which
+would freeze the launcher on every keystroke. Instead the plugin asks
+`Connectivity.online` before going to the network: a failed request marks
+the API host offline straight away, and while it is offline a TCP connection
+to it is attempted in the background (with a short timeout) until it answers
+again. Until then the plugin serves what it has cached, however old.
+"""
+
+import socket
+import threading
+import time
+
+
+class Connectivity:
+    """Whether the API host is currently reachable
+
+    `mode` is "auto" (detect it), True (always offline, never use the
+    network) or False (always try the network).
+    """
+
+    def __init__(self, host, port=443, mode='auto', probe_timeout=1.0, probe_interval=30):
+        self.host = host
+        self.port = port
+        self.mode = mode
+        self.probe_timeout = probe_timeout
+        self.probe_interval = probe_interval
+        self._online = True
+        self._last_probe = 0.0
+        self._probing = False
+        self._stopped = False
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    @property
+    def online(self):
+        """Return the last known state without blocking, probing in the background if due"""
+        if self.mode is True:
+            return False
+        if self.mode is False:
+            return True
+        if not self._online:
+            self._probe_in_background()
+        return self._online
+
+    def check(self):
+        """Probe now (blocking for at most the probe timeout) and return the state"""
+        if self.mode is not True and self.mode is not False:
+            self.probe()
+        return self.online
+
+    def start(self):
+        """Find out the state in the background, e.g. while the plugin loads"""
+        if self.mode is not True and self.mode is not False:
+            self._probe_in_background(force=True)
+
+    def stop(self):
+        """Stop probing in the background and notifying listeners"""
+        self._stopped = True
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call `callback(online)` whenever the detected state changes"""
+        self._listeners.append(callback)
+
+    def report_failure(self):
+        """Note a request that failed to connect or timed out"""
+        self._set_online(False)
+
+    def report_success(self):
+        self._set_online(True, probed=False)
+
+    def probe(self):
+        """Try to open a connection to the host, updating and returning the state"""
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.probe_timeout):
+                online = True
+        except OSError:
+            online = False
+        self._set_online(online)
+        return online
+
+    def _set_online(self, online, probed=True):
+        with self._lock:
+            changed = online != self._online
+            self._online = online
+            if probed:
+                self._last_probe = time.monotonic()
+        # A forced mode never changes what `online` says
+        if changed and self.mode is not True and self.mode is not False:
+            for callback in list(self._listeners):
+                callback(online)
+
+    def _probe_in_background(self, force=False):
+        with self._lock:
+            if self._stopped or self._probing or (not force and time.monotonic() - self._last_probe < self.probe_interval):
+                return
+            self._probing = True
+        threading.Thread(target=self._run_probe, name="connectivity-probe", daemon=True).start()
+
+    def _run_probe(self):
+        try:
+            self.probe()
+        finally:
+            self._probing = False
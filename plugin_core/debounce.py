@@ -0,0 +1,24 @@
+"""
+Waiting for the user to stop typing before doing expensive work
+
+Albert starts a query for every keystroke and marks the previous one
+invalid, so a query that is still valid after a short delay is one the user
+paused on. Waiting that long before making network requests saves the
+requests for every intermediate prefix of what is being typed.
+"""
+
+import time
+
+# Seconds between checks whether the query is still valid
+POLL_INTERVAL = 0.02
+
+
+def debounce(query, delay):
+    """Wait `delay` seconds, returning False as soon as the query became stale"""
+    deadline = time.monotonic() + delay
+    while query.isValid:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return True
+        time.sleep(min(remaining, POLL_INTERVAL))
+    return False
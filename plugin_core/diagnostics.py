@@ -0,0 +1,134 @@
+"""
+Hidden diagnostics queries and the metrics dump
+
+Every query is timed (and profiled, when the profiler is armed) as the
+"query" stage of the plugin's `Metrics`. Two hidden queries look at them:
+
+    :stats          a summary item (cache hit rates and the like, which
+                    differ per plugin) and the percentiles of every stage
+    :profile [N]    offers to profile the next N queries (5 by default)
+
+With `dump` on, the metrics are also written to a JSON file at most once a
+minute and when the plugin is unloaded.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import albert
+
+from .atomic_file import write_json
+from .log import safe_warning
+
+# Seconds between metrics dumps
+DUMP_INTERVAL = 60
+
+# Queries ":profile" offers to profile without a count
+PROFILE_QUERIES = 5
+
+
+class Diagnostics:
+    """Measures a plugin's queries and answers its diagnostics queries
+
+    Item ids start with `prefix`. `snapshot` returns the metrics snapshot
+    (`Metrics.snapshot` with the plugin's cache counters added) and `summary`
+    maps one to the name, text and subtext of the first ":stats" item.
+    """
+
+    def __init__(self, prefix, metrics, profiler, metrics_file, snapshot, summary, dump=False):
+        self.prefix = prefix
+        self.metrics = metrics
+        self.profiler = profiler
+        self.metrics_file = metrics_file
+        self.snapshot = snapshot
+        self.summary = summary
+        self.dump = dump
+        self._dumped = time.monotonic()
+
+    def handle(self, query, search_term):
+        """Answer `query` if it is a diagnostics query, returning whether it was"""
+        if search_term == ':stats':
+            self._add_stats_items(query)
+            return True
+        if search_term.startswith(':profile'):
+            self._add_profile_item(query, search_term[len(':profile'):].strip())
+            return True
+        return False
+
+    @contextmanager
+    def measure(self, search_term):
+        """Time (and profile, if armed) answering a query, then dump the metrics if due"""
+        with self.profiler.profile(search_term), self.metrics.span('query'):
+            yield
+        self.dump_if_due()
+
+    def dump_if_due(self):
+        """Write the metrics at most once every DUMP_INTERVAL seconds, if enabled"""
+        if not self.dump or time.monotonic() - self._dumped < DUMP_INTERVAL:
+            return
+        self._dumped = time.monotonic()
+        self.dump_metrics()
+
+    def dump_metrics(self):
+        try:
+            write_json(self.metrics_file, self.snapshot())
+        except Exception as e:
+            safe_warning(f"Failed to write {self.metrics_file}: {e}")
+
+    def close(self):
+        """Write the metrics one last time (if enabled) and stop profiling"""
+        if self.dump:
+            self.dump_metrics()
+        self.profiler.arm(0)
+
+    def _add_stats_items(self, query):
+        """Answer ":stats" with the summary item and one item per measured stage"""
+        snapshot = self.snapshot()
+        actions = [
+            albert.Action(
+                "copy_stats", "Copy metrics as JSON",
+                lambda: albert.setClipboardText(json.dumps(self.snapshot(), indent=2))
+            ),
+            albert.Action("dump_stats", f"Write {os.path.basename(self.metrics_file)}", self.dump_metrics)
+        ]
+
+        name, text, subtext = self.summary(snapshot)
+        query.add(albert.StandardItem(
+            id=f"{self.prefix}_stats_{name}",
+            text=text,
+            subtext=f"{subtext} · {'online' if snapshot['online'] else 'offline'} · up {snapshot['uptime_s'] / 60:.0f} min",
+            iconUrls=["xdg:utilities-system-monitor"],
+            actions=actions
+        ))
+        for stage, stats in sorted(snapshot['stages_ms'].items()):
+            if 'p50' not in stats:
+                continue
+            query.add(albert.StandardItem(
+                id=f"{self.prefix}_stats_{stage}",
+                text=f"{stage}: p50 {stats['p50']:.1f} ms · p95 {stats['p95']:.1f} ms",
+                subtext=f"{stats['count']} samples · p99 {stats['p99']:.1f} ms · max {stats['max']:.1f} ms",
+                iconUrls=["xdg:utilities-system-monitor"],
+                actions=actions
+            ))
+
+    def _add_profile_item(self, query, count):
+        """Answer ":profile [N]", offering to profile the next N queries"""
+        queries = int(count) if count.isdigit() else PROFILE_QUERIES
+        profiles = self.profiler.directory
+        if self.profiler.armed:
+            status = f"Profiling the next {self.profiler.remaining} queries"
+        else:
+            status = f"{len(self.profiler.written)} queries profiled"
+        query.add(albert.StandardItem(
+            id=f"{self.prefix}_profile",
+            text=f"Profile the next {queries} queries",
+            subtext=f"{status} · cProfile and tracemalloc output goes to {profiles}",
+            iconUrls=["xdg:utilities-system-monitor"],
+            actions=[
+                albert.Action("profile_arm", f"Profile the next {queries} queries", lambda: self.profiler.arm(queries)),
+                albert.Action("profile_stop", "Stop profiling", lambda: self.profiler.arm(0)),
+                albert.Action("profile_copy_dir", "Copy the profiles directory", lambda: albert.setClipboardText(profiles))
+            ]
+        ))
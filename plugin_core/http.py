@@ -0,0 +1,79 @@
+"""
+HTTP client shared by the plugins
+
+`requests` takes about as long to import as the rest of a plugin, and
+results that are cached or come from a local index never need it, so it is
+imported (and the session created) on the first request. Requests give up
+connecting after `connect_timeout` seconds; a failure to connect marks the
+host offline in the plugin's `Connectivity`, so later requests don't wait
+for a timeout again until the network is back. Each request can be timed as
+a metrics stage and counted by status code.
+"""
+
+import threading
+import time
+
+
+class Offline(ConnectionError):
+    """The host couldn't be reached (or offline mode is on); nothing was sent"""
+
+
+class HttpClient:
+    """A lazily created requests session with offline detection
+
+    `connectivity` and `metrics` are optional.
+    """
+
+    def __init__(self, headers=None, connect_timeout=3, connectivity=None, metrics=None):
+        self.headers = dict(headers or {})
+        self.connect_timeout = connect_timeout
+        self.connectivity = connectivity
+        self.metrics = metrics
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """The requests session, created (and requests imported) on first use"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+
+                    session = requests.Session()
+                    session.headers.update(self.headers)
+                    self._session = session
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    def get(self, url, timeout, stage=None, **kwargs):
+        """GET a URL, waiting up to `timeout` seconds for the response once connected
+
+        Raises Offline if the host can't be reached. With a `stage`, the
+        request is timed as that metrics stage (up to the response headers
+        for `stream=True`) and counted as `<stage>_<status code>`.
+        """
+        if self.connectivity is not None and self.connectivity.mode is True:
+            raise Offline("offline_mode is on")
+        import requests
+
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=(self.connect_timeout, timeout), **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if self.connectivity is not None:
+                self.connectivity.report_failure()
+            raise Offline(str(e)) from e
+        if self.connectivity is not None:
+            self.connectivity.report_success()
+        if stage is not None and self.metrics is not None:
+            self.metrics.record(stage, (time.perf_counter() - start) * 1000)
+            self.metrics.count(f"{stage}_{response.status_code}")
+        return response
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
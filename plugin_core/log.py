@@ -0,0 +1,69 @@
+"""
+Albert's logging functions, with a print fallback
+
+Albert attaches `debug`, `info`, `warning` and `critical` to its module at
+runtime, and they are missing when the plugin is imported outside Albert
+(tests, benchmarks) or by some Albert versions. Messages are then printed,
+and which functions are missing is reported once per process.
+"""
+
+import threading
+
+try:
+    import albert
+except ImportError:
+    # Command line tools run without Albert
+    albert = None
+
+_LEVELS = ('debug', 'info', 'warning', 'critical')
+
+_api_checked = False
+_api_lock = threading.Lock()
+
+
+def check_albert_api():
+    """Return the (available, missing) Albert logging functions"""
+    available = [name for name in _LEVELS if hasattr(albert, name)]
+    missing = [name for name in _LEVELS if name not in available]
+    return available, missing
+
+
+def _report_missing_api():
+    global _api_checked
+    with _api_lock:
+        if _api_checked:
+            return
+        _api_checked = True
+    available, missing = check_albert_api()
+    if albert is not None and missing:
+        print(f"Albert API - Missing functions: {', '.join(missing)}")
+        print(f"Albert API - Available functions: {', '.join(available)}")
+        print("This may indicate an Albert version compatibility issue.")
+
+
+def _log(level, message):
+    try:
+        getattr(albert, level)(message)
+    except AttributeError:
+        _report_missing_api()
+        print(f"{level.upper()}: {message}")
+
+
+def safe_debug(message):
+    """Safely log debug message with fallback"""
+    _log('debug', message)
+
+
+def safe_info(message):
+    """Safely log info message with fallback"""
+    _log('info', message)
+
+
+def safe_warning(message):
+    """Safely log warning message with fallback"""
+    _log('warning', message)
+
+
+def safe_critical(message):
+    """Safely log critical message with fallback"""
+    _log('critical', message)
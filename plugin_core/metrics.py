@@ -0,0 +1,89 @@
+"""
+Lightweight latency metrics for the plugin's query path
+
+Stages of a query (cache lookup, index search, each HTTP call, building
+items) are timed with `Metrics.span` and kept in rolling windows of recent
+samples, from which percentiles are computed only when they are looked at
+(the hidden ":stats" query or the optional JSON dump).
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .atomic_file import write_json
+
+
+class Histogram:
+    """The last `window` samples of a stage, in milliseconds"""
+
+    def __init__(self, window=1024):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+
+    def summary(self):
+        """Return the total count and percentiles over the window"""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {'count': self.count}
+
+        def pick(fraction):
+            return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+        return {
+            'count': self.count,
+            'p50': pick(0.50),
+            'p95': pick(0.95),
+            'p99': pick(0.99),
+            'max': round(ordered[-1], 3)
+        }
+
+
+class Metrics:
+    """Per-stage latency histograms and event counters, safe to use from any thread"""
+
+    def __init__(self, window=1024):
+        self.window = window
+        self.started = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage):
+        """Time the body of a with block as one sample of `stage`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000)
+
+    def record(self, stage, milliseconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.window)
+            histogram.add(milliseconds)
+
+    def count(self, event, amount=1):
+        with self._lock:
+            self._counters[event] = self._counters.get(event, 0) + amount
+
+    def snapshot(self, **extra):
+        """Return all stages and counters (plus `extra` sections) as a JSON-ready dict"""
+        with self._lock:
+            stages = {stage: histogram.summary() for stage, histogram in self._histograms.items()}
+            counters = dict(self._counters)
+        return dict({
+            'uptime_s': round(time.time() - self.started, 1),
+            'stages_ms': stages,
+            'counters': counters
+        }, **extra)
+
+    def dump(self, path, **extra):
+        write_json(path, self.snapshot(**extra))
@@ -0,0 +1,118 @@
+"""
+Opt-in profiling of query handling
+
+Albert runs the plugin in its own process, where a profiler can't simply be
+attached. When armed for N queries, `QueryProfiler.profile` runs each of the
+next N queries under cProfile and tracemalloc and writes, into the plugin's
+data directory:
+
+    profiles/query-<time>-<n>.prof       cProfile stats (pstats, snakeviz, ...)
+    profiles/query-<time>-<n>.snapshot   tracemalloc snapshot (tracemalloc.Snapshot.load)
+    profiles/query-<time>-<n>.txt        the top functions and allocation sites
+
+Only the thread handling the query is profiled, not work it hands to
+background threads. One query is profiled at a time; queries arriving while
+another one is profiled run normally and don't count.
+"""
+
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from .log import safe_warning
+
+# Frames kept per allocation traceback
+TRACEMALLOC_FRAMES = 16
+
+# Entries in the .txt summary
+SUMMARY_LINES = 25
+
+
+def queries_from_env(name, default=0):
+    """Return the number of queries to profile from environment variable `name`"""
+    try:
+        return max(0, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+class QueryProfiler:
+    """Profiles the next `queries` queries into `directory`"""
+
+    def __init__(self, directory, queries=0):
+        self.directory = directory
+        self.remaining = queries
+        self.written = []
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+
+    @property
+    def armed(self):
+        return self.remaining > 0
+
+    def arm(self, queries):
+        """Profile the next `queries` queries (0 disarms)"""
+        self.remaining = max(0, queries)
+        if not self.remaining:
+            self._stop_tracemalloc()
+
+    @contextmanager
+    def profile(self, label):
+        """Profile the body of a with block if armed and no other query is being profiled"""
+        if self.remaining <= 0 or not self._lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            if self.remaining <= 0:
+                yield
+                return
+            self.remaining -= 1
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            before = tracemalloc.take_snapshot()
+            # Only imported once profiling is asked for
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                after = tracemalloc.take_snapshot()
+                # A profile that can't be written mustn't fail the query
+                try:
+                    self._write(label, profiler, before, after)
+                except Exception as e:
+                    safe_warning(f"Failed to write a profile to {self.directory}: {e}")
+                if self.remaining <= 0:
+                    self._stop_tracemalloc()
+        finally:
+            self._lock.release()
+
+    def _stop_tracemalloc(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _write(self, label, profiler, before, after):
+        import io
+        import pstats
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"query-{time.strftime('%Y%m%d-%H%M%S')}-{len(self.written) + 1}")
+        profiler.dump_stats(base + '.prof')
+        after.dump(base + '.snapshot')
+
+        summary = io.StringIO()
+        summary.write(f"Query: {label!r}\n\n")
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(SUMMARY_LINES)
+        summary.write("Allocated during the query, by line:\n")
+        for stat in after.compare_to(before, 'lineno')[:SUMMARY_LINES]:
+            summary.write(f"  {stat}\n")
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(summary.getvalue())
+        self.written.append(base)
@@ -0,0 +1,138 @@
+"""
+Bounded in-memory cache for query results
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_size(value):
+    """Roughly estimate the memory used by a JSON-like value in bytes"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += estimate_size(key) + estimate_size(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += estimate_size(item)
+    return size
+
+
+class QueryCache:
+    """LRU cache with expiry and entry-count/byte limits
+
+    Expired entries are dropped when looked up and by a sweep that runs at
+    most every `sweep_interval` seconds, so a long session doesn't keep
+    every query ever typed. Hit/miss counters are kept for diagnostics.
+
+    With a `stale_timeout`, expired entries are kept that much longer for
+    `get_stale`, to fall back on when fresh results can't be fetched.
+    """
+
+    def __init__(self, timeout, max_entries=256, max_bytes=4 * 1024 * 1024, sweep_interval=60, stale_timeout=0):
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> (value, timestamp, size)
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def configure(self, timeout, max_entries, max_bytes):
+        """Apply limits read from a config file, the entries already cached are kept"""
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        with self._lock:
+            self._sweep_if_due()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            age = time.time() - entry[1]
+            if age >= self.timeout:
+                if age >= self.timeout + self.stale_timeout:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_stale(self, key):
+        """Return the cached value for key even if it has expired, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[1] >= self.timeout + self.stale_timeout:
+                return None
+            return entry[0]
+
+    def put(self, key, value):
+        """Cache a value, evicting least recently used entries if over a limit"""
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                # Would evict everything else and still not fit
+                return
+            self._entries[key] = (value, time.time(), size)
+            self.total_bytes += size
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def sweep(self):
+        """Drop all expired entries"""
+        with self._lock:
+            self._sweep()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """Return cache counters as a dict"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    def _sweep_if_due(self):
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            self._sweep()
+
+    def _sweep(self):
+        cutoff = time.time() - self.timeout - self.stale_timeout
+        expired = [key for key, entry in self._entries.items() if entry[1] <= cutoff]
+        for key in expired:
+            self._remove(key)
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.total_bytes -= size
@@ -0,0 +1,90 @@
+"""
+Persistent record of the results the user actually picks
+
+Every pick of an item (keyed by an integer id such as a Steam appid or a YTS
+movie id) adds 1 to its score, and scores halve every `half_life` seconds, so
+titles picked often and recently rank first and stale habits fade out.
+"""
+
+import os
+import threading
+import time
+
+from .atomic_file import load_json, write_json
+from .log import safe_debug
+
+
+class UsageStore:
+    """Decayed pick counts per id, saved to a small JSON file"""
+
+    def __init__(self, path, half_life=30 * 86400, max_entries=500):
+        self.path = path
+        self.half_life = half_life
+        self.max_entries = max_entries
+        self._entries = {}  # id -> {'score', 'updated', 'query'}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            entries, _ = load_json(path)
+            self._entries = {int(key): entry for key, entry in entries.items()}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, key, query=None):
+        """Count a pick of `key`, remembering the query it was found with"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            score = self._decayed(entry, now) if entry else 0.0
+            self._entries[key] = {'score': score + 1, 'updated': now, 'query': query}
+            if len(self._entries) > self.max_entries:
+                weakest = min(self._entries, key=lambda k: self._decayed(self._entries[k], now))
+                del self._entries[weakest]
+            # Written under the lock, so a slower write can't replace a newer one
+            write_json(self.path, {str(k): dict(v) for k, v in self._entries.items()})
+
+    def score(self, key):
+        """Return the current (decayed) score of `key`, 0 if never picked"""
+        entry = self._entries.get(key)
+        return self._decayed(entry, time.time()) if entry else 0.0
+
+    def scores(self):
+        """Return {id: current score} for every recorded id"""
+        now = time.time()
+        with self._lock:
+            return {key: self._decayed(entry, now) for key, entry in self._entries.items()}
+
+    def top(self, count):
+        """Return the `count` best scored (id, query) pairs, best first"""
+        now = time.time()
+        with self._lock:
+            ranked = sorted(self._entries.items(), key=lambda item: -self._decayed(item[1], now))
+        return [(key, entry.get('query')) for key, entry in ranked[:count]]
+
+    def _decayed(self, entry, now):
+        age = max(0.0, now - entry['updated'])
+        return entry['score'] * 0.5 ** (age / self.half_life)
+
+
+def record_pick(store, key, query=None, cache=None):
+    """Count a pick in `store` and clear `cache`, whose result lists don't have the new order yet
+
+    Does nothing without a store (it failed to load) or a key; failures are
+    only logged, the action that was picked still has to run.
+    """
+    if store is None or not key:
+        return
+    try:
+        store.record(key, query)
+        if cache is not None:
+            cache.clear()
+    except Exception as e:
+        safe_debug(f"Failed to record usage of {key}: {e}")
+
+
+def on_pick(store, key, callback, query=None, cache=None):
+    """Wrap an item action so that running it records the pick first"""
+    def run():
+        record_pick(store, key, query, cache)
+        callback()
+    return run
@@ -21,60 +21,35 @@ md_bin_dependencies = []
 md_lib_dependencies = ["requests"]
 
 import albert
-import requests
-import json
+import functools
 import time
 import os
-from urllib.parse import quote_plus
-
-# Fallback logging functions for when albert logging is not available
-def safe_warning(message):
-    """Safely log warning message with fallback"""
-    try:
-        albert.warning(message)
-    except AttributeError:
-        print(f"WARNING: {message}")
-
-def safe_debug(message):
-    """Safely log debug message with fallback"""
-    try:
-        albert.debug(message)
-    except AttributeError:
-        print(f"DEBUG: {message}")
-
-def safe_info(message):
-    """Safely log info message with fallback"""
-    try:
-        albert.info(message)
-    except AttributeError:
-        print(f"INFO: {message}")
-
-def safe_critical(message):
-    """Safely log critical message with fallback"""
-    try:
-        albert.critical(message)
-    except AttributeError:
-        print(f"CRITICAL: {message}")
-
-def check_albert_api():
-    """Check which Albert API functions are available"""
-    available_functions = []
-    missing_functions = []
-
-    functions_to_check = ['debug', 'info', 'warning', 'critical']
-
-    for func_name in functions_to_check:
-        if hasattr(albert, func_name):
-            available_functions.append(func_name)
-        else:
-            missing_functions.append(func_name)
-
-    if missing_functions:
-        print(f"Albert API - Missing functions: {', '.join(missing_functions)}")
-        print(f"Albert API - Available functions: {', '.join(available_functions)}")
-        print("This may indicate an Albert version compatibility issue.")
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import quote_plus, urlparse
+
+from .app_list import iter_steam_apps
+from .index_service import (
+    PROTOCOL_VERSION, IndexClient, RemoteSteamIndex, RemoteTierCache,
+    start_index_service, wait_for_service
+)
+from .plugin_core.atomic_file import backup_path, load_json, write_json
+from .plugin_core.background import run_in_background
+from .plugin_core.connectivity import Connectivity
+from .plugin_core.debounce import debounce
+from .plugin_core.diagnostics import Diagnostics
+from .plugin_core.http import HttpClient, Offline
+from .plugin_core.log import safe_critical, safe_debug, safe_info, safe_warning
+from .plugin_core.metrics import Metrics
+from .plugin_core.profiler import QueryProfiler, queries_from_env
+from .plugin_core.query_cache import QueryCache
+from .plugin_core.usage_store import UsageStore, on_pick
+from .prefetcher import TierPrefetcher
+from .rate_limit import TokenBucket
+from .ranking import popularity
+from .steam_index import SKIP_WORDS, SteamIndex
+from .tier_cache import TierCache
 
-    return available_functions, missing_functions
 
 class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
 
@@ -82,29 +57,102 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
         albert.PluginInstance.__init__(self)
         albert.TriggerQueryHandler.__init__(self)
 
-        # Check Albert API compatibility
-        available_funcs, missing_funcs = check_albert_api()
-        if missing_funcs:
-            print(f"ProtonDB Plugin: Some Albert logging functions are not available: {missing_funcs}")
-
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:103.0) Gecko/20100101 Firefox/103.0',
-            'Referer': '-'
-        })
+        # HTTP client, created once the offline mode is configured
+        self.http = None
 
-        # Cache for search results and Steam API data
-        self.search_cache = {}
+        # Cache for search results (limits are overridable in config.json)
         self.cache_timeout = 300  # 5 minutes
+        self.cache_max_entries = 256
+        self.cache_max_bytes = 4 * 1024 * 1024
+        self.search_cache = QueryCache(self.cache_timeout, self.cache_max_entries, self.cache_max_bytes)
 
-        # Steam API data file
+        # Steam game index snapshot (steamapi.json is only imported if present)
+        self.steam_index_file = os.path.join(str(self.dataLocation()), 'steamapi.bin')
         self.steam_api_file = os.path.join(str(self.dataLocation()), 'steamapi.json')
-        self.steam_api_data = None
         self.steam_api_age = 0
+        self.steam_index = None
+
+        # The index is loaded/downloaded on a background thread so startup never blocks
+        self.steam_index_progress = 0
+        self._steam_index_lock = threading.Lock()
+        self._steam_index_thread = None
+
+        # ProtonDB summaries are fetched in parallel, rate limited to the same
+        # average of 5 requests per second as the old 0.2s delay between games
+        self.fetch_workers = 5
+        self.fetch_executor = ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="protondb-fetch")
+        self.rate_limiter = TokenBucket(rate=5, capacity=self.fetch_workers)
+
+        # Per-appid tier cache settings (overridable in config.json)
+        self.tier_cache_file = os.path.join(str(self.dataLocation()), 'tiers.sqlite')
+        self.tier_cache_ttl = 86400  # 1 day
+        self.tier_cache_max_entries = 20000
+        self.tier_cache = None
+
+        # Optionally keep the index and tier cache in a per-session local
+        # service, so plugin reloads only have to connect to it
+        self.index_service = False
+        runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or str(self.dataLocation())
+        self.index_socket = os.path.join(runtime_dir, 'albert-protondb-index.sock')
+        self.index_client = None
+
+        # Typo-tolerant matching (toggled in Albert's settings) and the time
+        # it may take per keystroke
+        self.fuzzy_matching = False
+        self.fuzzy_time_budget = 0.05
+
+        # Rank popular games (by ProtonDB report count) higher among equal matches
+        self.popularity_ranking = True
+        self.popularity = {}
+
+        # Games the user picked from the results (decayed counts), ranked
+        # first and their ratings kept fresh by the prefetcher
+        self.usage_store_file = os.path.join(str(self.dataLocation()), 'usage.json')
+        self.usage_ranking = True
+        self.usage_store = None
+
+        # Background refresh of tiers that are about to expire
+        self.prefetch = True
+        self.prefetch_rate = 0.5  # Refreshes per second, on top of the query rate limit
+        self.prefetch_recent_days = 7
+        self.prefetcher = None
+
+        # Offline mode: "auto" detects it, true never uses the network, false
+        # always tries it; while offline only cached (even expired) ratings are shown
+        self.offline_mode = "auto"
+        self.connect_timeout = 3  # Seconds before an unanswered request counts as offline
+        self.connectivity = None
+
+        # Per-stage latency histograms, shown by the hidden ":stats" query and
+        # optionally written to metrics.json every minute
+        self.metrics = Metrics()
+        self.metrics_dump = False
+
+        # Profile the next N queries with cProfile and tracemalloc into
+        # data/profiles (also set by PROTONDB_PROFILE or the ":profile" query)
+        self.profile_queries = 0
+
+        # Measures queries and answers ":stats" and ":profile", created once
+        # the above are configured
+        self.diagnostics = None
+
+        # Seconds to wait for more keystrokes before making network requests
+        self.debounce_delay = 0.15
+
+        # Show cached ratings immediately and the rest as they arrive
+        self.progressive_results = True
+
+        # Steam entries whose names contain these words are not games
+        self.skip_words = list(SKIP_WORDS)
+
+        # Optional Steam Web API key, enables fetching only the apps changed
+        # since the last refresh instead of the whole app list
+        self.steam_api_key = ""
 
         # ProtonDB API endpoints
         self.pdb_api = 'https://www.protondb.com/api/v1/reports/summaries/'
         self.steam_api = 'https://api.steampowered.com/ISteamApps/GetAppList/v2/'
+        self.steam_store_api = 'https://api.steampowered.com/IStoreService/GetAppList/v1/'
 
         # ProtonDB rating colors and descriptions
         self.ratings = {
@@ -140,8 +188,195 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
             }
         }
 
+        # Load configuration from file
+        self.readConfig()
+        self.connectivity = Connectivity(urlparse(self.pdb_api).hostname, mode=self.offline_mode)
+        self.connectivity.start()
+        self.http = HttpClient({
+            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:103.0) Gecko/20100101 Firefox/103.0',
+            'Referer': '-'
+        }, self.connect_timeout, self.connectivity, self.metrics)
+        self.diagnostics = Diagnostics(
+            "protondb", self.metrics,
+            QueryProfiler(
+                os.path.join(str(self.dataLocation()), 'profiles'),
+                queries_from_env('PROTONDB_PROFILE', self.profile_queries)
+            ),
+            os.path.join(str(self.dataLocation()), 'metrics.json'),
+            self._metrics_snapshot, self._stats_summary, self.metrics_dump
+        )
+        self._open_tier_cache()
+        self._open_usage_store()
+        self._start_prefetcher()
+
         # Initialize Steam API data
-        self._load_steam_api_data()
+        self._start_steam_index_loader()
+
+    def readConfig(self):
+        """Read configuration from config file"""
+        # Set defaults first
+        self.cache_timeout = 300
+        self.cache_max_entries = 256
+        self.cache_max_bytes = 4 * 1024 * 1024
+        self.tier_cache_ttl = 86400
+        self.tier_cache_max_entries = 20000
+        self.debounce_delay = 0.15
+        self.progressive_results = True
+        self.skip_words = list(SKIP_WORDS)
+        self.steam_api_key = ""
+        self.index_service = False
+        self.fuzzy_time_budget = 0.05
+        self.popularity_ranking = True
+        self.usage_ranking = True
+        self.prefetch = True
+        self.prefetch_rate = 0.5
+        self.offline_mode = "auto"
+        self.connect_timeout = 3
+        self.metrics_dump = False
+        self.profile_queries = 0
+
+        try:
+            config_file = os.path.join(str(self.dataLocation()), 'config.json')
+            if os.path.exists(config_file):
+                config, from_backup = load_json(config_file)
+                if from_backup:
+                    safe_warning(f"{config_file} is not valid JSON, using its last good copy")
+
+                self.cache_timeout = int(config.get("cache_timeout", 300))
+                self.cache_max_entries = int(config.get("cache_max_entries", 256))
+                self.cache_max_bytes = int(config.get("cache_max_bytes", 4 * 1024 * 1024))
+                self.tier_cache_ttl = int(config.get("tier_cache_ttl", 86400))
+                self.tier_cache_max_entries = int(config.get("tier_cache_max_entries", 20000))
+                self.debounce_delay = float(config.get("debounce_delay", 0.15))
+                self.progressive_results = bool(config.get("progressive_results", True))
+                self.skip_words = list(config.get("skip_words", SKIP_WORDS))
+                self.steam_api_key = str(config.get("steam_api_key", ""))
+                self.index_service = bool(config.get("index_service", False))
+                self.fuzzy_time_budget = float(config.get("fuzzy_time_budget", 0.05))
+                self.popularity_ranking = bool(config.get("popularity_ranking", True))
+                self.usage_ranking = bool(config.get("usage_ranking", True))
+                self.prefetch = bool(config.get("prefetch", True))
+                self.prefetch_rate = float(config.get("prefetch_rate", 0.5))
+                self.offline_mode = config.get("offline_mode", "auto")
+                self.connect_timeout = float(config.get("connect_timeout", 3))
+                self.metrics_dump = bool(config.get("metrics_dump", False))
+                self.profile_queries = int(config.get("profile_queries", 0))
+
+                safe_debug(f"Configuration loaded from {config_file}")
+            else:
+                # Create default config file
+                self._create_default_config(config_file)
+                safe_debug("Created default configuration file")
+
+        except Exception as e:
+            safe_warning(f"Failed to read config: {e}")
+
+        self.search_cache.configure(self.cache_timeout, self.cache_max_entries, self.cache_max_bytes)
+
+    def _create_default_config(self, config_file):
+        """Create default configuration file"""
+        try:
+            os.makedirs(os.path.dirname(config_file), exist_ok=True)
+
+            default_config = {
+                "cache_timeout": 300,
+                "cache_max_entries": 256,
+                "cache_max_bytes": 4 * 1024 * 1024,
+                "tier_cache_ttl": 86400,
+                "tier_cache_max_entries": 20000,
+                "debounce_delay": 0.15,
+                "progressive_results": True,
+                "skip_words": SKIP_WORDS,
+                "steam_api_key": "",
+                "index_service": False,
+                "fuzzy_time_budget": 0.05,
+                "popularity_ranking": True,
+                "usage_ranking": True,
+                "prefetch": True,
+                "prefetch_rate": 0.5,
+                "offline_mode": "auto",
+                "connect_timeout": 3,
+                "metrics_dump": False,
+                "profile_queries": 0
+            }
+
+            write_json(config_file, default_config)
+
+        except Exception as e:
+            safe_warning(f"Failed to create default config: {e}")
+
+    def _open_tier_cache(self):
+        """Open the persistent per-appid tier cache"""
+        if self.index_service:
+            # Owned by the index service, which the index loader starts
+            self.index_client = IndexClient(self.index_socket)
+            self.tier_cache = RemoteTierCache(self.index_client)
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.tier_cache_file), exist_ok=True)
+            self.tier_cache = TierCache(self.tier_cache_file, self.tier_cache_ttl, self.tier_cache_max_entries)
+            safe_debug(
+                f"Opened tier cache ({len(self.tier_cache)} entries, "
+                f"{self.tier_cache.snapshot_size()} imported)"
+            )
+            if self.popularity_ranking:
+                self.popularity = {
+                    appid: popularity(reports)
+                    for appid, reports in self.tier_cache.report_counts().items()
+                }
+        except Exception as e:
+            safe_warning(f"Failed to open tier cache, ratings will not be cached: {e}")
+            self.tier_cache = None
+
+    def _open_usage_store(self):
+        """Load the record of picked games"""
+        try:
+            self.usage_store = UsageStore(self.usage_store_file)
+        except Exception as e:
+            safe_warning(f"Failed to load usage data, picks will not be remembered: {e}")
+            self.usage_store = None
+
+    def _start_prefetcher(self):
+        """Keep the tiers of viewed, popular and picked games fresh while Albert is idle"""
+        if not self.prefetch or self.tier_cache is None or self.prefetch_rate <= 0:
+            return
+        self.prefetcher = TierPrefetcher(
+            self._prefetch_candidates, self._refresh_protondb_rating, rate=self.prefetch_rate
+        )
+        if not self.connectivity.online:
+            self.prefetcher.pause()
+        self.connectivity.add_listener(self._on_connectivity_change)
+        self.prefetcher.start()
+
+    def _on_connectivity_change(self, online):
+        """Pause background refreshes while ProtonDB is unreachable"""
+        if self.prefetcher is None:
+            return
+        if online:
+            self.prefetcher.resume()
+        else:
+            self.prefetcher.pause()
+
+    def _prefetch_candidates(self, limit=50):
+        """Return the cached appids worth refreshing before they expire"""
+        if not self.connectivity.online:
+            return []
+        try:
+            picked = [appid for appid, _ in self.usage_store.top(20)] if self.usage_store is not None else []
+            return self.tier_cache.expiring(
+                within=self.tier_cache_ttl * 0.1,
+                accessed_since=self.prefetch_recent_days * 86400,
+                limit=limit,
+                include=picked
+            )
+        except Exception as e:
+            safe_debug(f"Failed to list tiers to prefetch: {e}")
+            return []
+
+    def _refresh_protondb_rating(self, appid, is_valid):
+        """Fetch a tier again, bypassing (and updating) the tier cache"""
+        self._get_protondb_rating(appid, is_valid, refresh=True)
 
     def defaultTrigger(self):
         return "proton "
@@ -150,11 +385,27 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
         return "ProtonDB: proton <game name>"
 
     def supportsFuzzyMatching(self):
-        return False
+        return True
+
+    def setFuzzyMatching(self, enabled):
+        """Called by Albert when fuzzy matching is toggled for this handler"""
+        self.fuzzy_matching = bool(enabled)
+        # Cached results were found with the other matching mode
+        self.search_cache.clear()
 
     def handleTriggerQuery(self, query):
         search_term = query.string.strip()
+        if self.prefetcher is not None:
+            # Queries get the network to themselves
+            self.prefetcher.touch()
 
+        if self.diagnostics.handle(query, search_term):
+            return
+        with self.diagnostics.measure(search_term):
+            self._handle_query(query, search_term)
+
+    def _handle_query(self, query, search_term):
+        """Answer a query, everything but diagnostics"""
         if not search_term:
             query.add(albert.StandardItem(
                 id="protondb_help",
@@ -175,8 +426,19 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
             ))
             return
 
+        if self.steam_index is None and self._is_steam_index_loading():
+            # A stale index keeps answering while the new one downloads
+            query.add(albert.StandardItem(
+                id="protondb_loading",
+                text=f"Loading Steam game index ({self.steam_index_progress}%)",
+                subtext="The Steam game list is being prepared, try again in a moment",
+                iconUrls=["xdg:view-refresh"],
+                actions=[]
+            ))
+            return
+
         # Check if Steam API data is available
-        if not self.steam_api_data:
+        if not self.steam_index:
             query.add(albert.StandardItem(
                 id="protondb_no_steam_data",
                 text="Steam API data not available",
@@ -186,7 +448,7 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
                     albert.Action(
                         "download_steam_data",
                         "Download Steam game list",
-                        lambda: self._download_steam_api_data()
+                        lambda: self._start_steam_index_loader(download=True)
                     )
                 ]
             ))
@@ -194,15 +456,22 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
 
         # Check cache first
         cache_key = search_term.lower()
-        cached_result = self._get_cached_result(cache_key)
+        with self.metrics.span('cache_lookup'):
+            cached_result = self.search_cache.get(cache_key)
 
         if cached_result:
-            self._add_results_to_query(query, cached_result, search_term)
+            if query.isValid:
+                self._add_results_to_query(query, cached_result, search_term)
             return
 
         try:
             # Search for games in Steam API data
-            matching_games = self._search_steam_games(search_term)
+            with self.metrics.span('index_search'):
+                matching_games = self._search_steam_games(search_term)
+
+            # Stop here if the user has typed on since this query started
+            if not query.isValid:
+                return
 
             if not matching_games:
                 query.add(albert.StandardItem(
@@ -220,21 +489,41 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
                 ))
                 return
 
-            # Get ProtonDB ratings for found games
-            results = self._get_protondb_ratings(matching_games[:5])  # Limit to 5 games
+            top_games = matching_games[:5]  # Limit to 5 games
+
+            if self.progressive_results:
+                # Rated items are added as soon as each rating is known
+                results = self._add_ratings_progressively(query, top_games)
+            else:
+                # Give the user a moment to keep typing before going to the network
+                if self._needs_network(top_games) and not debounce(query, self.debounce_delay):
+                    return
+
+                # Get ProtonDB ratings for found games
+                with self.metrics.span('ratings'):
+                    results = self._get_protondb_ratings(top_games, query)
+
+            if results is None or not query.isValid:
+                # Superseded by a newer query, partial results are not cached
+                return
 
+            offline = not self.connectivity.online
             if results:
-                # Cache results
-                self.search_cache[cache_key] = {
-                    'data': results,
-                    'timestamp': time.time()
-                }
-                self._add_results_to_query(query, results, search_term)
+                if offline:
+                    # Possibly stale or incomplete, ask again once back online
+                    query.add(self._offline_item())
+                else:
+                    self.search_cache.put(cache_key, results)
+                if self.progressive_results:
+                    self._add_more_item(query, search_term)
+                else:
+                    self._add_results_to_query(query, results, search_term)
             else:
                 query.add(albert.StandardItem(
                     id="protondb_no_ratings",
                     text="No ProtonDB data found",
-                    subtext="Games found but no ProtonDB ratings available",
+                    subtext="Offline, and no ratings of these games are cached" if offline
+                    else "Games found but no ProtonDB ratings available",
                     iconUrls=["dialog-information"],
                     actions=[]
                 ))
@@ -255,227 +544,563 @@ class Plugin(albert.PluginInstance, albert.TriggerQueryHandler):
                 ]
             ))
 
+    def _start_steam_index_loader(self, download=False):
+        """Load (or download) the Steam index on a background thread"""
+        with self._steam_index_lock:
+            if self._is_steam_index_loading():
+                return
+            self.steam_index_progress = 0
+            self._steam_index_thread = run_in_background(
+                self._prepare_steam_index, download, name="protondb-steam-index"
+            )
+
+    def _prepare_steam_index(self, download):
+        """Load (or download) the Steam index, through the index service if enabled"""
+        with self.metrics.span('steam_index_load'):
+            if self.index_client is not None and not download and self._attach_index_service():
+                return
+
+            if download:
+                self._refresh_steam_api_data()
+            else:
+                self._load_steam_api_data()
+
+            if self.index_client is not None and self.steam_index is not None:
+                # Built here because the service had no usable index, hand it over
+                self._attach_index_service(reload=True)
+
+    def _attach_index_service(self, reload=False):
+        """Use the index service's Steam index, starting the service if needed
+
+        Returns False if the service can't be started or has no index fresh
+        enough to use (unless it was just told to `reload` the snapshot).
+        """
+        try:
+            if not self._ensure_index_service():
+                return False
+            status = self.index_client.call(
+                'reload' if reload else 'status', skip_words=self.skip_words
+            )
+        except (ConnectionError, RuntimeError) as e:
+            safe_warning(f"Index service unavailable, loading the Steam index here: {e}")
+            return False
+
+        if status['apps'] is None:
+            return False
+        index_age = time.time() - status['refreshed']
+        if not reload and index_age >= 604800:  # 7 days in seconds
+            return False
+        self.steam_index = RemoteSteamIndex(self.index_client, status)
+        self.steam_api_age = index_age
+        self.steam_index_progress = 100
+        safe_debug(f"Using the index service's Steam index ({status['apps']} games)")
+        return True
+
+    def _ensure_index_service(self):
+        """Check that a current index service is running, starting one if not"""
+        try:
+            if self.index_client.call('ping')['version'] == PROTOCOL_VERSION:
+                return True
+            # Left running by an older version of the plugin
+            self.index_client.call('shutdown')
+            self.index_client.close()
+            time.sleep(0.1)
+        except ConnectionError:
+            pass
+
+        os.makedirs(os.path.dirname(self.steam_index_file), exist_ok=True)
+        start_index_service(
+            self.index_socket, self.steam_index_file, self.tier_cache_file,
+            self.tier_cache_ttl, self.tier_cache_max_entries
+        )
+        reply = wait_for_service(self.index_client)
+        if reply is None:
+            safe_warning("Index service did not start")
+            return False
+        safe_info(f"Started index service (pid {reply['pid']})")
+        return True
+
+    def _is_steam_index_loading(self):
+        """Check whether the background index loader is still running"""
+        thread = self._steam_index_thread
+        return thread is not None and thread.is_alive()
+
+    def _progress_callback(self, start, end):
+        """Return a (done, total) callback mapping onto a range of the loading percentage"""
+        def report(done, total):
+            if total:
+                self.steam_index_progress = int(start + (end - start) * min(done, total) / total)
+        return report
+
     def _load_steam_api_data(self):
-        """Load Steam API data from file"""
+        """Load the Steam game index from its snapshot (or legacy JSON) file"""
         try:
-            if os.path.exists(self.steam_api_file):
-                # Check if file is recent (less than 7 days old)
+            index = self._load_steam_index_snapshot()
+            if index is not None:
+                index_age = time.time() - index.refreshed
+                self.steam_index = index
+                self.steam_api_age = index_age
+                skip_words_changed = index.set_skip_words(self.skip_words)
+                # Check if snapshot is recent (less than 7 days old)
+                if index_age < 604800:  # 7 days in seconds
+                    if skip_words_changed:
+                        # The configured skip words changed, keep the new flags
+                        self._save_steam_index()
+                    safe_debug(f"Loaded Steam index snapshot ({len(index)} games)")
+                    return
+                # The old snapshot is the base the changes get merged into
+                safe_debug("Steam API data is older than 7 days, will update it")
+            elif os.path.exists(self.steam_api_file):
+                # Import the JSON app list written by older versions
                 file_age = time.time() - os.path.getmtime(self.steam_api_file)
-                if file_age < 604800:  # 7 days in seconds
-                    with open(self.steam_api_file, 'r', encoding='utf-8') as f:
-                        self.steam_api_data = json.load(f)
-                        self.steam_api_age = file_age
-                        safe_debug(f"Loaded Steam API data ({len(self.steam_api_data.get('applist', {}).get('apps', []))} games)")
-                        return
+                if file_age < 604800:
+                    with open(self.steam_api_file, 'rb') as f:
+                        apps = iter_steam_apps(iter(lambda: f.read(65536), b''))
+                        self._build_steam_index(apps, self._progress_callback(10, 100))
+                    self.steam_api_age = file_age
+                    self._save_steam_index()
+                    safe_debug(f"Imported Steam API data from JSON ({len(self.steam_index)} games)")
+                    return
                 else:
                     safe_debug("Steam API data is older than 7 days, will download fresh data")
 
+            if self.steam_index is not None and not self.connectivity.check():
+                safe_info("Offline, using the Steam index from the last refresh")
+                return
+
             # Try to download fresh data
             self._download_steam_api_data()
 
         except Exception as e:
+            # A stale snapshot (if one was loaded) is still better than nothing
             safe_warning(f"Failed to load Steam API data: {str(e)}")
-            self.steam_api_data = None
+
+    def _load_steam_index_snapshot(self):
+        """Memory-map the Steam index snapshot, or its last good copy if it is damaged"""
+        for path in (self.steam_index_file, backup_path(self.steam_index_file)):
+            if not os.path.exists(path):
+                continue
+            try:
+                index = SteamIndex.load(path)
+            except (OSError, ValueError) as e:
+                safe_warning(f"Ignoring unreadable Steam index snapshot {path}: {str(e)}")
+                continue
+            if path != self.steam_index_file:
+                safe_info("Using the last good Steam index snapshot")
+            return index
+        return None
 
     def _download_steam_api_data(self):
-        """Download Steam API data"""
+        """Download Steam API data, merging it into the current index if there is one"""
         try:
-            safe_info("Downloading Steam game list...")
-
             # Ensure data directory exists
-            os.makedirs(os.path.dirname(self.steam_api_file), exist_ok=True)
+            os.makedirs(os.path.dirname(self.steam_index_file), exist_ok=True)
 
-            response = self.session.get(self.steam_api, timeout=30)
-            response.raise_for_status()
-
-            data = response.json()
+            if self.steam_index is not None and self.steam_api_key:
+                self._download_steam_app_changes()
+                return
 
-            # Save to file
-            with open(self.steam_api_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            safe_info("Downloading Steam game list...")
+            response = self.http.get(self.steam_api, timeout=30, stream=True)
+            response.raise_for_status()
 
-            self.steam_api_data = data
-            safe_info(f"Downloaded Steam API data ({len(data.get('applist', {}).get('apps', []))} games)")
+            # Apps are parsed straight into the index while the list downloads
+            apps = iter_steam_apps(self._download_chunks(response, self._progress_callback(0, 50)))
+            if self.steam_index is not None:
+                self._merge_steam_apps(apps, True, self._progress_callback(50, 100))
+            else:
+                self._build_steam_index(apps, self._progress_callback(50, 100))
+                self.steam_api_age = 0
+                self._save_steam_index()
+            safe_info(f"Downloaded Steam API data ({len(self.steam_index)} games)")
 
         except Exception as e:
             safe_critical(f"Failed to download Steam API data: {str(e)}")
             raise
 
-    def _search_steam_games(self, query):
-        """Search for games in Steam API data"""
-        if not self.steam_api_data or 'applist' not in self.steam_api_data:
+    def _download_chunks(self, response, report):
+        """Yield a streamed response body in chunks, reporting download progress"""
+        total = int(response.headers.get('Content-Length') or 0)
+        received = 0
+        try:
+            for chunk in response.iter_content(chunk_size=65536):
+                received += len(chunk)
+                report(received, total)
+                yield chunk
+        finally:
+            response.close()
+
+    def _download_steam_app_changes(self):
+        """Fetch only the apps changed since the last refresh from IStoreService"""
+        safe_info("Downloading Steam game list changes...")
+        refreshed = time.time()
+        params = {
+            'key': self.steam_api_key,
+            'if_modified_since': int(self.steam_index.refreshed),
+            'include_games': 'true',
+            'include_dlc': 'true',
+            'include_software': 'true',
+            'include_videos': 'true',
+            'include_hardware': 'true',
+            'max_results': 50000
+        }
+        apps = []
+        while True:
+            response = self.http.get(self.steam_store_api, params=params, timeout=30)
+            response.raise_for_status()
+            page = response.json().get('response', {})
+            apps.extend(page.get('apps', []))
+            self.steam_index_progress = min(50, self.steam_index_progress + 10)
+            if not page.get('have_more_results'):
+                break
+            params['last_appid'] = page['last_appid']
+
+        # The changes don't include removed apps, so nothing else is dropped
+        self._merge_steam_apps(apps, False, self._progress_callback(50, 100), refreshed)
+        safe_info(f"Merged {len(apps)} changed Steam apps into the index")
+
+    def _merge_steam_apps(self, apps, complete, progress=None, refreshed=None):
+        """Merge an updated app list into the current index and save it"""
+        start_time = time.perf_counter()
+        merged = self.steam_index.merge_apps(apps, complete, progress)
+        if merged is not None:
+            self.steam_index = merged
+        self.steam_index.refreshed = refreshed if refreshed is not None else time.time()
+        self.steam_api_age = 0
+        self._save_steam_index()
+        safe_debug(f"Merged Steam app list into the index in {time.perf_counter() - start_time:.2f}s")
+
+    def _refresh_steam_api_data(self):
+        """Download Steam API data, logging instead of raising (background use)"""
+        try:
+            self._download_steam_api_data()
+        except Exception:
+            # Already logged by _download_steam_api_data
+            pass
+
+    def _build_steam_index(self, apps, progress=None):
+        """Build the name index used for searching the Steam app list"""
+        start_time = time.perf_counter()
+        self.steam_index = SteamIndex.from_apps(apps, progress, self.skip_words)
+        safe_debug(f"Built Steam search index ({len(self.steam_index)} games) in {time.perf_counter() - start_time:.2f}s")
+
+    def _save_steam_index(self):
+        """Write the Steam index snapshot so later starts can memory-map it"""
+        try:
+            # Written next to the target and renamed, a mapped old snapshot stays valid
+            self.steam_index.save(self.steam_index_file, keep_backup=True)
+        except Exception as e:
+            safe_warning(f"Failed to save Steam index snapshot: {str(e)}")
+
+    def _search_steam_games(self, query, limit=5):
+        """Search for the best `limit` games in the Steam index"""
+        if not self.steam_index:
             return []
 
-        query_lower = query.lower().strip()
-        exact_matches = []
-        startswith_matches = []
-        contains_matches = []
+        try:
+            priors = self.popularity if self.popularity_ranking else None
+            boosts = None
+            if self.usage_ranking and self.usage_store is not None:
+                boosts = self.usage_store.scores()
+            results = self.steam_index.search(query, limit, priors, boosts)
+            if self.fuzzy_matching and len(results) < limit:
+                # Too few literal matches, fill up with near misses
+                results = results + self.steam_index.fuzzy_search(
+                    query, limit - len(results),
+                    {game['appid'] for game in results}, self.fuzzy_time_budget
+                )
+            return results
+        except ConnectionError as e:
+            # The index service went away, reconnect (or load locally) in the background
+            safe_warning(f"Lost the index service: {e}")
+            self.steam_index = None
+            self._start_steam_index_loader()
+            return []
 
-        for app in self.steam_api_data['applist']['apps']:
-            if not app.get('name'):
-                continue
+    def _needs_network(self, games):
+        """Check whether any of the games' ratings are missing from the tier cache"""
+        if not self.connectivity.online:
+            return False
+        if self.tier_cache is None:
+            return True
+        return any(not self.tier_cache.get(game['appid'])[0] for game in games)
+
+    def _add_ratings_progressively(self, query, games):
+        """Add rated games to the query as their ratings become known
+
+        Games with a cached tier are added straight away; the others are
+        added in the order their ProtonDB summaries arrive. Returns the rated
+        games in search ranking order, or None if the query went stale.
+        """
+        cached_tiers = {}
+        uncached_games = []
+        # Offline, expired tiers are better than none
+        stale_ok = not self.connectivity.online
+        with self.metrics.span('tier_lookup'):
+            for game in games:
+                hit, tier = self.tier_cache.get(game['appid'], stale_ok) if self.tier_cache is not None else (False, None)
+                if hit:
+                    cached_tiers[game['appid']] = tier
+                else:
+                    uncached_games.append(game)
+        self.metrics.count('tier_cache_hits', len(cached_tiers))
+        self.metrics.count('tier_cache_misses', len(uncached_games))
+
+        results = {}
+        with self.metrics.span('items'):
+            for game in games:
+                rated_game = self._rated_game(game, cached_tiers.get(game['appid']))
+                if rated_game:
+                    results[game['appid']] = rated_game
+                    query.add(self._make_result_item(rated_game))
+
+        if uncached_games and not stale_ok:
+            # Give the user a moment to keep typing before going to the network
+            if not debounce(query, self.debounce_delay):
+                return None
 
-            app_name = app['name'].lower().strip()
+            def add_rated_game(rated_game):
+                results[rated_game['appid']] = rated_game
+                query.add(self._make_result_item(rated_game))
 
-            # Skip obviously non-game entries (demos, trailers, etc.)
-            if any(skip_word in app_name for skip_word in ['demo', 'trailer', 'teaser', 'beta test', 'playtest']):
-                continue
+            with self.metrics.span('ratings'):
+                if self._get_protondb_ratings(uncached_games, query, on_rating=add_rated_game) is None:
+                    return None
 
-            # Categorize matches by quality
-            if app_name == query_lower:
-                exact_matches.append({
-                    'name': app['name'],
-                    'appid': app['appid'],
-                    'name_length': len(app['name']),
-                    'match_type': 'exact'
-                })
-            elif app_name.startswith(query_lower):
-                startswith_matches.append({
-                    'name': app['name'],
-                    'appid': app['appid'],
-                    'name_length': len(app['name']),
-                    'match_type': 'startswith'
-                })
-            elif query_lower in app_name:
-                contains_matches.append({
-                    'name': app['name'],
-                    'appid': app['appid'],
-                    'name_length': len(app['name']),
-                    'match_type': 'contains'
-                })
-
-        # Sort each category by name length (shorter = better match)
-        exact_matches.sort(key=lambda x: x['name_length'])
-        startswith_matches.sort(key=lambda x: x['name_length'])
-        contains_matches.sort(key=lambda x: x['name_length'])
-
-        # Combine results with exact matches first
-        matching_games = exact_matches + startswith_matches + contains_matches
-
-        return matching_games
-
-    def _get_protondb_ratings(self, games):
-        """Get ProtonDB ratings for a list of games"""
-        results = []
+        return [results[game['appid']] for game in games if game['appid'] in results]
 
-        for game in games:
-            try:
-                appid = game['appid']
-                rating = self._get_protondb_rating(appid)
-
-                if rating and rating != "Not Found":
-                    results.append({
-                        'name': game['name'],
-                        'appid': appid,
-                        'rating': rating.lower(),
-                        'total_reports': 0  # ProtonDB API doesn't easily provide this
-                    })
-
-                # Sleep to prevent hammering the server
-                time.sleep(0.2)
-
-            except Exception as e:
-                safe_debug(f"Failed to get rating for {game['name']}: {str(e)}")
-                continue
+    def _get_protondb_ratings(self, games, query=None, on_rating=None):
+        """Get ProtonDB ratings for a list of games, fetching them concurrently
+
+        `on_rating`, if given, is called with each rated game as soon as its
+        rating arrives. Returns None if the query is invalidated before all
+        ratings arrive; fetches that haven't started yet are cancelled.
+        """
+        def is_valid():
+            return query is None or query.isValid
+
+        futures = [self.fetch_executor.submit(self._get_protondb_rating, game['appid'], is_valid) for game in games]
+        games_by_future = dict(zip(futures, games))
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+            if not is_valid():
+                for future in pending:
+                    future.cancel()
+                return None
+            if on_rating is not None:
+                for future in done:
+                    rated_game = self._rated_game_from_future(games_by_future[future], future)
+                    if rated_game:
+                        on_rating(rated_game)
+
+        # Collect in submission order so the search ranking is preserved
+        results = []
+        for game, future in zip(games, futures):
+            rated_game = self._rated_game_from_future(game, future)
+            if rated_game:
+                results.append(rated_game)
 
         return results
 
-    def _get_protondb_rating(self, appid):
-        """Get ProtonDB rating for a specific Steam app ID"""
+    def _rated_game_from_future(self, game, future):
+        """Build the rated game from a finished rating fetch, or None"""
+        try:
+            return self._rated_game(game, future.result())
+        except Exception as e:
+            safe_debug(f"Failed to get rating for {game['name']}: {str(e)}")
+            return None
+
+    def _rated_game(self, game, rating):
+        """Build the result dict for a game, or None if it has no rating"""
+        if not rating or rating == "Not Found":
+            return None
+        return {
+            'name': game['name'],
+            'appid': game['appid'],
+            'rating': rating.lower(),
+            'total_reports': 0  # ProtonDB API doesn't easily provide this
+        }
+
+    def _get_protondb_rating(self, appid, is_valid=None, refresh=False):
+        """Get ProtonDB rating for a specific Steam app ID
+
+        `is_valid` is checked before going to the network, so requests for a
+        query the user has moved on from are skipped. A `refresh` ignores
+        the cached tier and doesn't count as viewing the game.
+        """
         try:
+            # Serve from the persistent tier cache when possible
+            if self.tier_cache is not None and not refresh:
+                hit, tier = self.tier_cache.get(appid)
+                self.metrics.count('tier_cache_hits' if hit else 'tier_cache_misses')
+                if hit:
+                    return tier
+
+            if not self.connectivity.online:
+                return self._get_stale_rating(appid)
+
             url = f"{self.pdb_api}{appid}.json"
-            response = self.session.get(url, timeout=10)
+            # Wait for a token to prevent hammering the server
+            if not self.rate_limiter.acquire(is_valid):
+                return None
+            if is_valid is not None and not is_valid():
+                return None
+            response = self.http.get(url, timeout=10, stage='http_protondb')
 
             if response.status_code == 200:
                 data = response.json()
-                return data.get("tier")
+                tier = data.get("tier")
+                reports = data.get("total")
+                if self.tier_cache is not None:
+                    self.tier_cache.put(appid, tier, reports, touch=not refresh)
+                if self.popularity_ranking and reports:
+                    self.popularity[appid] = popularity(reports)
+                return tier
+            elif response.status_code == 404:
+                # No reports for this app, remember that too
+                if self.tier_cache is not None:
+                    self.tier_cache.put(appid, None, touch=not refresh)
+                return None
             else:
                 return None
 
+        except Offline as e:
+            safe_debug(f"ProtonDB unreachable for app {appid}: {str(e)}")
+            return self._get_stale_rating(appid)
         except Exception as e:
             safe_debug(f"ProtonDB API error for app {appid}: {str(e)}")
             return None
 
-    def _get_cached_result(self, key):
-        """Get cached result if still valid"""
-        if key in self.search_cache:
-            cached = self.search_cache[key]
-            if time.time() - cached['timestamp'] < self.cache_timeout:
-                return cached['data']
-            else:
-                # Remove expired cache
-                del self.search_cache[key]
-        return None
+    def _get_stale_rating(self, appid):
+        """Return the cached tier of a game however old it is (offline), or None"""
+        if self.tier_cache is None:
+            return None
+        return self.tier_cache.get(appid, stale_ok=True)[1]
+
+    def _offline_item(self):
+        """Return the item noting that results come from the cache only"""
+        return albert.StandardItem(
+            id="protondb_offline",
+            text="Offline",
+            subtext="ProtonDB is unreachable, showing cached ratings (they may be out of date)",
+            iconUrls=["xdg:network-offline"],
+            actions=[]
+        )
 
     def _add_results_to_query(self, query, results, search_term):
         """Add search results to Albert query"""
-        for game in results:
-            rating = game.get('rating', 'pending').lower()
-            rating_info = self.ratings.get(rating, self.ratings['pending'])
-
-            app_id = game.get('appid', '')
-            game_name = game.get('name', 'Unknown Game')
-
-            # Create subtext with rating info
-            subtext = rating_info['description']
-
-            # Create item
-            item = albert.StandardItem(
-                id=f"protondb_{app_id}",
-                text=f"{rating_info['color']} {game_name}",
-                subtext=subtext,
-                iconUrls=[f"xdg:{rating_info['icon']}", "xdg:applications-games"],
-                actions=[]
-            )
-
-            # Add actions
-            actions = []
+        with self.metrics.span('items'):
+            for game in results:
+                query.add(self._make_result_item(game))
 
-            if app_id:
-                # Open ProtonDB page
-                protondb_url = f"https://www.protondb.com/app/{app_id}"
-                actions.append(albert.Action(
-                    "open_protondb",
-                    "Open on ProtonDB",
-                    lambda url=protondb_url: albert.openUrl(url)
-                ))
-
-                # Open Steam page
-                steam_url = f"https://store.steampowered.com/app/{app_id}"
-                actions.append(albert.Action(
-                    "open_steam",
-                    "Open on Steam",
-                    lambda url=steam_url: albert.openUrl(url)
-                ))
-
-            # Copy game info
-            game_info = f"{game_name} - {rating_info['description']}"
+        # Add "Search more on ProtonDB" option
+        if results:
+            self._add_more_item(query, search_term)
+
+    def _make_result_item(self, game):
+        """Create the Albert item for a rated game"""
+        rating = game.get('rating', 'pending').lower()
+        rating_info = self.ratings.get(rating, self.ratings['pending'])
+
+        app_id = game.get('appid', '')
+        game_name = game.get('name', 'Unknown Game')
+
+        # Create subtext with rating info
+        subtext = rating_info['description']
+
+        # Create item
+        item = albert.StandardItem(
+            id=f"protondb_{app_id}",
+            text=f"{rating_info['color']} {game_name}",
+            subtext=subtext,
+            iconUrls=[f"xdg:{rating_info['icon']}", "xdg:applications-games"],
+            actions=[]
+        )
+
+        # Add actions, each of which records the pick
+        actions = []
+        picked = functools.partial(on_pick, self.usage_store, app_id, cache=self.search_cache)
+
+        if app_id:
+            # Open ProtonDB page
+            protondb_url = f"https://www.protondb.com/app/{app_id}"
             actions.append(albert.Action(
-                "copy_info",
-                "Copy game info",
-                lambda info=game_info: albert.setClipboardText(info)
+                "open_protondb",
+                "Open on ProtonDB",
+                picked(lambda url=protondb_url: albert.openUrl(url))
             ))
 
-            item.actions = actions
-            query.add(item)
-
-        # Add "Search more on ProtonDB" option
-        if results:
-            query.add(albert.StandardItem(
-                id="protondb_more",
-                text="Search more on ProtonDB",
-                subtext=f"Open ProtonDB search for '{search_term}'",
-                iconUrls=["xdg:web-browser"],
-                actions=[
-                    albert.Action(
-                        "search_more",
-                        "Search on ProtonDB",
-                        lambda: albert.openUrl(f"https://www.protondb.com/search?q={quote_plus(search_term)}")
-                    )
-                ]
+            # Open Steam page
+            steam_url = f"https://store.steampowered.com/app/{app_id}"
+            actions.append(albert.Action(
+                "open_steam",
+                "Open on Steam",
+                picked(lambda url=steam_url: albert.openUrl(url))
             ))
 
+        # Copy game info
+        game_info = f"{game_name} - {rating_info['description']}"
+        actions.append(albert.Action(
+            "copy_info",
+            "Copy game info",
+            picked(lambda info=game_info: albert.setClipboardText(info))
+        ))
+
+        item.actions = actions
+        return item
+
+    def _add_more_item(self, query, search_term):
+        """Add the "Search more on ProtonDB" item"""
+        query.add(albert.StandardItem(
+            id="protondb_more",
+            text="Search more on ProtonDB",
+            subtext=f"Open ProtonDB search for '{search_term}'",
+            iconUrls=["xdg:web-browser"],
+            actions=[
+                albert.Action(
+                    "search_more",
+                    "Search on ProtonDB",
+                    lambda: albert.openUrl(f"https://www.protondb.com/search?q={quote_plus(search_term)}")
+                )
+            ]
+        ))
+
+    def _metrics_snapshot(self):
+        """Return the stage metrics together with the caches' counters"""
+        return self.metrics.snapshot(
+            search_cache=self.search_cache.stats(),
+            tier_cache_entries=len(self.tier_cache) if self.tier_cache is not None else 0,
+            online=self.connectivity.online
+        )
+
+    def _stats_summary(self, snapshot):
+        """Return the name, text and subtext of the ":stats" item on the caches"""
+        counters = snapshot['counters']
+        tier_lookups = counters.get('tier_cache_hits', 0) + counters.get('tier_cache_misses', 0)
+        tier_hit_rate = counters.get('tier_cache_hits', 0) / tier_lookups if tier_lookups else 0.0
+        search_cache = snapshot['search_cache']
+        return (
+            "caches",
+            f"Cache hit rates: queries {search_cache['hit_rate']:.0%}, ratings {tier_hit_rate:.0%}",
+            f"{search_cache['entries']} cached queries, {snapshot['tier_cache_entries']} cached ratings"
+        )
+
     def finalize(self):
         """Clean up when plugin is disabled"""
-        if hasattr(self, 'session'):
-            self.session.close()
+        if getattr(self, 'diagnostics', None) is not None:
+            self.diagnostics.close()
+        if getattr(self, 'prefetcher', None) is not None:
+            self.prefetcher.stop()
+        if getattr(self, 'connectivity', None) is not None:
+            self.connectivity.stop()
+        if hasattr(self, 'fetch_executor'):
+            self.fetch_executor.shutdown(wait=False)
+        if getattr(self, 'http', None) is not None:
+            self.http.close()
+        if getattr(self, 'tier_cache', None) is not None:
+            self.tier_cache.close()
+        if getattr(self, 'index_client', None) is not None:
+            # The service keeps running for the next plugin load
+            self.index_client.close()
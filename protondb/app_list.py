@@ -0,0 +1,74 @@
+"""
+Incremental parser for the Steam app list
+
+The GetAppList response is one large JSON document. Instead of reading all
+of it and decoding the whole tree, the `applist.apps` array is picked out of
+the byte stream and each app object is decoded as soon as it has arrived, so
+only one chunk of the download is held in memory at a time.
+"""
+
+import codecs
+import json
+
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_steam_apps(chunks, array_key='apps'):
+    """Yield the app dicts of a GetAppList response from an iterable of byte chunks
+
+    Raises ValueError if the stream ends early or the document is not an
+    app list.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    json_decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ''
+    position = 0
+    in_array = False
+    finished = False
+    key = json.dumps(array_key)
+
+    while True:
+        if not in_array:
+            # Skip ahead to the opening bracket of the apps array
+            start = buffer.find(key)
+            if start != -1:
+                bracket = buffer.find('[', start + len(key))
+                if bracket != -1:
+                    between = buffer[start + len(key):bracket]
+                    if between.strip(_WHITESPACE) != ':':
+                        raise ValueError(f"Unexpected data after \"{array_key}\" in Steam app list")
+                    buffer = buffer[bracket + 1:]
+                    position = 0
+                    in_array = True
+                    continue
+            elif not finished:
+                # Keep enough of the tail for a key split across chunks
+                buffer = buffer[-len(key):]
+        else:
+            while True:
+                while position < len(buffer) and buffer[position] in _WHITESPACE + ',':
+                    position += 1
+                if position == len(buffer):
+                    break
+                if buffer[position] == ']':
+                    return
+                try:
+                    app, end = json_decoder.raw_decode(buffer, position)
+                except ValueError:
+                    if finished:
+                        raise
+                    break  # Object continues in the next chunk
+                position = end
+                yield app
+            buffer = buffer[position:]
+            position = 0
+
+        if finished:
+            raise ValueError("Steam app list ended unexpectedly")
+        chunk = next(chunks, None)
+        if chunk is None:
+            buffer += decoder.decode(b'', final=True)
+            finished = True
+        else:
+            buffer += decoder.decode(chunk)
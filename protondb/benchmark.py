@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Search latency benchmark for the ProtonDB plugin
+
+Runs Plugin._search_steam_games over a large Steam app list, one keystroke
+at a time like a user typing, and reports latency percentiles, memory
+allocated per search and the process's peak RSS. Runs fully offline with a
+stubbed albert module: the app list is either synthetic or a recorded
+GetAppList response.
+
+    python3 benchmark.py                       # 250,000 synthetic apps
+    python3 benchmark.py --apps 1000000 --fuzzy
+    python3 benchmark.py --app-list steamapi.json --json results.json
+    python3 benchmark.py --baseline results.json  # exit 1 on a p95 regression
+
+Queries under 3 characters match the most names, so they are also timed on
+their own and the run fails if their p99 latency exceeds --short-budget.
+
+A recorded app list can be saved with:
+    curl -o steamapi.json https://api.steampowered.com/ISteamApps/GetAppList/v2/
+"""
+
+import argparse
+import gzip
+import json
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# Import the plugin as a package, like test_plugin.py
+plugin_dir = Path(__file__).parent
+sys.path.insert(0, str(plugin_dir.parent))
+
+# Titles typed by the keystroke corpus, always part of the app list
+POPULAR_TITLES = [
+    "Portal 2", "Counter-Strike 2", "The Witcher 3: Wild Hunt", "ELDEN RING",
+    "Baldur's Gate 3", "Cyberpunk 2077", "Stardew Valley", "Hades",
+    "Half-Life 2", "Dota 2", "Terraria", "Hollow Knight",
+    "Red Dead Redemption 2", "Grand Theft Auto V", "DOOM Eternal",
+    "Disco Elysium", "Factorio", "RimWorld", "Slay the Spire", "Celeste",
+    "DARK SOULS III", "Sekiro: Shadows Die Twice", "Monster Hunter: World",
+    "Deep Rock Galactic", "Valheim", "Subnautica",
+    "The Elder Scrolls V: Skyrim Special Edition", "Team Fortress 2",
+    "Left 4 Dead 2", "Hogwarts Legacy",
+]
+
+# Misspelt or squashed queries, only matched by fuzzy search
+TYPO_QUERIES = [
+    "witcher3", "baldurs gate", "cyberpunk2077", "halflife 2", "skyrym",
+    "stardew valey", "hollow night", "deep rock galatic", "dark souls 3",
+]
+
+_WORDS = (
+    "dark souls hunter world legend tales quest space star war battle city "
+    "simulator farm racing dungeon knight dragon shadow empire zombie night "
+    "survival island ocean lost last dead blood fire ice storm magic sword "
+    "galaxy planet robot cyber neon pixel retro super mega ultra tiny little "
+    "house garden train truck flight tactics chronicles saga rising fall "
+    "escape rescue mystery detective puzzle adventure heroes arena league "
+    "kingdom castle tower forest mountain river valley road journey spirit"
+).split()
+_SYLLABLES = "ka ro mi zu te la no vi sha dor ren tal mor gan pho xi qua bel".split()
+_SUFFIXES = [
+    "", "", "", "", "", " 2", " 3", " II", ": Remastered", " - Soundtrack",
+    " Demo", " DLC", " - Season Pass", " Playtest", ": Definitive Edition",
+]
+
+
+def synthetic_apps(count, seed=0):
+    """Return a deterministic app list of `count` plausible Steam names"""
+    rng = random.Random(seed)
+    apps = [{'appid': 10 + index, 'name': title} for index, title in enumerate(POPULAR_TITLES)]
+    appid = 100000
+    while len(apps) < count:
+        words = rng.choices(_WORDS, k=rng.choice((1, 2, 2, 3, 3, 4)))
+        if rng.random() < 0.3:
+            # Made-up names keep the trigram postings from being too uniform
+            words.append(''.join(rng.choices(_SYLLABLES, k=rng.randint(2, 4))))
+        name = ' '.join(word.capitalize() for word in words) + rng.choice(_SUFFIXES)
+        apps.append({'appid': appid, 'name': name})
+        appid += rng.randint(1, 20)
+    rng.shuffle(apps)
+    return apps
+
+
+def recorded_apps(path):
+    """Return the apps of a recorded GetAppList response (optionally gzipped)"""
+    from protondb.app_list import iter_steam_apps
+
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        return list(iter_steam_apps(iter(lambda: f.read(65536), b'')))
+
+
+def keystroke_corpus(titles=POPULAR_TITLES, typos=()):
+    """Return queries as typed one keystroke at a time (from 2 characters on)"""
+    queries = []
+    for title in list(titles) + list(typos):
+        text = title.lower()
+        queries.extend(text[:length] for length in range(2, len(text) + 1))
+    return queries
+
+
+def short_prefixes(titles=POPULAR_TITLES):
+    """Return the distinct 2-character prefixes the titles are typed with"""
+    return sorted({title.lower()[:2] for title in titles})
+
+
+def percentiles(samples):
+    """Return p50/p95/p99/max of a list of samples"""
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99),
+        'max': ordered[-1], 'mean': statistics.fmean(ordered)
+    }
+
+
+def measure_latency(search, queries, rounds):
+    """Time each search in milliseconds, over `rounds` passes of the corpus"""
+    samples = []
+    for _ in range(rounds):
+        for query in queries:
+            start = time.perf_counter()
+            search(query)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def measure_allocations(search, queries):
+    """Return the peak memory (bytes) allocated by each search"""
+    samples = []
+    tracemalloc.start()
+    try:
+        for query in queries:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            search(query)
+            samples.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    return samples
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def install_albert_stub(data_dir):
+    """Install a minimal albert module whose plugins keep their data in data_dir"""
+    import types
+
+    albert = types.ModuleType('albert')
+
+    class PluginInstance:
+        def __init__(self):
+            pass
+
+        def dataLocation(self):
+            return data_dir
+
+    class TriggerQueryHandler:
+        pass
+
+    class StandardItem:
+        def __init__(self, id, text, subtext, iconUrls=None, actions=None):
+            self.id = id
+            self.text = text
+            self.subtext = subtext
+            self.actions = actions or []
+
+    class Action:
+        def __init__(self, id, text, callback):
+            self.id = id
+            self.text = text
+            self.callback = callback
+
+    albert.PluginInstance = PluginInstance
+    albert.TriggerQueryHandler = TriggerQueryHandler
+    albert.StandardItem = StandardItem
+    albert.Action = Action
+    albert.openUrl = albert.setClipboardText = lambda value: None
+    # Debug logging would dominate the timings
+    albert.debug = albert.info = lambda message: None
+    albert.warning = albert.critical = lambda message: print(f"WARNING: {message}", file=sys.stderr)
+    sys.modules['albert'] = albert
+
+
+def make_plugin(data_dir, apps, fuzzy=False, popularity=True, seed=0):
+    """Create a plugin searching `apps`, loaded the way Albert loads it (from the snapshot)"""
+    from protondb import Plugin
+    from protondb.plugin_core.atomic_file import write_json
+    from protondb.ranking import popularity as popularity_prior
+    from protondb.steam_index import SteamIndex
+
+    write_json(str(data_dir / 'config.json'), {
+        'offline_mode': True, 'index_service': False, 'prefetch': False
+    })
+    timings = {}
+    start = time.perf_counter()
+    index = SteamIndex.from_apps(apps)
+    timings['build_s'] = time.perf_counter() - start
+    index.save(str(data_dir / 'steamapi.bin'))
+
+    start = time.perf_counter()
+    plugin = Plugin()
+    plugin._steam_index_thread.join()
+    timings['load_s'] = time.perf_counter() - start
+    if plugin.steam_index is None:
+        raise RuntimeError("the plugin didn't load the Steam index snapshot")
+
+    plugin.fuzzy_matching = fuzzy
+    plugin.popularity_ranking = popularity
+    if popularity:
+        # Report counts like a tier cache that has seen the popular games
+        rng = random.Random(seed)
+        plugin.popularity = {
+            app['appid']: popularity_prior(rng.randint(1, 5000))
+            for app in apps if rng.random() < 0.05
+        }
+    return plugin, timings
+
+
+def check_baseline(results, baseline_path, tolerance):
+    """Return the stages whose p95 latency regressed past the baseline by more than `tolerance`"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for stage, stats in results['latency_ms'].items():
+        before = baseline.get('latency_ms', {}).get(stage)
+        if before and stats['p95'] > before['p95'] * (1 + tolerance):
+            regressions.append(f"{stage}: p95 {stats['p95']:.3f}ms vs {before['p95']:.3f}ms")
+    return regressions
+
+
+def check_short_prefixes(results, budget):
+    """Return an error if queries under 3 characters exceeded the p99 budget (ms), else None"""
+    stats = results['latency_ms'].get('short_prefix')
+    if stats and stats['p99'] > budget:
+        return f"short_prefix: p99 {stats['p99']:.3f}ms over the {budget:g}ms budget"
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ProtonDB plugin searches offline")
+    parser.add_argument('--apps', type=int, default=250000, help="size of the synthetic app list")
+    parser.add_argument('--app-list', help="recorded GetAppList response to use instead (.json or .json.gz)")
+    parser.add_argument('--queries', help="file with one title per line to type instead of the built-in corpus")
+    parser.add_argument('--rounds', type=int, default=3, help="passes over the keystroke corpus")
+    parser.add_argument('--fuzzy', action='store_true', help="enable fuzzy matching and add misspelt queries")
+    parser.add_argument('--no-popularity', action='store_true', help="rank without popularity priors")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--baseline', help="results file to compare against; exit 1 if p95 regressed")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p95 regression (default 25%%)")
+    parser.add_argument('--short-budget', type=float, default=25.0,
+                        help="max p99 latency in ms of queries under 3 characters (default 25)")
+    args = parser.parse_args(argv)
+
+    data_dir = Path(tempfile.mkdtemp(prefix='protondb-benchmark-'))
+    install_albert_stub(data_dir)
+    try:
+        if args.app_list:
+            apps = recorded_apps(args.app_list)
+        else:
+            apps = synthetic_apps(args.apps, args.seed)
+        titles = POPULAR_TITLES
+        if args.queries:
+            with open(args.queries) as f:
+                titles = [line.strip() for line in f if line.strip()]
+        queries = keystroke_corpus(titles, TYPO_QUERIES if args.fuzzy else ())
+
+        plugin, timings = make_plugin(data_dir, apps, args.fuzzy, not args.no_popularity, args.seed)
+        del apps
+        search = plugin._search_steam_games
+        # Warm up page cache and code paths
+        for query in queries[:50]:
+            search(query)
+
+        latency = measure_latency(search, queries, args.rounds)
+        short_latency = measure_latency(search, short_prefixes(titles), args.rounds)
+        allocations = measure_allocations(search, queries)
+        results = {
+            'apps': len(plugin.steam_index),
+            'queries': len(queries),
+            'rounds': args.rounds,
+            'fuzzy': args.fuzzy,
+            'index': timings,
+            'latency_ms': {'search': percentiles(latency), 'short_prefix': percentiles(short_latency)},
+            'allocated_kb': {key: value / 1024 for key, value in percentiles(allocations).items()},
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        plugin.finalize()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(f"Apps: {results['apps']:,}  keystrokes: {results['queries']} x {args.rounds} rounds")
+    print(f"Index build: {timings['build_s']:.2f}s  snapshot load: {timings['load_s'] * 1000:.1f}ms")
+    for stage, stats in results['latency_ms'].items():
+        print(
+            f"{stage} latency (ms): p50 {stats['p50']:.3f}  p95 {stats['p95']:.3f}  "
+            f"p99 {stats['p99']:.3f}  max {stats['max']:.3f}"
+        )
+    allocated = results['allocated_kb']
+    print(f"Allocated per search (KiB): p50 {allocated['p50']:.1f}  p95 {allocated['p95']:.1f}  max {allocated['max']:.1f}")
+    print(f"Peak RSS: {results['peak_rss_mb']:.0f} MiB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    error = check_short_prefixes(results, args.short_budget)
+    if error:
+        print(f"✗ {error}")
+        return 1
+
+    if args.baseline:
+        regressions = check_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print("✗ Latency regressed: " + "; ".join(regressions))
+            return 1
+        print("✓ No latency regression against the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Command line entry point for bulk tier imports (see tier_import.py)
+
+The plugin's modules are imported as a package without running its
+__init__, which needs Albert.
+"""
+
+import importlib
+import os
+import sys
+import types
+
+if __name__ == '__main__':
+    package = types.ModuleType('protondb_tier_import')
+    package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+    sys.modules[package.__name__] = package
+    sys.exit(importlib.import_module(f'{package.__name__}.tier_import').main())
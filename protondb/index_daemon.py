@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Entry point for the ProtonDB plugin's index service (see index_service.py)
+
+Started by the plugin as a separate process. The plugin's modules are
+imported as a package without running its __init__, which needs Albert.
+"""
+
+import importlib
+import os
+import sys
+import types
+
+if __name__ == '__main__':
+    package = types.ModuleType('protondb_index_service')
+    package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+    sys.modules[package.__name__] = package
+    sys.exit(importlib.import_module(f'{package.__name__}.index_service').main())
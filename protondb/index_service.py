@@ -0,0 +1,337 @@
+"""
+Optional local index service for the ProtonDB plugin
+
+A small daemon, started on demand and listening on a Unix socket, that owns
+the Steam index and the ProtonDB tier cache. Plugin instances (one per Albert
+start or plugin reload) connect to it instead of loading the index
+themselves, so the index is loaded once per login session.
+
+Requests and replies are single lines of JSON:
+    {"op": "search", "query": "portal", "limit": 50}
+    {"result": [...]} or {"error": "..."}
+"""
+
+import json
+import os
+import shutil
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+from .plugin_core.atomic_file import backup_path
+from .ranking import popularity
+from .steam_index import SteamIndex
+from .tier_cache import TierCache
+
+# Bumped whenever the request format changes, older daemons are replaced
+PROTOCOL_VERSION = 6
+
+
+class IndexServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves searches over a memory-mapped Steam index snapshot and a tier cache"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, index_file, tier_cache):
+        self.index_file = index_file
+        self.tier_cache = tier_cache
+        self.steam_index = None
+        # Popularity priors for ranking, from the tier cache's report counts
+        self.priors = {
+            appid: popularity(reports) for appid, reports in tier_cache.report_counts().items()
+        }
+        self._lock = threading.Lock()
+        if os.path.exists(socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+            except OSError:
+                # Left behind by a daemon that didn't exit cleanly
+                os.remove(socket_path)
+            else:
+                raise OSError(f"index service already running on {socket_path}")
+            finally:
+                probe.close()
+        super().__init__(socket_path, _RequestHandler)
+        os.chmod(socket_path, 0o600)
+        self.reload()
+
+    def reload(self):
+        """(Re)load the index snapshot, or its last good copy if it is damaged"""
+        for path in (self.index_file, backup_path(self.index_file)):
+            try:
+                index = SteamIndex.load(path)
+            except (OSError, ValueError):
+                continue
+            with self._lock:
+                self.steam_index = index
+            return
+        with self._lock:
+            self.steam_index = None
+
+    def dispatch(self, request):
+        """Handle one decoded request, returning the result to send back"""
+        op = request.get('op')
+        if op == 'ping':
+            return {'version': PROTOCOL_VERSION, 'pid': os.getpid()}
+        if op in ('status', 'reload'):
+            if op == 'reload':
+                self.reload()
+            self._apply_skip_words(request.get('skip_words'))
+            return self._status()
+        if op == 'search':
+            index = self.steam_index
+            if index is None:
+                raise LookupError("no Steam index loaded")
+            priors = self.priors if request.get('popularity', True) else None
+            boosts = {int(appid): score for appid, score in (request.get('boosts') or {}).items()}
+            return index.search(request['query'], request.get('limit'), priors, boosts)
+        if op == 'fuzzy_search':
+            index = self.steam_index
+            if index is None:
+                raise LookupError("no Steam index loaded")
+            return index.fuzzy_search(
+                request['query'], request['limit'], set(request['exclude']), request['time_budget']
+            )
+        if op == 'tier_get':
+            return list(self.tier_cache.get(request['appid'], request.get('stale_ok', False)))
+        if op == 'tier_put':
+            reports = request.get('reports')
+            self.tier_cache.put(request['appid'], request.get('tier'), reports, request.get('touch', True))
+            if reports:
+                self.priors[request['appid']] = popularity(reports)
+            return None
+        if op == 'tier_expiring':
+            return self.tier_cache.expiring(
+                request['within'], request['accessed_since'], request['limit'], request.get('include', [])
+            )
+        if op == 'shutdown':
+            # serve_forever() must be stopped from another thread
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return None
+        raise ValueError(f"unknown request {op!r}")
+
+    def _apply_skip_words(self, skip_words):
+        with self._lock:
+            index = self.steam_index
+            if skip_words is None or index is None or not index.set_skip_words(skip_words):
+                return
+            index.save(self.index_file, keep_backup=True)
+
+    def _status(self):
+        index = self.steam_index
+        return {
+            'apps': len(index) if index is not None else None,
+            'refreshed': index.refreshed if index is not None else None,
+            'tiers': len(self.tier_cache)
+        }
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = {'result': self.server.dispatch(json.loads(line))}
+            except Exception as e:
+                reply = {'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+
+class IndexClient:
+    """Connection to the index service, shared by the plugin's threads"""
+
+    def __init__(self, socket_path, timeout=2.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._socket = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def call(self, op, **params):
+        """Send a request and return its result
+
+        Raises ConnectionError if the service can't be reached and
+        RuntimeError if it reports an error.
+        """
+        params['op'] = op
+        message = json.dumps(params).encode('utf-8') + b'\n'
+        with self._lock:
+            try:
+                if self._socket is None:
+                    self._connect()
+                self._socket.sendall(message)
+                line = self._reader.readline()
+                if not line:
+                    raise ConnectionError("index service closed the connection")
+            except OSError as e:
+                self._close()
+                raise ConnectionError(f"index service unavailable: {e}") from e
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply['result']
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self._socket = sock
+        self._reader = sock.makefile('rb')
+
+    def _close(self):
+        if self._socket is not None:
+            self._reader.close()
+            self._socket.close()
+            self._socket = None
+            self._reader = None
+
+
+class RemoteSteamIndex:
+    """Stands in for a SteamIndex that lives in the index service
+
+    Only the best `limit` matches of a search are sent over the socket, and
+    the service ranks them with the report counts of its own tier cache.
+    """
+
+    def __init__(self, client, status, limit=50):
+        self.client = client
+        self.app_count = status['apps']
+        self.refreshed = status['refreshed']
+        self.limit = limit
+
+    def __len__(self):
+        return self.app_count
+
+    def search(self, query, limit=None, priors=None, boosts=None):
+        return self.client.call(
+            'search', query=query, limit=limit or self.limit,
+            popularity=priors is not None, boosts=boosts
+        )
+
+    def fuzzy_search(self, query, limit=5, exclude=(), time_budget=0.05):
+        return self.client.call(
+            'fuzzy_search', query=query, limit=limit, exclude=list(exclude), time_budget=time_budget
+        )
+
+
+class RemoteTierCache:
+    """Stands in for a TierCache that lives in the index service
+
+    If the service is unreachable lookups miss and stores are dropped, so
+    ratings are fetched from ProtonDB as if nothing was cached.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def __len__(self):
+        try:
+            return self.client.call('status')['tiers']
+        except (ConnectionError, RuntimeError):
+            return 0
+
+    def get(self, appid, stale_ok=False):
+        try:
+            hit, tier = self.client.call('tier_get', appid=appid, stale_ok=stale_ok)
+        except (ConnectionError, RuntimeError):
+            return False, None
+        return hit, tier
+
+    def put(self, appid, tier, reports=None, touch=True):
+        try:
+            self.client.call('tier_put', appid=appid, tier=tier, reports=reports, touch=touch)
+        except (ConnectionError, RuntimeError):
+            pass
+
+    def expiring(self, within, accessed_since, limit, include=()):
+        try:
+            return self.client.call(
+                'tier_expiring', within=within, accessed_since=accessed_since,
+                limit=limit, include=list(include)
+            )
+        except (ConnectionError, RuntimeError):
+            return []
+
+    def report_counts(self):
+        # Popularity is applied by the service itself
+        return {}
+
+    def close(self):
+        pass
+
+
+def start_index_service(socket_path, index_file, tier_file, tier_ttl, tier_max_entries):
+    """Start the service as a detached process (it outlives the plugin)"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index_daemon.py')
+    # Inside Albert sys.executable may be Albert itself
+    python = shutil.which('python3') or sys.executable
+    return subprocess.Popen(
+        [
+            python, script,
+            '--socket', socket_path,
+            '--index', index_file,
+            '--tiers', tier_file,
+            '--tier-ttl', str(tier_ttl),
+            '--tier-max-entries', str(tier_max_entries)
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+
+
+def wait_for_service(client, timeout=5.0):
+    """Wait until the service answers, returning its ping reply (or None)"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return client.call('ping')
+        except ConnectionError:
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="ProtonDB plugin index service")
+    parser.add_argument('--socket', required=True)
+    parser.add_argument('--index', required=True)
+    parser.add_argument('--tiers', required=True)
+    parser.add_argument('--tier-ttl', type=int, default=86400)
+    parser.add_argument('--tier-max-entries', type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    tier_cache = TierCache(args.tiers, args.tier_ttl, args.tier_max_entries)
+    server = IndexServer(args.socket, args.index, tier_cache)
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            os.remove(args.socket)
+        except OSError:
+            pass
+        tier_cache.close()
+    return 0
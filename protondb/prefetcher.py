@@ -0,0 +1,83 @@
+"""
+Background refresh of cached ProtonDB tiers
+
+Ratings the user is likely to look up again (recently viewed, popular or
+picked games) are fetched again shortly before they expire from the tier
+cache, so those lookups never have to wait for the network.
+"""
+
+import threading
+import time
+
+from .rate_limit import TokenBucket
+
+
+class TierPrefetcher:
+    """Refreshes soon-to-expire tiers on a background thread while Albert is idle
+
+    `candidates()` returns the appids to refresh and `refresh(appid,
+    should_continue)` fetches one of them. Refreshes only run once no query
+    has been seen (`touch`) for `idle_delay` seconds, at most `rate` per
+    second, and stop as soon as the prefetcher is paused or stopped.
+    """
+
+    def __init__(self, candidates, refresh, interval=300, idle_delay=5, rate=0.5):
+        self.candidates = candidates
+        self.refresh = refresh
+        self.interval = interval
+        self.idle_delay = idle_delay
+        self.rate_limiter = TokenBucket(rate=rate, capacity=1)
+        self.refreshed = 0
+        # Albert is busy starting up too
+        self._last_activity = time.monotonic()
+        self._paused = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="protondb-prefetch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Cancel the prefetcher, abandoning any refresh that is waiting"""
+        self._stopped.set()
+
+    def pause(self):
+        self._paused.set()
+
+    def resume(self):
+        self._paused.clear()
+
+    @property
+    def paused(self):
+        return self._paused.is_set()
+
+    def touch(self):
+        """Note user activity, postponing refreshes until Albert is idle again"""
+        self._last_activity = time.monotonic()
+
+    def _should_continue(self):
+        return not self._stopped.is_set() and not self._paused.is_set() and self._is_idle()
+
+    def _is_idle(self):
+        return time.monotonic() - self._last_activity >= self.idle_delay
+
+    def _wait_until_active(self):
+        """Block while paused or busy, returning False once stopped"""
+        while not self._stopped.is_set():
+            if not self._paused.is_set() and self._is_idle():
+                return True
+            self._stopped.wait(0.5)
+        return False
+
+    def _run(self):
+        while not self._stopped.is_set():
+            for appid in self.candidates():
+                if not self._wait_until_active():
+                    return
+                if not self.rate_limiter.acquire(self._should_continue):
+                    continue
+                self.refresh(appid, self._should_continue)
+                self.refreshed += 1
+            self._stopped.wait(self.interval)
@@ -0,0 +1,70 @@
+"""
+Relevance ranking for Steam name matches
+
+Matches are ranked by a sort key: an optional boost for titles the user has
+picked before, the match bucket (exact, prefix, substring), how well the query
+lines up with word boundaries in the name, an optional popularity prior and
+finally the name length. The caller buckets the matches (the Steam index
+knows from its sorted names which ones are exact or prefix matches) and
+only hands over the buckets that can make the cut; of those, only the best
+`limit` keys are selected (with a heap) instead of sorting every match.
+"""
+
+import heapq
+import math
+
+EXACT = 0
+PREFIX = 1
+CONTAINS = 2
+
+MATCH_TYPES = ('exact', 'startswith', 'contains')
+
+
+def match_bucket(norm_name, query):
+    """Return the match bucket of a normalized name containing the query"""
+    if norm_name == query:
+        return EXACT
+    return PREFIX if norm_name.startswith(query) else CONTAINS
+
+
+def word_score(norm_name, query):
+    """Score how a normalized name containing the query lines up with its words
+
+    Returns 2 if the query covers whole words of the name, 1 if it starts at
+    a word ("mesa" in "black mesa") and 0 if it only matches inside a word.
+    """
+    size = len(query)
+    position = norm_name.find(query)
+    best = 0
+    while position != -1:
+        if position == 0 or not norm_name[position - 1].isalnum():
+            if position + size >= len(norm_name) or not norm_name[position + size].isalnum():
+                return 2
+            best = 1
+        position = norm_name.find(query, position + 1)
+    return best
+
+
+def popularity(count):
+    """Turn a count (reports, selections) into a prior with diminishing returns"""
+    return math.log1p(count) if count and count > 0 else 0.0
+
+
+def rank(matches, norm_names, query, limit=None, prior=None, boost=None):
+    """Return (index, bucket) pairs of the best matches, best first
+
+    `matches` holds (bucket, index) pairs of names containing the query.
+    `prior`, if given, maps an index to a popularity score that ranks
+    matches of the same bucket and word score above less popular ones.
+    `boost` maps an index to a usage score; boosted matches come before
+    all others, highest score first.
+    """
+    keyed = []
+    for bucket, index in matches:
+        norm_name = norm_names[index]
+        keyed.append((
+            -boost(index) if boost else 0.0, bucket, -word_score(norm_name, query),
+            -prior(index) if prior else 0.0, len(norm_name), index
+        ))
+    best = heapq.nsmallest(limit, keyed) if limit is not None else sorted(keyed)
+    return [(key[-1], key[1]) for key in best]
@@ -0,0 +1,43 @@
+"""
+Rate limiting for the ProtonDB plugin's API requests
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter
+
+    Allows bursts of up to `capacity` requests and refills at `rate` tokens
+    per second, so parallel fetches stay within the same average request
+    rate as a serial loop with a fixed delay.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, should_continue=None):
+        """Block until a token is available and take it
+
+        If `should_continue` is given it is polled while waiting, and the
+        wait is abandoned (returning False) once it returns False.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if should_continue is not None:
+                if not should_continue():
+                    return False
+                wait = min(wait, 0.05)
+            time.sleep(wait)
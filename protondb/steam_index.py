@@ -0,0 +1,796 @@
+"""
+Steam app name index for the ProtonDB plugin
+
+Built once when the Steam app list is loaded so that exact, prefix and
+substring lookups don't have to scan every app on each keystroke.
+
+The index is stored in a compact binary snapshot (appid array, packed
+UTF-8 name blobs and the trigram postings) which is memory-mapped on
+load instead of being parsed, so startup doesn't materialize a dict per app.
+Snapshots carry a checksum and are replaced atomically, so a crash while
+saving never leaves a half-written index behind.
+"""
+
+import bisect
+import heapq
+import itertools
+import math
+import mmap
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+from .plugin_core.atomic_file import atomic_write
+from .ranking import CONTAINS, EXACT, MATCH_TYPES, PREFIX, match_bucket, rank
+
+# Default words marking entries that are not games (demos, trailers, etc.)
+SKIP_WORDS = ['demo', 'trailer', 'teaser', 'beta test', 'playtest']
+
+# With a limit, at most this many names merely containing the query are
+# ranked (the first ones found): common fragments like "ter" are in a tenth
+# of all names, and those matches only fill up the results of rare prefixes
+SUBSTRING_MATCHES = 1000
+
+# Queries shorter than a trigram rank at most this many of the names
+# starting with them (in sorted order), "st" starts thousands of names;
+# popular ones past these are ranked as well
+SHORT_PREFIX_MATCHES = 1000
+
+# Sorts after every character a normalized name can contain, so a query
+# followed by it bounds the names starting with the query
+_MAX_CHAR = '\U0010ffff'
+
+# Bits of the per-app flags section
+NON_GAME = 1  # name contains a skip word
+REMOVED = 2   # superseded or dropped by a merge, kept until the next compaction
+
+# Share of a query's trigrams a name must contain to be a fuzzy match
+FUZZY_THRESHOLD = 0.6
+
+# Merged indexes are rebuilt from scratch once this share of entries is dead
+COMPACT_RATIO = 0.2
+
+SNAPSHOT_MAGIC = b'PDBSTEAM'
+SNAPSHOT_VERSION = 4
+
+# magic, version, byte order, last refresh timestamp, app count, trigram count,
+# CRC32 of everything after the header
+_HEADER = struct.Struct('<8sIB3xdIII')
+_SECTION_COUNT = 15
+_SECTIONS = struct.Struct(f'<{_SECTION_COUNT}I')
+
+
+def normalize_name(name):
+    """Normalize a game name or query for matching"""
+    return name.lower().strip()
+
+
+def name_trigrams(text):
+    """Return the set of 3-character substrings of a normalized name"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def normalize_skip_words(skip_words):
+    """Normalize a configured skip word list, dropping empty entries"""
+    return [normalize_name(word) for word in skip_words if normalize_name(word)]
+
+
+def classify_non_games(norm_names, skip_words):
+    """Flag (NON_GAME) each normalized name containing one of the skip words"""
+    flags = bytearray(len(norm_names))
+    for index in range(len(norm_names)):
+        norm_name = norm_names[index]
+        if any(skip_word in norm_name for skip_word in skip_words):
+            flags[index] = NON_GAME
+    return flags
+
+
+def _uint_array(values=()):
+    """Create an unsigned 32-bit array (the snapshot's integer format)"""
+    return array('I', values)
+
+
+class PackedStrings:
+    """Sequence of strings stored as one UTF-8 blob plus an offset table"""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    @classmethod
+    def from_strings(cls, strings):
+        offsets = _uint_array([0])
+        chunks = []
+        total = 0
+        for text in strings:
+            encoded = text.encode('utf-8')
+            chunks.append(encoded)
+            total += len(encoded)
+            offsets.append(total)
+        return cls(memoryview(offsets), b''.join(chunks))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return str(self.blob[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+
+    def extended(self, strings):
+        """Return a copy with strings appended (the existing blob is copied once)"""
+        offsets = _uint_array()
+        offsets.frombytes(bytes(self.offsets))
+        total = offsets[-1]
+        chunks = [bytes(self.blob)]
+        for text in strings:
+            encoded = text.encode('utf-8')
+            chunks.append(encoded)
+            total += len(encoded)
+            offsets.append(total)
+        return PackedStrings(memoryview(offsets), b''.join(chunks))
+
+    def find_all(self, text):
+        """Yield indexes of strings containing text, searching the raw blob"""
+        encoded = text.encode('utf-8')
+        position = self.blob.find(encoded)
+        while position != -1:
+            index = bisect.bisect_right(self.offsets, position) - 1
+            end = self.offsets[index + 1]
+            if position + len(encoded) <= end:
+                yield index
+                position = self.blob.find(encoded, end)
+            else:
+                # Match spans two strings, retry from the next one
+                position = self.blob.find(encoded, end)
+
+
+class TrigramPostings:
+    """Sorted trigram keys mapped to sorted lists of app indexes
+
+    `by_suffix` holds the key positions sorted by the keys' last two
+    characters, so the trigrams ending with a bigram can be bisected too.
+    """
+
+    def __init__(self, keys, offsets, postings, by_suffix):
+        self.keys = keys
+        self.offsets = offsets
+        self.postings = postings
+        self.by_suffix = by_suffix
+        self._suffixes = _SortedView(keys, by_suffix, key=lambda trigram: trigram[1:])
+
+    @classmethod
+    def from_dict(cls, postings_by_trigram):
+        keys = sorted(postings_by_trigram)
+        offsets = _uint_array([0])
+        postings = _uint_array()
+        for key in keys:
+            postings.extend(postings_by_trigram[key])
+            offsets.append(len(postings))
+        return cls(
+            PackedStrings.from_strings(keys), memoryview(offsets), memoryview(postings), _suffix_order(keys)
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, trigram):
+        position = bisect.bisect_left(self.keys, trigram)
+        if position < len(self.keys) and self.keys[position] == trigram:
+            return self.postings[self.offsets[position]:self.offsets[position + 1]]
+        return None
+
+    def ending_with(self, bigram):
+        """Yield the app indexes in the postings of the trigrams ending with `bigram`, each once"""
+        seen = set()
+        position = bisect.bisect_left(self._suffixes, bigram)
+        while position < len(self.by_suffix) and self._suffixes[position] == bigram:
+            key = self.by_suffix[position]
+            for index in self.postings[self.offsets[key]:self.offsets[key + 1]]:
+                if index not in seen:
+                    seen.add(index)
+                    yield index
+            position += 1
+
+    def merged(self, additions):
+        """Return a copy with the postings in `additions` appended
+
+        `additions` maps trigrams to sorted app indexes that are all larger
+        than the existing ones, so each merged posting list stays sorted.
+        """
+        new_keys = sorted(additions)
+        keys = []
+        offsets = _uint_array([0])
+        postings = _uint_array()
+        position = 0
+        for key in new_keys:
+            # Copy the existing postings up to this key unchanged
+            end = bisect.bisect_left(self.keys, key, position)
+            for old in range(position, end):
+                keys.append(self.keys[old])
+                postings.frombytes(bytes(self.postings[self.offsets[old]:self.offsets[old + 1]]))
+                offsets.append(len(postings))
+            position = end
+            keys.append(key)
+            if position < len(self.keys) and self.keys[position] == key:
+                postings.frombytes(bytes(self.postings[self.offsets[position]:self.offsets[position + 1]]))
+                position += 1
+            postings.extend(additions[key])
+            offsets.append(len(postings))
+        for old in range(position, len(self.keys)):
+            keys.append(self.keys[old])
+            postings.frombytes(bytes(self.postings[self.offsets[old]:self.offsets[old + 1]]))
+            offsets.append(len(postings))
+        return TrigramPostings(
+            PackedStrings.from_strings(keys), memoryview(offsets), memoryview(postings), _suffix_order(keys)
+        )
+
+
+def _appid_order(appids):
+    """Return the app indexes sorted by appid"""
+    return memoryview(_uint_array(sorted(range(len(appids)), key=appids.__getitem__)))
+
+
+def _suffix_order(keys):
+    """Return the positions of the trigram `keys` sorted by their last two characters"""
+    return memoryview(_uint_array(sorted(range(len(keys)), key=lambda position: keys[position][1:])))
+
+
+class _SortedView:
+    """Read-only view of a sequence in the given sorted order (for bisect)
+
+    With a `key` function the view holds key(value) instead of the values.
+    """
+
+    def __init__(self, values, order, key=None):
+        self._values = values
+        self._order = order
+        self._key = key
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, position):
+        value = self._values[self._order[position]]
+        return self._key(value) if self._key else value
+
+
+class SteamIndex:
+    """Name index over the Steam app list
+
+    Apps are stored as parallel sequences (appid, name, normalized name).
+    Prefix lookups use the normalized names sorted once at build time and
+    substring lookups use a trigram posting list, so a query only touches
+    the apps that can actually match it. The indexes are also sorted by
+    appid (`by_appid`), so boosted apps are found without a search. Entries
+    that are not games are flagged once, for the skip words the index was
+    built with.
+
+    `refreshed` is the time the app list was last fetched from Steam; later
+    refreshes only merge in what changed since then (see `merge_apps`).
+    """
+
+    def __init__(self, appids, names, norm_names, order, by_appid, postings, skip_words, non_games,
+                 refreshed=None):
+        self.appids = appids
+        self.names = names
+        self.norm_names = norm_names
+        self.order = order
+        self.by_appid = by_appid
+        self.postings = postings
+        self.skip_words = list(skip_words)
+        self.non_games = non_games
+        self.refreshed = refreshed if refreshed is not None else time.time()
+        self._sorted_names = _SortedView(norm_names, order)
+        self._sorted_appids = _SortedView(appids, by_appid)
+        self._last_search = (None, None)
+        self._priors_seen = (None, None, 0)
+
+    @classmethod
+    def from_apps(cls, apps, progress=None, skip_words=SKIP_WORDS):
+        """Build the index from the `applist.apps` list of the Steam API
+
+        `apps` can be any iterable of app dicts, such as the stream of apps
+        parsed from a download, and is only iterated once. `progress`, if given, is called as progress(done, total) while the
+        trigram postings (the slow part) are built.
+        """
+        skip_words = normalize_skip_words(skip_words)
+        appids = _uint_array()
+        norm_names = []
+        # Display names are packed as they come in, `apps` may be a stream
+        name_offsets = _uint_array([0])
+        name_blob = bytearray()
+
+        for app in apps:
+            name = app.get('name')
+            if not name:
+                continue
+            norm_name = normalize_name(name)
+            if not norm_name:
+                continue
+            appids.append(app['appid'])
+            name_blob += name.encode('utf-8')
+            name_offsets.append(len(name_blob))
+            norm_names.append(norm_name)
+
+        order = _uint_array(sorted(range(len(norm_names)), key=norm_names.__getitem__))
+
+        postings = {}
+        total = len(norm_names)
+        for index, norm_name in enumerate(norm_names):
+            if progress and index % 16384 == 0:
+                progress(index, total)
+            for trigram in name_trigrams(norm_name):
+                posting = postings.get(trigram)
+                if posting is None:
+                    postings[trigram] = posting = _uint_array()
+                posting.append(index)
+
+        if progress:
+            progress(total, total)
+
+        return cls(
+            memoryview(appids),
+            PackedStrings(memoryview(name_offsets), name_blob),
+            PackedStrings.from_strings(norm_names),
+            memoryview(order),
+            _appid_order(appids),
+            TrigramPostings.from_dict(postings),
+            skip_words,
+            memoryview(classify_non_games(norm_names, skip_words))
+        )
+
+    def merge_apps(self, apps, complete=True, progress=None):
+        """Merge an updated app list into the index
+
+        New apps are appended and renamed apps are re-added under their new
+        name, with their old entry flagged REMOVED instead of rebuilding the
+        sorted order and postings. If `complete` is true `apps` is the whole
+        app list and apps missing from it are removed as well; otherwise it
+        only holds the apps changed since `refreshed`. Like for `from_apps`,
+        `apps` can be a stream.
+
+        Returns the merged index, or None if nothing changed. Once too many
+        entries are dead the index is compacted by building it from scratch.
+        """
+        live = {}
+        removed = 0
+        for index in range(len(self)):
+            if self.non_games[index] & REMOVED:
+                removed += 1
+            else:
+                live[self.appids[index]] = index
+
+        superseded = set()
+        added = []
+        seen = set()
+        for app in apps:
+            name = app.get('name')
+            if not name or not normalize_name(name):
+                continue
+            appid = app['appid']
+            if appid in seen:
+                continue
+            seen.add(appid)
+            index = live.get(appid)
+            if index is not None:
+                if self.names[index] == name:
+                    continue
+                superseded.add(index)
+            added.append((appid, name))
+
+        if complete:
+            superseded.update(index for appid, index in live.items() if appid not in seen)
+
+        if not added and not superseded:
+            return None
+
+        if removed + len(superseded) > COMPACT_RATIO * (len(self) + len(added)):
+            # Dead entries would slow every lookup down, start over
+            added_appids = {appid for appid, _ in added}
+            kept = [
+                {'appid': appid, 'name': self.names[index]}
+                for appid, index in live.items()
+                if index not in superseded and appid not in added_appids
+            ]
+            kept += [{'appid': appid, 'name': name} for appid, name in added]
+            return SteamIndex.from_apps(kept, progress, self.skip_words)
+
+        first = len(self)
+        new_names = [name for _, name in added]
+        new_norm_names = [normalize_name(name) for name in new_names]
+
+        appids = _uint_array()
+        appids.frombytes(bytes(self.appids))
+        appids.extend(appid for appid, _ in added)
+        names = self.names.extended(new_names)
+        norm_names = self.norm_names.extended(new_norm_names)
+
+        flags = bytearray(self.non_games)
+        for index in superseded:
+            flags[index] |= REMOVED
+        flags += classify_non_games(new_norm_names, self.skip_words)
+
+        # Insert the new apps into the sorted order
+        new_order = sorted(range(len(added)), key=new_norm_names.__getitem__)
+        order = _uint_array()
+        position = 0
+        for offset in new_order:
+            end = bisect.bisect_left(self._sorted_names, new_norm_names[offset], position)
+            order.frombytes(bytes(self.order[position:end]))
+            order.append(first + offset)
+            position = end
+        order.frombytes(bytes(self.order[position:]))
+
+        additions = {}
+        for offset, norm_name in enumerate(new_norm_names):
+            if progress and offset % 16384 == 0:
+                progress(offset, len(new_norm_names))
+            for trigram in name_trigrams(norm_name):
+                posting = additions.get(trigram)
+                if posting is None:
+                    additions[trigram] = posting = _uint_array()
+                posting.append(first + offset)
+        postings = self.postings.merged(additions)
+
+        if progress:
+            progress(len(new_norm_names), len(new_norm_names))
+
+        return SteamIndex(
+            memoryview(appids), names, norm_names, memoryview(order), _appid_order(appids),
+            postings, self.skip_words, memoryview(flags)
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a binary snapshot written by `save`
+
+        Raises ValueError if the file is not a snapshot of the current version
+        or is damaged (truncated or failing its checksum).
+        """
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(buffer) < _HEADER.size + _SECTIONS.size:
+            raise ValueError("Steam index snapshot is truncated")
+
+        magic, version, big_endian, refreshed, app_count, trigram_count, checksum = \
+            _HEADER.unpack_from(buffer, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("Not a Steam index snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported Steam index snapshot version {version}")
+        if big_endian != (sys.byteorder == 'big'):
+            raise ValueError("Steam index snapshot was written with a different byte order")
+        if zlib.crc32(memoryview(buffer)[_HEADER.size:]) != checksum:
+            raise ValueError("Steam index snapshot checksum mismatch")
+
+        lengths = _SECTIONS.unpack_from(buffer, _HEADER.size)
+        view = memoryview(buffer)
+        sections = []
+        position = _HEADER.size + _SECTIONS.size
+        for length in lengths:
+            if position + length > len(buffer):
+                raise ValueError("Steam index snapshot is truncated")
+            sections.append((position, position + length))
+            position += length + (-length % 4)
+
+        def uint_section(number):
+            start, end = sections[number]
+            return view[start:end].cast('I')
+
+        def blob_section(number):
+            # The mmap itself is used so that find() works on the raw bytes
+            start, end = sections[number]
+            return _BlobSlice(buffer, start, end)
+
+        appids = uint_section(0)
+        names = PackedStrings(uint_section(1), blob_section(2))
+        norm_names = PackedStrings(uint_section(3), blob_section(4))
+        order = uint_section(5)
+        by_appid = uint_section(6)
+        postings = TrigramPostings(
+            PackedStrings(uint_section(7), blob_section(8)),
+            uint_section(9),
+            uint_section(10),
+            uint_section(11)
+        )
+        skip_words = PackedStrings(uint_section(12), bytes(blob_section(13)))
+        start, end = sections[14]
+        non_games = view[start:end]
+
+        if (len(appids) != app_count or len(names) != app_count or len(norm_names) != app_count
+                or len(order) != app_count or len(by_appid) != app_count or len(non_games) != app_count
+                or len(postings) != trigram_count or len(postings.by_suffix) != trigram_count):
+            raise ValueError("Steam index snapshot sections are inconsistent")
+
+        skip_words = [skip_words[i] for i in range(len(skip_words))]
+        return cls(
+            appids, names, norm_names, order, by_appid, postings, skip_words, non_games, refreshed=refreshed
+        )
+
+    def save(self, path, keep_backup=False):
+        """Atomically write the index as a binary snapshot that `load` can memory-map
+
+        With `keep_backup` the snapshot being replaced is kept as the last
+        good copy.
+        """
+        sections = [
+            self.appids,
+            self.names.offsets, self.names.blob,
+            self.norm_names.offsets, self.norm_names.blob,
+            self.order, self.by_appid,
+            self.postings.keys.offsets, self.postings.keys.blob,
+            self.postings.offsets, self.postings.postings, self.postings.by_suffix
+        ]
+        skip_words = PackedStrings.from_strings(self.skip_words)
+        sections += [skip_words.offsets, skip_words.blob, self.non_games]
+        sections = [bytes(section) for section in sections]
+
+        body = [_SECTIONS.pack(*(len(section) for section in sections))]
+        for section in sections:
+            body.append(section)
+            body.append(b'\0' * (-len(section) % 4))
+        checksum = 0
+        for chunk in body:
+            checksum = zlib.crc32(chunk, checksum)
+
+        header = _HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, sys.byteorder == 'big',
+            self.refreshed, len(self), len(self.postings), checksum
+        )
+        atomic_write(path, [header] + body, keep_backup)
+
+    def __len__(self):
+        return len(self.appids)
+
+    def set_skip_words(self, skip_words):
+        """Re-flag non-game entries if the skip words changed
+
+        Returns True if the flags were recomputed (and the snapshot should
+        be saved again).
+        """
+        skip_words = normalize_skip_words(skip_words)
+        if skip_words == self.skip_words:
+            return False
+        flags = classify_non_games(self.norm_names, skip_words)
+        for index, flag in enumerate(self.non_games):
+            if flag & REMOVED:
+                flags[index] |= REMOVED
+        self.skip_words = skip_words
+        self.non_games = memoryview(flags)
+        self._last_search = (None, None)
+        self._priors_seen = (None, None, 0)
+        return True
+
+    def search(self, query, limit=None, priors=None, boosts=None):
+        """Search for games matching the query
+
+        Returns game dicts ranked by `ranking.rank`: exact matches first,
+        then names starting with the query, then names containing it, with
+        matches on word boundaries, popular apps (`priors` maps appids to
+        popularity scores) and shorter names first within each. Apps in
+        `boosts` (appids to usage scores) come before everything else. With
+        a `limit` only that many of the best matches are returned, and names
+        merely containing the query are only looked at when there are fewer
+        exact and prefix matches than that.
+        """
+        query_lower = normalize_name(query)
+        if not query_lower:
+            return []
+
+        prior = None
+        if priors:
+            prior = lambda index: priors.get(self.appids[index], 0.0)
+        boost = None
+        boosted = set()
+        if boosts:
+            boost = lambda index: boosts.get(self.appids[index], 0.0)
+            boosted = self._indexes_of(boosts)
+        ranked = rank(
+            self._matches(query_lower, limit, boosted, priors), self.norm_names, query_lower, limit, prior, boost
+        )
+        return [self._game(index, MATCH_TYPES[bucket]) for index, bucket in ranked]
+
+    def fuzzy_search(self, query, limit=5, exclude=(), time_budget=0.05):
+        """Find names sharing most of the query's trigrams despite typos
+
+        Catches queries like "witcher3" or "baldurs gate" that are not
+        substrings of any name. A name sharing `FUZZY_THRESHOLD` of the
+        query's trigrams must contain one of its rarest trigrams, so only
+        those posting lists are scanned for candidates; the others are
+        checked by bisecting. Gives up after `time_budget` seconds, returning
+        the best matches found so far. Apps in `exclude` (appids) are skipped.
+        """
+        trigrams = name_trigrams(normalize_name(query))
+        if len(trigrams) < 2:
+            return []
+        deadline = time.perf_counter() + time_budget
+        needed = math.ceil(len(trigrams) * FUZZY_THRESHOLD)
+        postings = sorted((self.postings.get(trigram) or () for trigram in trigrams), key=len)
+        rare, common = postings[:len(postings) - needed + 1], postings[len(postings) - needed + 1:]
+
+        shared = {}
+        checked = 0
+        for posting in rare:
+            for index in posting:
+                shared[index] = shared.get(index, 0) + 1
+                checked += 1
+                if checked % 256 == 0 and time.perf_counter() > deadline:
+                    break
+            else:
+                continue
+            break
+
+        scored = []
+        for index, count in shared.items():
+            checked += 1
+            if checked % 256 == 0 and time.perf_counter() > deadline:
+                break
+            for posting in common:
+                position = bisect.bisect_left(posting, index)
+                if position < len(posting) and posting[position] == index:
+                    count += 1
+            if count < needed or self._is_skipped(index) or self.appids[index] in exclude:
+                continue
+            scored.append((-count, self.names.offsets[index + 1] - self.names.offsets[index], index))
+
+        return [self._game(index, 'fuzzy') for _, _, index in heapq.nsmallest(limit, scored)]
+
+    def _matches(self, query_lower, limit=None, boosted=(), priors=None):
+        """Return (bucket, index) pairs of the games whose normalized name contains the query
+
+        Exact and prefix matches are a range of the sorted names, found by
+        bisecting. Names that only contain the query are enumerated only if
+        those don't fill `limit`. With a limit, queries shorter than a
+        trigram take at most SHORT_PREFIX_MATCHES prefix matches, plus any
+        further ones with a prior (`priors` maps appids to popularity), and
+        at most SUBSTRING_MATCHES substring matches are taken. Boosted apps
+        (`boosted` indexes) rank first whatever their bucket, so they are
+        checked directly instead.
+        """
+        matches = []
+        for index in boosted:
+            norm_name = self.norm_names[index]
+            if query_lower in norm_name:
+                matches.append((match_bucket(norm_name, query_lower), index))
+
+        start = bisect.bisect_left(self._sorted_names, query_lower)
+        end = bisect.bisect_left(self._sorted_names, query_lower + _MAX_CHAR, start)
+        capped_end = end
+        if limit is not None and len(query_lower) < 3:
+            capped_end = min(end, start + SHORT_PREFIX_MATCHES)
+        # Prefix matches of the query's length are exact matches
+        length = len(query_lower.encode('utf-8'))
+        offsets = self.norm_names.offsets
+        for position in range(start, capped_end):
+            index = self.order[position]
+            if not self._is_skipped(index) and index not in boosted:
+                matches.append((EXACT if offsets[index + 1] - offsets[index] == length else PREFIX, index))
+
+        if priors and capped_end < end:
+            # Popular names sorting past the cap would outrank most of those
+            # within it, so they are added too
+            rest = self.order[capped_end:end]
+            flags = self._prior_flags(priors)
+            for index in itertools.compress(rest, map(flags.__getitem__, rest)):
+                if priors.get(self.appids[index], 0.0) > 0 and not self._is_skipped(index) and index not in boosted:
+                    matches.append((EXACT if offsets[index + 1] - offsets[index] == length else PREFIX, index))
+
+        if limit is None or len(matches) < limit:
+            for index in self._substring_matches(query_lower, limit is not None):
+                if index not in boosted:
+                    matches.append((CONTAINS, index))
+        return matches
+
+    def _substring_matches(self, query_lower, capped=False):
+        """Yield indexes of the games whose normalized name contains the query without starting with it
+
+        Stops after SUBSTRING_MATCHES if `capped`. Past a name's first
+        character a two-character query always ends one of its trigrams, so
+        the postings of the trigrams ending with it hold every such name;
+        single characters search the packed names blob directly. Longer
+        queries only need the rarest trigram's posting list verified, and
+        once it has been the games containing the query are remembered: when
+        the next query contains this one (typically the user typing one more
+        character) only those need to be checked instead.
+        """
+        if len(query_lower) == 1:
+            candidates = self.norm_names.find_all(query_lower)
+        elif len(query_lower) == 2:
+            candidates = self.postings.ending_with(query_lower)
+        else:
+            last_query, last_matches = self._last_search
+            if last_query is not None and last_query in query_lower:
+                candidates = last_matches
+            else:
+                candidates = None
+                for trigram in name_trigrams(query_lower):
+                    posting = self.postings.get(trigram)
+                    if not posting:
+                        return
+                    if candidates is None or len(posting) < len(candidates):
+                        candidates = posting
+
+        matches = _uint_array()
+        found = 0
+        for index in candidates:
+            if self._is_skipped(index):
+                continue
+            norm_name = self.norm_names[index]
+            if query_lower not in norm_name:
+                continue
+            matches.append(index)
+            if not norm_name.startswith(query_lower):
+                yield index
+                found += 1
+                if capped and found >= SUBSTRING_MATCHES:
+                    # Incomplete, so not remembered
+                    return
+        if len(query_lower) >= 3:
+            # Replaced as a whole so concurrent queries never see a mismatched pair
+            self._last_search = (query_lower, matches)
+
+    def _indexes_of(self, appids):
+        """Return the indexes of the games with the given appids"""
+        indexes = set()
+        for appid in appids:
+            position = bisect.bisect_left(self._sorted_appids, appid)
+            while position < len(self.by_appid) and self._sorted_appids[position] == appid:
+                if not self._is_skipped(self.by_appid[position]):
+                    indexes.add(self.by_appid[position])
+                position += 1
+        return indexes
+
+    def _prior_flags(self, priors):
+        """Return a bytearray flagging the indexes of the games in `priors`
+
+        Priors only grow (each tier fetched adds its app) and dicts keep
+        their insertion order, so the flags are kept from one search to the
+        next and only the appids added since are looked up.
+        """
+        cached, flags, seen = self._priors_seen
+        if cached is not priors or len(priors) < seen:
+            flags, seen = bytearray(len(self.appids)), 0
+        # Copied in one go, other threads add priors while searches run
+        added = list(itertools.islice(priors, seen, None))
+        for index in self._indexes_of(added):
+            flags[index] = 1
+        # Replaced as a whole so concurrent searches never see a mismatched triple
+        self._priors_seen = (priors, flags, seen + len(added))
+        return flags
+
+    def _is_skipped(self, index):
+        """Check whether an app is obviously not a game (demos, trailers, etc.) or was removed"""
+        return self.non_games[index]
+
+    def _game(self, index, match_type):
+        name = self.names[index]
+        return {
+            'name': name,
+            'appid': self.appids[index],
+            'name_length': len(name),
+            'match_type': match_type
+        }
+
+
+class _BlobSlice:
+    """A region of a memory-mapped file that supports slicing and find()"""
+
+    def __init__(self, buffer, start, end):
+        self._buffer = buffer
+        self._start = start
+        self._end = end
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __bytes__(self):
+        return self._buffer[self._start:self._end]
+
+    def __getitem__(self, item):
+        return self._buffer[self._start + item.start:self._start + item.stop]
+
+    def find(self, sub, start=0):
+        position = self._buffer.find(sub, self._start + start, self._end)
+        return position - self._start if position != -1 else -1
@@ -6,15 +6,28 @@ This script tests the plugin functionality outside of Albert
 to verify the ProtonDB search and parsing works correctly.
 """
 
+import json
+import shutil
 import sys
+import tempfile
+import threading
+import time
 from pathlib import Path
 
-# Add the plugin directory to Python path
+import requests
+
+# Add the plugins directory to Python path so the plugin imports as a package
 plugin_dir = Path(__file__).parent
-sys.path.insert(0, str(plugin_dir))
+sys.path.insert(0, str(plugin_dir.parent))
+
+# Each run gets its own data directory, so no state is left over from the last one
+DATA_DIR = Path(tempfile.mkdtemp(prefix='albert-protondb-test-'))
 
 # Mock Albert module for testing
 class MockAlbert:
+    # Where plugins keep their data, see use_data_dir()
+    data_location = DATA_DIR
+
     class StandardItem:
         def __init__(self, id, text, subtext, iconUrls=None, actions=None):
             self.id = id
@@ -39,6 +52,7 @@ class MockAlbert:
         def __init__(self, string):
             self.string = string
             self.items = []
+            self.isValid = True
 
         def add(self, item):
             self.items.append(item)
@@ -48,7 +62,7 @@ class MockAlbert:
             pass
 
         def dataLocation(self):
-            return Path('/tmp/albert_test_data')
+            return MockAlbert.data_location
 
     class TriggerQueryHandler:
         pass
@@ -82,12 +96,40 @@ sys.modules['albert'] = MockAlbert()
 
 # Now import our plugin
 try:
-    from __init__ import Plugin
+    from protondb import Plugin
+    from protondb.app_list import iter_steam_apps
+    from protondb.benchmark import (
+        check_short_prefixes, keystroke_corpus, measure_latency, percentiles, short_prefixes, synthetic_apps
+    )
+    from protondb.index_service import RemoteSteamIndex
+    from protondb.plugin_core.atomic_file import backup_path, load_json, write_json
+    from protondb.plugin_core.connectivity import Connectivity
+    from protondb.plugin_core.http import HttpClient, Offline
+    from protondb.plugin_core.metrics import Metrics
+    from protondb.plugin_core.profiler import QueryProfiler
+    from protondb.plugin_core.query_cache import QueryCache
+    from protondb.plugin_core.usage_store import UsageStore
+    from protondb.prefetcher import TierPrefetcher
+    from protondb.ranking import popularity
+    from protondb.steam_index import SHORT_PREFIX_MATCHES, SUBSTRING_MATCHES, SteamIndex
+    from protondb.tier_cache import TierCache
+    from protondb.tier_import import import_tiers
+    from mock_api import FaultProfile, MockAPIServer
     print("✓ Plugin imported successfully")
 except ImportError as e:
     print(f"✗ Failed to import plugin: {e}")
     sys.exit(1)
 
+def use_data_dir(data_dir):
+    """Make plugins created from now on keep their data in data_dir"""
+    data_dir.mkdir(parents=True, exist_ok=True)
+    # Requests are answered by fake sessions, so don't let the plugin go
+    # offline when the test machine has no network
+    write_json(str(data_dir / 'config.json'), {'offline_mode': False})
+    MockAlbert.data_location = data_dir
+
+use_data_dir(DATA_DIR)
+
 def test_plugin_basic():
     """Test basic plugin functionality"""
     print("\n=== Testing Basic Plugin Functionality ===")
@@ -132,7 +174,11 @@ def test_game_search():
     """Test actual game search (requires internet)"""
     print("\n=== Testing Game Search ===")
 
+    # Not the small test indexes saved by the other tests
+    use_data_dir(DATA_DIR / 'game_search')
     plugin = Plugin()
+    # The whole Steam game list is downloaded first
+    plugin._steam_index_thread.join(timeout=300)
 
     # Test with a popular game
     test_games = ["cyberpunk", "witcher", "doom"]
@@ -151,7 +197,9 @@ def test_game_search():
                 if item.actions:
                     print(f"    Actions: {[a.text for a in item.actions]}")
 
-            if query.items and "error" not in query.items[0].id:
+            if query.items and query.items[0].id in ("protondb_loading", "protondb_no_steam_data"):
+                print(f"⚠ Search for '{game}' skipped: the Steam game list isn't available")
+            elif query.items and "error" not in query.items[0].id:
                 print(f"✓ Search for '{game}' successful")
             else:
                 print(f"⚠ Search for '{game}' returned error or no results")
@@ -181,6 +229,35 @@ def test_caching():
     else:
         print("⚠ Cache not populated (may be due to no results)")
 
+def test_query_cache():
+    """Test the bounded query result cache"""
+    print("\n=== Testing Query Cache ===")
+
+    cache = QueryCache(timeout=60, max_entries=3)
+    for key in ("a", "b", "c"):
+        cache.put(key, [{'name': key}])
+    assert cache.get("a") == [{'name': "a"}]  # "a" is now most recently used
+    cache.put("d", [])
+    assert "b" not in cache and "a" in cache
+    assert cache.get("missing") is None
+
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1 and stats['evictions'] == 1
+
+    # Byte limit and expiry
+    cache = QueryCache(timeout=0, max_bytes=1024)
+    cache.put("big", "x" * 4096)
+    assert "big" not in cache
+    cache.put("small", "x")
+    assert cache.get("small") is None and len(cache) == 0
+
+    # Expired entries can be kept around as a fallback
+    cache = QueryCache(timeout=0, stale_timeout=60)
+    cache.put("old", [1])
+    assert cache.get("old") is None
+    assert cache.get_stale("old") == [1]
+    print("✓ Query cache evicts and expires correctly")
+
 def test_rating_system():
     """Test rating system and visual indicators"""
     print("\n=== Testing Rating System ===")
@@ -194,6 +271,1045 @@ def test_rating_system():
     assert len(plugin.ratings) == 6  # platinum, gold, silver, bronze, borked, pending
     print("✓ All rating types defined correctly")
 
+def test_steam_index():
+    """Test the Steam name index against a small app list"""
+    print("\n=== Testing Steam Index ===")
+
+    apps = [
+        {'appid': 1, 'name': 'Half-Life'},
+        {'appid': 2, 'name': 'Half-Life 2'},
+        {'appid': 3, 'name': 'Half-Life 2 Demo'},
+        {'appid': 4, 'name': 'Black Mesa: Half-Life Remake'},
+        {'appid': 5, 'name': 'Portal'},
+        {'appid': 6, 'name': ''},
+        {'appid': 7, 'name': 'HALF-LIFE'},
+    ]
+    index = SteamIndex.from_apps(apps)
+
+    results = index.search("half-life")
+    assert [game['appid'] for game in results] == [1, 7, 2, 4]
+    assert [game['match_type'] for game in results] == ['exact', 'exact', 'startswith', 'contains']
+
+    # Short queries fall back to scanning but give the same buckets
+    assert [game['appid'] for game in index.search("po")] == [5]
+    assert {game['appid'] for game in index.search("al")} == {1, 2, 4, 5, 7}
+    assert index.search("missing game") == []
+
+    # Refining the previous query only checks its matches but finds the same games
+    index.search("half")
+    assert index.search("half-life 2") == SteamIndex.from_apps(apps).search("half-life 2")
+    assert [game['appid'] for game in index.search("life")] == [1, 7, 2, 4]
+
+    # The memory-mapped snapshot answers the same as the built index
+    snapshot_file = DATA_DIR / 'test_steamapi.bin'
+    snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+    index.save(snapshot_file)
+    loaded = SteamIndex.load(snapshot_file)
+    assert len(loaded) == len(index)
+    assert loaded.search("half-life") == results
+    assert loaded.search("po") == index.search("po")
+    assert loaded.search("al") == index.search("al")
+
+    # Non-game flags follow the configured skip words
+    assert loaded.set_skip_words(['demo', 'trailer', 'teaser', 'beta test', 'playtest']) is False
+    assert loaded.set_skip_words(['remake'])
+    assert [game['appid'] for game in loaded.search("half-life")] == [1, 7, 2, 3]
+    print("✓ Steam index matches correctly")
+
+def test_steam_index_merge():
+    """Test merging an updated app list into an existing index"""
+    print("\n=== Testing Steam Index Merge ===")
+
+    apps = [
+        {'appid': 1, 'name': 'Half-Life'},
+        {'appid': 2, 'name': 'Half-Life 2'},
+        {'appid': 4, 'name': 'Black Mesa'},
+        {'appid': 5, 'name': 'Portal'},
+    ] + [{'appid': 100 + i, 'name': f"Filler {i}"} for i in range(20)]
+    snapshot_file = DATA_DIR / 'test_steamapi.bin'
+    snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+    SteamIndex.from_apps(apps).save(snapshot_file)
+    index = SteamIndex.load(snapshot_file)
+
+    assert index.merge_apps(apps) is None
+
+    # A renamed app, a removed app and a new app, merged without rebuilding
+    updated = [dict(app) for app in apps if app['appid'] != 5]
+    updated[2]['name'] = 'Black Mesa: Half-Life Remake'
+    updated.append({'appid': 3, 'name': 'Half-Life: Alyx'})
+    merged = index.merge_apps(updated)
+    assert len(merged) == len(index) + 2
+    expected = SteamIndex.from_apps(updated)
+    for term in ("half", "half-life", "mesa", "portal", "al", "filler 1"):
+        assert sorted(game['appid'] for game in merged.search(term)) == \
+            sorted(game['appid'] for game in expected.search(term)), term
+    # Boosts find the renamed app's new entry, not the removed one
+    assert [game['appid'] for game in merged.search("half-life", 1, boosts={4: 1.0})] == [4]
+    assert [game['name'] for game in merged.search("mesa", boosts={4: 1.0})] == ['Black Mesa: Half-Life Remake']
+
+    # Partial updates don't drop the apps they leave out
+    changes = merged.merge_apps([{'appid': 6, 'name': 'Portal 2'}], complete=False)
+    assert [game['appid'] for game in changes.search("portal")] == [6]
+    assert len(changes.search("half-life")) == 4
+
+    # The merged index survives a snapshot round trip and skip word changes
+    changes.save(snapshot_file)
+    loaded = SteamIndex.load(snapshot_file)
+    assert loaded.search("half-life") == changes.search("half-life")
+    assert loaded.set_skip_words(['alyx'])
+    assert [game['appid'] for game in loaded.search("black mesa")] == [4]
+    assert [game['appid'] for game in loaded.search("portal")] == [6]
+
+    # Dropping most apps compacts the index instead
+    compacted = loaded.merge_apps(apps[:2])
+    assert len(compacted) == 2
+    print("✓ Steam index merges app list updates")
+
+def test_ranking():
+    """Test word-boundary scoring, popularity priors and top-k selection"""
+    print("\n=== Testing Ranking ===")
+
+    apps = [
+        {'appid': 1, 'name': 'Portals of Phereon'},
+        {'appid': 2, 'name': 'Portal 2'},
+        {'appid': 3, 'name': 'Teleportal'},
+        {'appid': 4, 'name': 'The Portal Within'},
+        {'appid': 5, 'name': 'Portal Knights'},
+    ]
+    index = SteamIndex.from_apps(apps)
+
+    # Whole-word matches rank above longer words, word starts above mid-word
+    assert [game['appid'] for game in index.search("portal")] == [2, 5, 1, 4, 3]
+    assert [game['match_type'] for game in index.search("portal")] == \
+        ['startswith', 'startswith', 'startswith', 'contains', 'contains']
+
+    # The top-k selection returns the same head as the full ranking
+    assert index.search("portal", limit=2) == index.search("portal")[:2]
+
+    # Popular apps win among equally good matches
+    priors = {5: popularity(1200), 2: popularity(30)}
+    assert [game['appid'] for game in index.search("portal", priors=priors)][:2] == [5, 2]
+
+    # Report counts from ProtonDB summaries feed the priors
+    cache_file = DATA_DIR / 'test_ranking_tiers.sqlite'
+    cache_file.unlink(missing_ok=True)
+    cache = TierCache(str(cache_file), ttl=60, max_entries=10)
+    cache.put(5, 'gold', 1200)
+    cache.put(2, None)
+    assert cache.report_counts() == {5: 1200}
+    cache.close()
+    print("✓ Matches ranked by word boundaries and popularity")
+
+def test_search_limits():
+    """Test that searches with a limit only rank the matches that can make the cut"""
+    print("\n=== Testing Search Limits ===")
+
+    apps = [{'appid': 1, 'name': 'St'}, {'appid': 2, 'name': 'Stardew Valley'}]
+    apps += [{'appid': 100 + n, 'name': f'Star {n:04}'} for n in range(SHORT_PREFIX_MATCHES + 100)]
+    apps += [{'appid': 5000 + n, 'name': f'Lost {n:04}'} for n in range(SUBSTRING_MATCHES + 100)]
+    index = SteamIndex.from_apps(apps)
+
+    # Enough prefix matches, so substring matches aren't looked up at all
+    assert len(index.search("los", 5)) == 5
+    assert index._last_search == (None, None)
+
+    # Short queries only rank the first prefix matches, but boosted apps are checked directly
+    assert len(index._matches("st", 5)) == SHORT_PREFIX_MATCHES
+    assert [game['appid'] for game in index.search("st", 2)] == [1, 100]
+    assert [game['appid'] for game in index.search("st", 2, boosts={2: 1.0})] == [2, 1]
+    assert len(index.search("st")) == len(apps)
+
+    # Popular apps sorting past the cap are ranked too
+    priors = {2: popularity(100), 5000: popularity(100)}
+    assert [game['appid'] for game in index.search("st", 2, priors)] == [1, 2]
+    assert [game['appid'] for game in index.search("sta", 2, priors)] == [2, 100]
+    priors.update({5001 + n: popularity(1) for n in range(SUBSTRING_MATCHES)})
+    assert [game['appid'] for game in index.search("st", 2, priors)] == [1, 2]
+    assert len(index._matches("st", 5, priors=priors)) == SHORT_PREFIX_MATCHES + 1
+    # Priors added since the last search count too
+    priors[100 + SHORT_PREFIX_MATCHES + 50] = popularity(1000)
+    assert [game['appid'] for game in index.search("st", 2, priors)] == [1, 100 + SHORT_PREFIX_MATCHES + 50]
+
+    # Longer prefixes are ranked in full
+    assert [game['appid'] for game in index.search("sta", 1, priors={2: popularity(100)})] == [2]
+
+    # Substring matches are capped too, and a capped lookup isn't remembered for the next query
+    assert len(index._matches("ost", 5)) == SUBSTRING_MATCHES
+    assert index._last_search == (None, None)
+    assert len(index.search("ost")) == SUBSTRING_MATCHES + 100
+    assert index._last_search[0] == "ost"
+    print("✓ Limited searches rank a bounded number of matches")
+
+def test_usage_ranking():
+    """Test that picked games are remembered and ranked first"""
+    print("\n=== Testing Usage Ranking ===")
+
+    usage_file = DATA_DIR / 'test_usage.json'
+    usage_file.unlink(missing_ok=True)
+    store = UsageStore(str(usage_file), half_life=10)
+    store.record(5)
+    store.record(5)
+    store.record(7)
+    assert store.top(1) == [(5, None)]
+    assert 1.9 < store.score(5) <= 2.0
+    assert UsageStore(str(usage_file)).scores().keys() == {5, 7}
+
+    # Picks decay with the half-life
+    store._entries[7]['updated'] -= 10
+    assert 0.49 < store.score(7) < 0.51
+
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.usage_store = UsageStore(str(usage_file))
+    plugin.tier_cache = None
+    plugin.steam_index = SteamIndex.from_apps([
+        {'appid': 2, 'name': 'Portal 2'},
+        {'appid': 3, 'name': 'Teleportal'},
+    ])
+    assert [game['appid'] for game in plugin._search_steam_games("portal")] == [2, 3]
+
+    # Running any of the item's actions records the pick
+    item = plugin._make_result_item({'appid': 3, 'name': 'Teleportal', 'rating': 'gold'})
+    item.actions[0].callback()
+    assert plugin.usage_store.score(3) > 0
+    assert [game['appid'] for game in plugin._search_steam_games("portal")] == [3, 2]
+    plugin.usage_ranking = False
+    assert [game['appid'] for game in plugin._search_steam_games("portal")] == [2, 3]
+    plugin.finalize()
+
+    print("✓ Picked games ranked first")
+
+def test_fuzzy_search():
+    """Test typo-tolerant matching of Steam titles"""
+    print("\n=== Testing Fuzzy Search ===")
+
+    apps = [
+        {'appid': 292030, 'name': 'The Witcher 3: Wild Hunt'},
+        {'appid': 1086940, 'name': "Baldur's Gate 3"},
+        {'appid': 20900, 'name': 'The Witcher: Enhanced Edition'},
+        {'appid': 400, 'name': 'Portal'},
+        {'appid': 401, 'name': 'Portal Demo'},
+    ] + [{'appid': 1000 + i, 'name': f"Filler Game {i}"} for i in range(200)]
+    index = SteamIndex.from_apps(apps)
+
+    assert index.search("witcher3") == []
+    assert [game['appid'] for game in index.fuzzy_search("witcher3")] == [292030, 20900]
+    assert [game['appid'] for game in index.fuzzy_search("baldurs gate")] == [1086940]
+    assert [game['match_type'] for game in index.fuzzy_search("portl")] == ['fuzzy']
+    assert index.fuzzy_search("witcher3", exclude={292030})[0]['appid'] == 20900
+    assert index.fuzzy_search("xyzzy quux") == []
+    assert index.fuzzy_search("po") == []
+
+    # Only used once Albert enables fuzzy matching for the handler
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.steam_index = index
+    assert plugin.supportsFuzzyMatching()
+    assert plugin._search_steam_games("baldurs gate") == []
+    plugin.setFuzzyMatching(True)
+    assert [game['appid'] for game in plugin._search_steam_games("baldurs gate")] == [1086940]
+    assert [game['match_type'] for game in plugin._search_steam_games("portal")] == ['exact']
+    assert [game['appid'] for game in plugin._search_steam_games("portl")] == [400]
+    plugin.finalize()
+    print("✓ Fuzzy search finds misspelled titles")
+
+def test_benchmark_harness():
+    """Test the pieces of the offline search benchmark"""
+    print("\n=== Testing Benchmark Harness ===")
+
+    apps = synthetic_apps(2000, seed=1)
+    assert len(apps) == 2000
+    assert apps == synthetic_apps(2000, seed=1)
+    assert len({app['appid'] for app in apps}) == 2000
+    assert keystroke_corpus(["Hades"], ["hdes"]) == ["ha", "had", "hade", "hades", "hd", "hde", "hdes"]
+    stats = percentiles([float(value) for value in range(1, 101)])
+    assert stats['p50'] == 51 and stats['p95'] == 96 and stats['p99'] == 100
+
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.steam_index = SteamIndex.from_apps(apps)
+    samples = measure_latency(plugin._search_steam_games, keystroke_corpus(["Hades"]), rounds=2)
+    assert len(samples) == 8 and all(sample >= 0 for sample in samples)
+    assert plugin._search_steam_games("hades")[0]['name'] == "Hades"
+
+    # Queries under 3 characters get their own latency budget
+    assert short_prefixes(["Hades", "Half-Life 2", "Portal"]) == ["ha", "po"]
+    samples = measure_latency(plugin._search_steam_games, short_prefixes(), rounds=1)
+    results = {'latency_ms': {'short_prefix': percentiles(samples)}}
+    assert check_short_prefixes(results, budget=1000) is None
+    assert "short_prefix" in check_short_prefixes(results, budget=0)
+    plugin.finalize()
+    print("✓ Synthetic app list, keystroke corpus and percentiles work")
+
+def test_background_loading():
+    """Test that the Steam index loads on a background thread"""
+    print("\n=== Testing Background Loading ===")
+
+    data_dir = DATA_DIR
+    data_dir.mkdir(parents=True, exist_ok=True)
+    for name in ('steamapi.bin', 'steamapi.bin.bak', 'steamapi.json'):
+        (data_dir / name).unlink(missing_ok=True)
+    with open(data_dir / 'steamapi.json', 'w', encoding='utf-8') as f:
+        json.dump({'applist': {'apps': [{'appid': 620, 'name': 'Portal 2'}]}}, f)
+
+    plugin = Plugin()
+    query = MockAlbert.Query("portal")
+    plugin.handleTriggerQuery(query)
+    print(f"First query while loading: {query.items[0].text}")
+
+    plugin._steam_index_thread.join(timeout=30)
+    assert not plugin._is_steam_index_loading()
+    assert len(plugin.steam_index) == 1
+    assert plugin.steam_index_progress == 100
+    assert (data_dir / 'steamapi.bin').exists()
+    print("✓ Steam index loaded in the background")
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data or {}
+
+    def json(self):
+        return self._data
+
+class FakeStreamResponse:
+    """Streamed response whose body arrives in small chunks"""
+
+    def __init__(self, body, chunk_size=7):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.headers = {'Content-Length': str(len(body))}
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=None):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+    def close(self):
+        self.closed = True
+
+class StreamSession:
+    """Stands in for requests.Session, serving one app list body"""
+
+    def __init__(self, body, chunk_size=64):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.responses = []
+
+    def get(self, url, timeout=None, **kwargs):
+        response = FakeStreamResponse(self.body, self.chunk_size)
+        self.responses.append(response)
+        return response
+
+    def close(self):
+        pass
+
+def test_streamed_app_list():
+    """Test that the Steam app list is parsed while it downloads"""
+    print("\n=== Testing Streamed App List ===")
+
+    apps = [{'appid': 620, 'name': 'Portal 2'}, {'appid': 70, 'name': 'Half-Life "Uplink" \u00e9'}]
+    body = json.dumps({'applist': {'apps': apps}}, indent=2).encode('utf-8')
+    for size in (1, 5, 64):
+        assert list(iter_steam_apps(body[i:i + size] for i in range(0, len(body), size))) == apps
+    try:
+        list(iter_steam_apps([body[:-20]]))
+        assert False, "truncated app list was accepted"
+    except ValueError:
+        pass
+
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.steam_index = None
+    plugin.http.session = StreamSession(body, chunk_size=7)
+    plugin._download_steam_api_data()
+    assert plugin.http.session.responses[0].closed
+    assert [game['appid'] for game in plugin.steam_index.search("half-life")] == [70]
+    assert plugin.steam_index_progress == 100
+    print("✓ Steam app list parsed from the download stream")
+
+class FakeSession:
+    """Stands in for requests.Session, answering ProtonDB summaries after a delay"""
+
+    def __init__(self, tiers, delay=0.2):
+        self.tiers = tiers
+        self.delay = delay
+        self.requests = []
+
+    def get(self, url, timeout=None, **kwargs):
+        self.requests.append(url)
+        time.sleep(self.delay)
+        appid = int(url.rsplit('/', 1)[-1].split('.')[0])
+        if appid in self.tiers:
+            return FakeResponse(200, {'tier': self.tiers[appid]})
+        return FakeResponse(404)
+
+    def close(self):
+        pass
+
+def test_concurrent_ratings():
+    """Test that ProtonDB summaries are fetched in parallel and keep their order"""
+    print("\n=== Testing Concurrent Ratings ===")
+
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.http.session = FakeSession({1: 'gold', 2: 'platinum', 4: 'borked', 5: 'silver'})
+    plugin.tier_cache = None
+    games = [{'appid': appid, 'name': f"Game {appid}"} for appid in range(1, 6)]
+
+    start_time = time.time()
+    results = plugin._get_protondb_ratings(games)
+    elapsed = time.time() - start_time
+
+    assert [game['appid'] for game in results] == [1, 2, 4, 5]
+    assert [game['rating'] for game in results] == ['gold', 'platinum', 'borked', 'silver']
+    assert elapsed < 0.6, f"fetching took {elapsed:.2f}s"
+    print(f"✓ Fetched {len(games)} ratings in {elapsed:.2f}s")
+
+def test_query_cancellation():
+    """Test that ratings for a superseded query are abandoned"""
+    print("\n=== Testing Query Cancellation ===")
+
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.http.session = FakeSession({1: 'gold'}, delay=0.5)
+    plugin.tier_cache = None
+    query = MockAlbert.Query("game")
+    threading.Timer(0.1, lambda: setattr(query, 'isValid', False)).start()
+
+    start_time = time.time()
+    results = plugin._get_protondb_ratings([{'appid': 1, 'name': "Game 1"}, {'appid': 2, 'name': "Game 2"}], query)
+    elapsed = time.time() - start_time
+
+    assert results is None
+    assert elapsed < 0.4, f"cancellation took {elapsed:.2f}s"
+    print(f"✓ Stale query abandoned after {elapsed:.2f}s")
+
+def test_progressive_results():
+    """Test that cached ratings are shown before fetched ones arrive"""
+    print("\n=== Testing Progressive Results ===")
+
+    cache_file = DATA_DIR / 'test_progressive_tiers.sqlite'
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    cache_file.unlink(missing_ok=True)
+
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.steam_index = SteamIndex.from_apps([
+        {'appid': 1, 'name': 'Portal'},
+        {'appid': 2, 'name': 'Portal 2'},
+        {'appid': 3, 'name': 'Portal Stories: Mel'},
+    ])
+    plugin.debounce_delay = 0
+    plugin.tier_cache = TierCache(str(cache_file), ttl=60, max_entries=10)
+    plugin.tier_cache.put(3, 'gold')
+    plugin.http.session = FakeSession({1: 'platinum', 2: 'platinum'}, delay=0.3)
+
+    added_at = []
+    query = MockAlbert.Query("portal")
+    original_add = query.add
+    def timed_add(item):
+        added_at.append((item.id, time.time()))
+        original_add(item)
+    query.add = timed_add
+
+    start_time = time.time()
+    plugin.handleTriggerQuery(query)
+
+    ids = [item_id for item_id, _ in added_at]
+    assert ids == ["protondb_3", "protondb_1", "protondb_2", "protondb_more"] or \
+        ids == ["protondb_3", "protondb_2", "protondb_1", "protondb_more"]
+    assert added_at[0][1] - start_time < 0.1
+    # The whole result is cached in ranking order
+    assert [game['appid'] for game in plugin.search_cache.get("portal")] == [1, 2, 3]
+    plugin.finalize()
+    print("✓ Cached rating shown first, fetched ratings streamed in")
+
+def test_metrics():
+    """Test per-stage latency metrics and the hidden :stats query"""
+    print("\n=== Testing Metrics ===")
+
+    metrics = Metrics(window=100)
+    for value in range(1, 201):
+        metrics.record('stage', float(value))
+    with metrics.span('timed'):
+        time.sleep(0.01)
+    metrics.count('hits')
+    snapshot = metrics.snapshot(extra=1)
+    # Percentiles cover the last `window` samples, the count all of them
+    assert snapshot['stages_ms']['stage'] == {'count': 200, 'p50': 151, 'p95': 196, 'p99': 200, 'max': 200}
+    assert snapshot['stages_ms']['timed']['p50'] >= 10
+    assert snapshot['counters'] == {'hits': 1} and snapshot['extra'] == 1
+
+    metrics_file = DATA_DIR / 'test_metrics.json'
+    metrics_file.unlink(missing_ok=True)
+    cache_file = DATA_DIR / 'test_metrics_tiers.sqlite'
+    cache_file.unlink(missing_ok=True)
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.steam_index = SteamIndex.from_apps([{'appid': 1, 'name': 'Portal'}])
+    plugin.tier_cache = TierCache(str(cache_file), ttl=60, max_entries=10)
+    plugin.tier_cache.put(1, 'gold')
+    plugin.diagnostics.metrics_file = str(metrics_file)
+    plugin.diagnostics.dump = True
+    plugin.diagnostics._dumped = float('-inf')
+    plugin.handleTriggerQuery(MockAlbert.Query("portal"))
+    plugin.handleTriggerQuery(MockAlbert.Query("portal"))
+    # Written when due
+    dumped, _ = load_json(str(metrics_file))
+    assert dumped['stages_ms']['query']['count'] == 1
+    assert dumped['counters']['tier_cache_hits'] == 1
+
+    query = MockAlbert.Query(":stats")
+    plugin.handleTriggerQuery(query)
+    ids = [item.id for item in query.items]
+    assert ids[0] == "protondb_stats_caches"
+    assert "queries 50%, ratings 100%" in query.items[0].text
+    for stage in ('query', 'cache_lookup', 'index_search', 'tier_lookup', 'items'):
+        assert f"protondb_stats_{stage}" in ids, stage
+    # The diagnostics query itself isn't measured
+    assert plugin.metrics.snapshot()['stages_ms']['query']['count'] == 2
+    plugin.finalize()
+    assert load_json(str(metrics_file))[0]['stages_ms']['query']['count'] == 2
+    print("✓ Stage latencies measured and shown by :stats")
+
+def test_profiler():
+    """Test profiling the next N queries"""
+    print("\n=== Testing Query Profiler ===")
+    import pstats
+    import shutil
+    import tracemalloc
+
+    profiles = DATA_DIR / 'test_profiles'
+    shutil.rmtree(profiles, ignore_errors=True)
+    profiler = QueryProfiler(str(profiles), queries=2)
+    for _ in range(3):
+        with profiler.profile("query"):
+            data = [str(i) for i in range(10000)]
+    # Only the next 2, and tracemalloc stops after the last one
+    assert len(profiler.written) == 2 and not profiler.armed
+    assert not tracemalloc.is_tracing()
+    for base in profiler.written:
+        pstats.Stats(base + '.prof')
+        tracemalloc.Snapshot.load(base + '.snapshot')
+        assert "test_plugin.py" in Path(base + '.txt').read_text()
+
+    # A query arriving while another is profiled runs normally
+    profiler.arm(2)
+    with profiler.profile("outer"):
+        with profiler.profile("inner"):
+            pass
+    assert len(profiler.written) == 3 and profiler.remaining == 1
+    profiler.arm(0)
+    assert not tracemalloc.is_tracing()
+
+    # A directory that can't be written to costs the profile, not the query
+    blocked = profiles / 'blocked'
+    blocked.write_text("not a directory")
+    profiler = QueryProfiler(str(blocked), queries=1)
+    with profiler.profile("query"):
+        result = sum(range(1000))
+    assert result == 499500 and profiler.written == [] and not profiler.armed
+    assert not tracemalloc.is_tracing()
+
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.steam_index = SteamIndex.from_apps([{'appid': 1, 'name': 'Portal'}])
+    plugin.progressive_results = False
+    plugin.diagnostics.profiler = QueryProfiler(str(profiles / 'plugin'))
+    query = MockAlbert.Query(":profile 1")
+    plugin.handleTriggerQuery(query)
+    assert query.items[0].id == "protondb_profile"
+    query.items[0].actions[0].callback()
+    plugin.handleTriggerQuery(MockAlbert.Query("portal"))
+    plugin.handleTriggerQuery(MockAlbert.Query("portal 2"))
+    assert len(plugin.diagnostics.profiler.written) == 1
+    assert "_handle_query" in Path(plugin.diagnostics.profiler.written[0] + '.txt').read_text()
+    plugin.finalize()
+    del data
+    print("✓ The next N queries are profiled into the data directory")
+
+def test_tier_cache():
+    """Test the persistent per-appid tier cache"""
+    print("\n=== Testing Tier Cache ===")
+
+    cache_file = DATA_DIR / 'test_tiers.sqlite'
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    cache_file.unlink(missing_ok=True)
+
+    cache = TierCache(str(cache_file), ttl=60, max_entries=10)
+    for appid in range(12):
+        cache.put(appid, 'gold')
+    cache.put(100, None)
+    assert len(cache) <= 10
+    assert cache.get(0) == (False, None)  # least recently used, evicted
+    assert cache.get(11) == (True, 'gold')
+    assert cache.get(100) == (True, None)
+    cache.close()
+
+    # Entries survive reopening but expire after the TTL
+    cache = TierCache(str(cache_file), ttl=0, max_entries=10)
+    assert cache.get(11) == (False, None)
+    cache.close()
+
+    # Repeat lookups are served without touching the network
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.tier_cache = TierCache(str(cache_file), ttl=60, max_entries=10)
+    plugin.http.session = FakeSession({1: 'gold', 3: 'silver'}, delay=0)
+    games = [{'appid': appid, 'name': f"Game {appid}"} for appid in (1, 2, 3)]
+    first = plugin._get_protondb_ratings(games)
+    requests_made = len(plugin.http.session.requests)
+    second = plugin._get_protondb_ratings(games)
+    assert first == second
+    assert len(plugin.http.session.requests) == requests_made
+    plugin.finalize()
+    print("✓ Tier cache stores, evicts and expires correctly")
+
+def test_tier_import():
+    """Test bulk importing a ProtonDB dump into the tier cache"""
+    print("\n=== Testing Tier Import ===")
+
+    import gzip
+    import subprocess
+
+    data_dir = DATA_DIR / 'tier_import'
+    data_dir.mkdir(parents=True, exist_ok=True)
+    cache_file = data_dir / 'tiers.sqlite'
+    cache_file.unlink(missing_ok=True)
+
+    summaries = data_dir / 'summaries.json'
+    summaries.write_text(json.dumps({
+        "620": {"tier": "platinum", "total": 812},
+        "70": {"tier": "Gold", "total": 40},
+        "bogus": {"tier": "gold"},
+    }))
+    cache = TierCache(str(cache_file), ttl=60, max_entries=1)
+    assert import_tiers(cache, str(summaries)) == 2
+    assert cache.get(620) == (True, 'platinum')
+    assert cache.get(70) == (True, 'gold')
+    assert cache.get(10) == (False, None)
+    assert cache.report_counts() == {620: 812, 70: 40}
+    # Fetched tiers take precedence, imported ones are never evicted
+    cache.put(620, 'gold', 900)
+    assert cache.get(620) == (True, 'gold')
+    assert cache.report_counts()[620] == 900
+    cache.put(1, 'silver')
+    cache.put(2, 'silver')
+    assert cache.get(620) == (True, 'platinum')  # evicted, the snapshot answers
+    assert cache.get(70) == (True, 'gold')
+
+    # Raw reports get the median rating, JSON lines and gzip are accepted
+    reports = data_dir / 'reports.jsonl.gz'
+    lines = [
+        {"app": {"steam": {"appId": "570"}}, "rating": rating}
+        for rating in ("Gold", "Borked", "Platinum")
+    ] + [{"appId": 440, "tier": "silver"}]
+    reports.write_bytes(gzip.compress("\n".join(json.dumps(line) for line in lines).encode()))
+    assert import_tiers(cache, str(reports)) == 2
+    assert cache.get(570) == (True, 'gold')
+    assert cache.get(440) == (True, 'silver')
+    assert cache.get(70) == (False, None)  # replaced by the new import
+    cache.close()
+
+    # The command line entry point works without Albert
+    result = subprocess.run(
+        [sys.executable, str(plugin_dir / 'import_tiers.py'), str(summaries), '--tiers', str(cache_file)],
+        capture_output=True, text=True, timeout=30
+    )
+    assert result.returncode == 0, result.stderr
+    assert "Imported 2" in result.stdout
+
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.tier_cache = TierCache(str(cache_file), ttl=60, max_entries=10)
+    plugin.http.session = FakeSession({}, delay=0)
+    assert plugin._get_protondb_rating(70) == 'gold'
+    assert plugin.http.session.requests == []
+    plugin.finalize()
+    print("✓ Imported tiers answer lookups without requests")
+
+class FailingSession:
+    """Stands in for requests.Session when the network is down"""
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, timeout=None, **kwargs):
+        self.requests.append(url)
+        raise requests.ConnectionError("Network is unreachable")
+
+    def close(self):
+        pass
+
+def test_offline_mode():
+    """Test that offline, cached ratings are served without waiting on the network"""
+    print("\n=== Testing Offline Mode ===")
+
+    import socket
+
+    # The probe connects to the API host
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+    port = listener.getsockname()[1]
+    connectivity = Connectivity('127.0.0.1', port, probe_interval=0)
+    assert connectivity.probe()
+    connectivity.report_failure()
+    deadline = time.time() + 2
+    while not connectivity.online and time.time() < deadline:
+        time.sleep(0.02)
+    assert connectivity.online  # probed again in the background
+    listener.close()
+    assert not connectivity.probe()
+    assert not Connectivity('127.0.0.1', port, mode=True).online
+
+    # Listeners hear about changes until the tracker is stopped
+    changes = []
+    connectivity = Connectivity('127.0.0.1', port)
+    connectivity.add_listener(changes.append)
+    connectivity.report_success()
+    connectivity.report_failure()
+    connectivity.report_success()
+    assert changes == [False, True]
+    connectivity.stop()
+    connectivity.report_failure()
+    assert changes == [False, True]
+    assert not connectivity.online and not connectivity._probing
+
+    # The plugin's prefetcher is paused while ProtonDB is unreachable
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.connectivity.mode = 'auto'
+    assert plugin.prefetcher is not None and not plugin.prefetcher.paused
+    plugin.connectivity.report_failure()
+    assert plugin.prefetcher.paused
+    plugin.connectivity.report_success()
+    assert not plugin.prefetcher.paused
+    plugin.finalize()
+    assert plugin.connectivity._stopped
+
+    cache_file = DATA_DIR / 'test_offline_tiers.sqlite'
+    cache_file.unlink(missing_ok=True)
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.steam_index = SteamIndex.from_apps([
+        {'appid': 1, 'name': 'Portal'},
+        {'appid': 2, 'name': 'Portal 2'},
+    ])
+    plugin.tier_cache = TierCache(str(cache_file), ttl=60, max_entries=10)
+    plugin.tier_cache.put(1, 'gold')
+    plugin.tier_cache._conn.execute("UPDATE tiers SET fetched_at = fetched_at - 120")
+    plugin.http.session = FailingSession()
+
+    # A failed request marks the plugin offline and the expired tier is used
+    plugin.connectivity = plugin.http.connectivity = Connectivity('127.0.0.1', port)
+    start_time = time.time()
+    assert plugin._get_protondb_rating(1) == 'gold'
+    assert len(plugin.http.session.requests) == 1
+    assert not plugin.connectivity.online
+    # Later lookups don't try the network at all
+    assert plugin._get_protondb_rating(2) is None
+    assert len(plugin.http.session.requests) == 1
+
+    query = MockAlbert.Query("portal")
+    plugin.handleTriggerQuery(query)
+    assert [item.id for item in query.items] == ["protondb_1", "protondb_offline", "protondb_more"]
+    assert time.time() - start_time < 1
+    assert "portal" not in plugin.search_cache  # asked again once back online
+
+    # Configured offline, the network is never used
+    plugin.connectivity = plugin.http.connectivity = Connectivity('127.0.0.1', port, mode=True)
+    plugin.http.session = FakeSession({2: 'platinum'}, delay=0)
+    assert plugin._get_protondb_rating(2) is None
+    assert plugin.http.session.requests == []
+    plugin.finalize()
+    print("✓ Offline lookups served from the cache without requests")
+
+def test_mock_api():
+    """Test the plugin against the local API stand-in with injected faults"""
+    print("\n=== Testing Against the Mock API ===")
+
+    # More than `rate_limit` requests within a second are throttled
+    faults = FaultProfile(rate_limit=2)
+    assert [faults.draw()[1] for _ in range(3)] == [None, None, 429]
+
+    cache_file = DATA_DIR / 'test_mock_tiers.sqlite'
+    cache_file.unlink(missing_ok=True)
+    server = MockAPIServer(faults=FaultProfile(latency=0.05, jitter=0.05, throttle_rate=0.3, seed=3))
+    url = server.start()
+    try:
+        plugin = Plugin()
+        plugin.pdb_api = f"{url}/api/v1/reports/summaries/"
+        plugin.tier_cache = TierCache(str(cache_file), ttl=60, max_entries=100)
+        appids = [620, 400, 292030, 1245620, 1086940, 1091500, 413150, 1145360, 220, 570, 12345]
+        games = [{'appid': appid, 'name': f"Game {appid}"} for appid in appids]
+
+        start_time = time.time()
+        first = plugin._get_protondb_ratings(games)
+        elapsed = time.time() - start_time
+        served = server.stats['protondb_summary']
+        assert sum(served.values()) == len(appids)
+        throttled = served.get('429', 0)
+        assert throttled > 0
+        # Throttled lookups are left out and not cached, the 404 (unless the
+        # lookup for it was the one throttled, which depends on thread order) is
+        assert len(first) == len(appids) - served.get('404', 0) - throttled
+        assert elapsed < 3, f"fetching took {elapsed:.2f}s"
+
+        # Only the throttled ones are asked for again
+        plugin._get_protondb_ratings(games)
+        assert sum(server.stats['protondb_summary'].values()) == len(appids) + throttled
+        plugin.finalize()
+    finally:
+        server.stop()
+    print(f"✓ {len(appids)} lookups in {elapsed:.2f}s with {throttled} throttled")
+
+def test_crash_safe_files():
+    """Test that damaged data files fall back to their last good copy"""
+    print("\n=== Testing Crash-Safe Data Files ===")
+
+    data_dir = DATA_DIR
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    # A snapshot failing its checksum is rejected, its backup is used instead
+    snapshot_file = data_dir / 'test_crash.bin'
+    for path in (snapshot_file, Path(backup_path(snapshot_file))):
+        path.unlink(missing_ok=True)
+    SteamIndex.from_apps([{'appid': 10, 'name': 'Counter-Strike'}]).save(snapshot_file, keep_backup=True)
+    SteamIndex.from_apps([{'appid': 20, 'name': 'Team Fortress'}]).save(snapshot_file, keep_backup=True)
+    data = bytearray(snapshot_file.read_bytes())
+    data[-5] ^= 0xFF
+    snapshot_file.write_bytes(data)
+    try:
+        SteamIndex.load(snapshot_file)
+        assert False, "damaged snapshot was accepted"
+    except ValueError:
+        pass
+    snapshot_file.write_bytes(data[:len(data) // 2])
+    try:
+        SteamIndex.load(snapshot_file)
+        assert False, "truncated snapshot was accepted"
+    except ValueError:
+        pass
+    assert SteamIndex.load(backup_path(snapshot_file)).search("counter")[0]['appid'] == 10
+
+    plugin = Plugin()
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.steam_index_file = str(snapshot_file)
+    assert plugin._load_steam_index_snapshot().search("counter")[0]['appid'] == 10
+
+    # A corrupt config.json is read from its last good copy
+    config_file = data_dir / 'test_config.json'
+    write_json(config_file, {'cache_timeout': 42})
+    assert load_json(config_file) == ({'cache_timeout': 42}, False)
+    config_file.write_text('{"cache_timeout": 4')
+    assert load_json(config_file) == ({'cache_timeout': 42}, True)
+
+    # A damaged tier cache is moved aside and started over
+    tier_file = data_dir / 'test_crash_tiers.sqlite'
+    for suffix in ('', '-wal', '-shm', '.corrupt'):
+        Path(f"{tier_file}{suffix}").unlink(missing_ok=True)
+    tier_file.write_bytes(b'not a database' * 100)
+    cache = TierCache(str(tier_file), ttl=60, max_entries=10)
+    cache.put(1, 'gold')
+    assert cache.get(1) == (True, 'gold')
+    assert Path(f"{tier_file}.corrupt").exists()
+    cache.close()
+
+    # Concurrent writers each use their own temporary file
+    writes_dir = data_dir / 'concurrent_writes'
+    writes_dir.mkdir(exist_ok=True)
+    shared_file = writes_dir / 'shared.json'
+    errors = []
+
+    def write_many(writer):
+        try:
+            for count in range(50):
+                write_json(str(shared_file), {'writer': writer, 'count': count})
+        except Exception as e:
+            errors.append(e)
+
+    writers = [threading.Thread(target=write_many, args=(writer,)) for writer in range(4)]
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    assert errors == []
+    assert load_json(str(shared_file))[0]['count'] == 49
+
+    usage_file = writes_dir / 'usage.json'
+    store = UsageStore(str(usage_file))
+    pickers = [threading.Thread(target=lambda base=base: [store.record(base + i) for i in range(25)]) for base in (0, 100, 200)]
+    for thread in pickers:
+        thread.start()
+    for thread in pickers:
+        thread.join()
+    # The last write saved every pick
+    assert len(UsageStore(str(usage_file))) == 75
+    assert sorted(path.name for path in writes_dir.iterdir()) == [
+        'shared.json', 'shared.json.bak', 'usage.json', 'usage.json.bak'
+    ]
+    print("✓ Damaged data files fall back to their last good copy")
+
+def test_index_service():
+    """Test sharing the Steam index and tier cache through the index service"""
+    print("\n=== Testing Index Service ===")
+
+    service_dir = DATA_DIR / 'index_service'
+    service_dir.mkdir(parents=True, exist_ok=True)
+    for path in service_dir.iterdir():
+        path.unlink()
+    body = json.dumps({'applist': {'apps': [
+        {'appid': 620, 'name': 'Portal 2'}, {'appid': 400, 'name': 'Portal'}
+    ]}}).encode('utf-8')
+
+    def service_plugin():
+        plugin = Plugin()
+        plugin._steam_index_thread.join(timeout=30)
+        plugin.steam_index = None
+        plugin.steam_index_file = str(service_dir / 'steamapi.bin')
+        plugin.steam_api_file = str(service_dir / 'steamapi.json')
+        plugin.tier_cache_file = str(service_dir / 'tiers.sqlite')
+        plugin.index_service = True
+        plugin.index_socket = str(service_dir / 'index.sock')
+        plugin._open_tier_cache()
+        return plugin
+
+    # The service starts without an index, so the first plugin downloads
+    # the app list (from a stand-in session) and hands it over
+    first = service_plugin()
+    first.http.session = StreamSession(body)
+    first._start_steam_index_loader()
+    first._steam_index_thread.join(timeout=30)
+    try:
+        assert isinstance(first.steam_index, RemoteSteamIndex)
+        assert [game['appid'] for game in first._search_steam_games("portal")] == [400, 620]
+        first.tier_cache.put(620, 'platinum')
+
+        # A reloaded plugin only connects to the running service
+        second = service_plugin()
+        second.http.session = StreamSession(b'')
+        second._start_steam_index_loader()
+        second._steam_index_thread.join(timeout=30)
+        assert isinstance(second.steam_index, RemoteSteamIndex)
+        assert len(second.steam_index) == 2
+        assert second.tier_cache.get(620) == (True, 'platinum')
+        assert second._get_protondb_rating(620) == 'platinum'
+        second.finalize()
+    finally:
+        first.index_client.call('shutdown')
+        first.finalize()
+    print("✓ Index service shared between plugin instances")
+
+def test_plugin_core():
+    """Test the shared core: lazy imports and the HTTP client"""
+    print("\n=== Testing Shared Plugin Core ===")
+    import subprocess
+
+    # Neither plugin imports requests until it makes a request
+    stub = (
+        "import sys, types; albert = types.ModuleType('albert'); "
+        "albert.PluginInstance = type('PluginInstance', (), {}); "
+        "albert.TriggerQueryHandler = type('TriggerQueryHandler', (), {}); sys.modules['albert'] = albert; "
+        f"sys.path.insert(0, {str(plugin_dir.parent)!r}); "
+    )
+    for plugin in ('protondb', 'movies'):
+        result = subprocess.run(
+            [sys.executable, '-c', stub + f"import {plugin}; print('requests' in sys.modules)"],
+            capture_output=True, text=True, timeout=60
+        )
+        assert result.stdout.strip() == 'False', (plugin, result.stdout, result.stderr)
+
+    metrics = Metrics()
+    connectivity = Connectivity('127.0.0.1', mode='auto')
+    client = HttpClient({'User-Agent': 'test'}, connect_timeout=1, connectivity=connectivity, metrics=metrics)
+    assert client._session is None
+    assert client.session.headers['User-Agent'] == 'test'
+
+    client.session = FakeSession({1: 'gold'}, delay=0)
+    response = client.get('https://example.invalid/1.json', timeout=5, stage='http_test')
+    assert response.status_code == 200
+    assert metrics.snapshot()['counters'] == {'http_test_200': 1}
+    assert metrics.snapshot()['stages_ms']['http_test']['count'] == 1
+
+    # Failing to connect raises Offline and marks the host offline
+    client.session = FailingSession()
+    try:
+        client.get('https://example.invalid/1.json', timeout=5)
+        assert False, "expected Offline"
+    except Offline:
+        pass
+    assert not connectivity._online
+    connectivity.mode = True
+    try:
+        client.get('https://example.invalid/1.json', timeout=5)
+        assert False, "expected Offline"
+    except Offline:
+        pass
+    assert len(client.session.requests) == 1
+    print("✓ requests is imported lazily and the HTTP client tracks connectivity")
+
+def test_prefetcher():
+    """Test that viewed tiers are refreshed in the background before they expire"""
+    print("\n=== Testing Tier Prefetcher ===")
+
+    cache_file = DATA_DIR / 'test_prefetch_tiers.sqlite'
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    cache_file.unlink(missing_ok=True)
+
+    cache = TierCache(str(cache_file), ttl=100, max_entries=10)
+    cache.put(1, 'silver', 10)
+    cache.put(2, 'gold', 500)
+    cache.put(3, 'gold')
+    cache.put(4, 'bronze')
+    now = time.time()
+    # 1 and 2 expire soon, 3 is fresh, 4 expires soon but wasn't viewed lately
+    cache._conn.execute("UPDATE tiers SET fetched_at = ? WHERE appid IN (1, 2, 4)", (now - 95,))
+    cache._conn.execute("UPDATE tiers SET accessed_at = ? WHERE appid = 4", (now - 7200,))
+    assert cache.expiring(within=10, accessed_since=3600, limit=10) == [2, 1]
+    assert cache.expiring(within=10, accessed_since=3600, limit=10, include=[4]) == [2, 1, 4]
+
+    plugin = Plugin()
+    # Stop the plugin's own index loader and prefetcher from making requests
+    plugin._steam_index_thread.join(timeout=30)
+    plugin.finalize()
+    plugin.tier_cache = cache
+    plugin.tier_cache_ttl = 100
+    plugin.prefetch_recent_days = 1 / 24
+    plugin.usage_store = None
+    plugin.http.session = FakeSession({1: 'gold', 2: 'platinum'}, delay=0)
+    prefetcher = TierPrefetcher(
+        plugin._prefetch_candidates, plugin._refresh_protondb_rating, interval=60, idle_delay=0, rate=100
+    )
+
+    # Nothing is fetched while paused
+    prefetcher.pause()
+    prefetcher.start()
+    time.sleep(0.3)
+    assert plugin.http.session.requests == []
+
+    prefetcher.resume()
+    deadline = time.time() + 5
+    while prefetcher.refreshed < 2 and time.time() < deadline:
+        time.sleep(0.05)
+    assert sorted(plugin.http.session.requests) == [f"{plugin.pdb_api}{appid}.json" for appid in (1, 2)]
+    assert cache.get(1) == (True, 'gold')
+    assert cache.get(2) == (True, 'platinum')
+    # Refreshed entries are fresh again and refreshing didn't count as a view
+    assert cache.expiring(within=10, accessed_since=3600, limit=10) == []
+    row = cache._conn.execute("SELECT accessed_at FROM tiers WHERE appid = 4").fetchone()
+    assert row[0] < now - 3600
+
+    prefetcher.stop()
+    prefetcher._thread.join(timeout=2)
+    assert not prefetcher._thread.is_alive()
+    cache.close()
+    print("✓ Expiring tiers refreshed while idle, paused and stopped on request")
+
 def run_all_tests():
     """Run all tests"""
     print("ProtonDB Plugin Test Suite")
@@ -204,6 +1320,29 @@ def run_all_tests():
         test_empty_query()
         test_short_query()
         test_rating_system()
+        test_query_cache()
+        test_steam_index()
+        test_steam_index_merge()
+        test_ranking()
+        test_search_limits()
+        test_usage_ranking()
+        test_fuzzy_search()
+        test_benchmark_harness()
+        test_background_loading()
+        test_streamed_app_list()
+        test_concurrent_ratings()
+        test_query_cancellation()
+        test_progressive_results()
+        test_tier_cache()
+        test_metrics()
+        test_profiler()
+        test_plugin_core()
+        test_prefetcher()
+        test_tier_import()
+        test_offline_mode()
+        test_mock_api()
+        test_crash_safe_files()
+        test_index_service()
         test_caching()
 
         # Network-dependent test (skip if no internet)
@@ -220,6 +1359,8 @@ def run_all_tests():
         import traceback
         traceback.print_exc()
         return False
+    finally:
+        shutil.rmtree(DATA_DIR, ignore_errors=True)
 
     return True
 
@@ -267,13 +267,20 @@ class ProtonDBTester:
 
 def main():
     tester = ProtonDBTester()
+    args = sys.argv[1:]
+    if args[:1] == ["--mock-api"] and len(args) > 1:
+        # A local stand-in server (mock_api/server.py) instead of the real APIs
+        tester.pdb_api = f"{args[1].rstrip('/')}/api/v1/reports/summaries/"
+        tester.steam_api = f"{args[1].rstrip('/')}/ISteamApps/GetAppList/v2/"
+        tester.steam_api_file = tester.test_data_dir / 'steamapi-mock.json'
+        args = args[2:]
 
     # Setup
     tester.setup_test_environment()
 
-    if len(sys.argv) > 1:
+    if args:
         # Test specific game from command line
-        query = " ".join(sys.argv[1:])
+        query = " ".join(args)
         tester.test_search(query)
     else:
         # Ask user what to do
@@ -0,0 +1,177 @@
+"""
+Persistent per-appid ProtonDB tier cache
+
+Tiers are kept in a small SQLite database in the plugin's data directory so
+that every query (and every Albert session) can reuse ratings fetched before.
+SQLite's journal keeps every write atomic; a database that is damaged anyway
+is moved aside and started over, since its ratings can always be fetched again.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+
+class TierCache:
+    """SQLite-backed appid -> tier cache with a TTL and LRU eviction
+
+    A tier of None records that ProtonDB has no summary for the app, so
+    those lookups are not repeated either. The summary's report count is
+    kept too, as a popularity signal for ranking search results.
+
+    Tiers bulk imported from a ProtonDB dump live in a separate snapshot
+    table that never expires or is evicted; it answers lookups that miss
+    (or have expired from) the fetched tiers.
+    """
+
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        try:
+            self._open()
+        except sqlite3.DatabaseError:
+            self._discard()
+            self._open()
+
+    def _open(self):
+        """Connect to the database, raising DatabaseError if it is damaged"""
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        try:
+            if self._conn.execute("PRAGMA quick_check").fetchone()[0] != 'ok':
+                raise sqlite3.DatabaseError("tier cache failed its integrity check")
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tiers ("
+                "appid INTEGER PRIMARY KEY, tier TEXT, "
+                "fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS tiers_accessed ON tiers (accessed_at)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshot (appid INTEGER PRIMARY KEY, tier TEXT, reports INTEGER)"
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(tiers)")]
+            if 'reports' not in columns:
+                # Added after the first release of the cache
+                self._conn.execute("ALTER TABLE tiers ADD COLUMN reports INTEGER")
+            self._count = self._conn.execute("SELECT COUNT(*) FROM tiers").fetchone()[0]
+        except sqlite3.DatabaseError:
+            self._conn.close()
+            raise
+
+    def _discard(self):
+        """Move a damaged database (and its journal files) out of the way"""
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.replace(self.path + suffix, f"{self.path}{suffix}.corrupt")
+
+    def __len__(self):
+        return self._count
+
+    def snapshot_size(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM snapshot").fetchone()[0]
+
+    def get(self, appid, stale_ok=False):
+        """Look up a cached tier
+
+        Returns a (hit, tier) tuple; expired entries count as a miss unless
+        the imported snapshot has the app, or `stale_ok` is set (offline).
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tier, fetched_at FROM tiers WHERE appid = ?", (appid,)
+            ).fetchone()
+            if row is None or (now - row[1] >= self.ttl and not stale_ok):
+                row = self._conn.execute("SELECT tier FROM snapshot WHERE appid = ?", (appid,)).fetchone()
+                return (True, row[0]) if row is not None else (False, None)
+            self._conn.execute("UPDATE tiers SET accessed_at = ? WHERE appid = ?", (now, appid))
+        return True, row[0]
+
+    def put(self, appid, tier, reports=None, touch=True):
+        """Store a tier (or None for apps without a summary) and its report count
+
+        Without `touch` an existing entry keeps its last access time, so a
+        background refresh doesn't make it look recently viewed.
+        """
+        now = time.time()
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE tiers SET tier = ?, reports = ?, fetched_at = ?, "
+                "accessed_at = CASE WHEN ? THEN ? ELSE accessed_at END WHERE appid = ?",
+                (tier, reports, now, touch, now, appid)
+            ).rowcount
+            if not updated:
+                self._conn.execute(
+                    "INSERT INTO tiers (appid, tier, reports, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (appid, tier, reports, now, now)
+                )
+                self._count += 1
+                if self._count > self.max_entries:
+                    self._evict()
+
+    def import_snapshot(self, tiers):
+        """Replace the imported snapshot with (appid, tier, reports) tuples in one transaction
+
+        Returns the number of tiers imported.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM snapshot")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO snapshot (appid, tier, reports) VALUES (?, ?, ?)", tiers
+                )
+                count = self._conn.execute("SELECT COUNT(*) FROM snapshot").fetchone()[0]
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return count
+
+    def report_counts(self):
+        """Return {appid: report count} for the cached and imported apps that have reports"""
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT appid, reports FROM snapshot WHERE reports > 0"
+            ).fetchall())
+            counts.update(self._conn.execute(
+                "SELECT appid, reports FROM tiers WHERE reports > 0"
+            ).fetchall())
+        return counts
+
+    def expiring(self, within, accessed_since, limit, include=()):
+        """Return appids whose tier expires within `within` seconds, most reported first
+
+        Only entries viewed in the last `accessed_since` seconds (or listed
+        in `include`) are returned, already expired ones included.
+        """
+        now = time.time()
+        include = list(include)
+        placeholders = ', '.join('?' * len(include))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT appid FROM tiers WHERE fetched_at <= ? "
+                f"AND (accessed_at >= ? OR appid IN ({placeholders})) "
+                "ORDER BY COALESCE(reports, 0) DESC, accessed_at DESC LIMIT ?",
+                (now - self.ttl + within, now - accessed_since, *include, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _evict(self):
+        """Drop the least recently used entries, down to 90% of the size cap"""
+        keep = int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM tiers WHERE appid IN "
+            "(SELECT appid FROM tiers ORDER BY accessed_at ASC LIMIT ?)",
+            (self._count - keep,)
+        )
+        self._count = keep
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,129 @@
+"""
+Bulk import of ProtonDB tiers into the tier cache
+
+Reads a dump of ProtonDB summaries (or of raw reports) in one pass and stores
+a tier for every game in it, so ratings can be answered without a request
+per game. Accepted inputs, optionally gzipped or in a .tar.gz archive:
+
+- an object keyed by appid: {"620": {"tier": "platinum", "total": 812}, ...}
+- an array, or JSON lines, of summaries with an "appId"/"appid"/"id" field
+- an array of reports with an app id and a "rating" (older ProtonDB data
+  exports); each game gets the median rating of its reports
+
+Run it while Albert is running or not:
+    python3 import_tiers.py summaries.json [--tiers path/to/tiers.sqlite]
+"""
+
+import gzip
+import json
+import os
+import statistics
+import tarfile
+
+from .tier_cache import TierCache
+
+# Worst to best, for the median of report ratings
+TIER_ORDER = ('borked', 'bronze', 'silver', 'gold', 'platinum', 'native')
+
+_APPID_KEYS = ('appId', 'appid', 'app_id', 'id')
+
+
+def read_dump(path):
+    """Return the decoded text of a dump file, unpacking .gz and .tar.gz"""
+    if tarfile.is_tarfile(path):
+        with tarfile.open(path) as archive:
+            for member in archive:
+                if member.isfile() and member.name.endswith(('.json', '.jsonl')):
+                    return archive.extractfile(member).read().decode('utf-8')
+        raise ValueError(f"no JSON file in {os.path.basename(path)}")
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    return data.decode('utf-8')
+
+
+def parse_dump(text):
+    """Return the entries of a dump as a list (or dict keyed by appid)"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        # JSON lines
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _appid(entry):
+    for key in _APPID_KEYS:
+        if key in entry:
+            return entry[key]
+    app = entry.get('app')
+    if isinstance(app, dict):
+        # {"app": {"steam": {"appId": "620"}}} in newer report exports
+        steam = app.get('steam')
+        return _appid(steam) if isinstance(steam, dict) else _appid(app)
+    return None
+
+
+def _tier(value):
+    tier = value.get('tier') if isinstance(value, dict) else value
+    return tier.lower() if isinstance(tier, str) and tier else None
+
+
+def iter_tiers(entries):
+    """Yield (appid, tier, reports) tuples from parsed dump entries"""
+    if isinstance(entries, dict):
+        items = ((key, value) for key, value in entries.items())
+    else:
+        items = ((_appid(entry), entry) for entry in entries if isinstance(entry, dict))
+
+    ratings = {}
+    for appid, value in items:
+        try:
+            appid = int(appid)
+        except (TypeError, ValueError):
+            continue
+        if isinstance(value, dict) and 'tier' not in value and 'rating' in value:
+            rating = str(value['rating']).lower()
+            if rating in TIER_ORDER:
+                ratings.setdefault(appid, []).append(TIER_ORDER.index(rating))
+            continue
+        tier = _tier(value)
+        if tier is None:
+            continue
+        reports = value.get('total') if isinstance(value, dict) else None
+        yield appid, tier, reports if isinstance(reports, int) else None
+
+    for appid, ranks in ratings.items():
+        yield appid, TIER_ORDER[int(statistics.median_low(ranks))], len(ranks)
+
+
+def import_tiers(tier_cache, path):
+    """Replace the tier cache's snapshot with the tiers in a dump, returning their count"""
+    return tier_cache.import_snapshot(iter_tiers(parse_dump(read_dump(path))))
+
+
+def default_tier_file():
+    data_home = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    return os.path.join(data_home, 'albert', 'python', 'plugins', 'protondb', 'data', 'tiers.sqlite')
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import a ProtonDB summaries dump into the plugin's tier cache")
+    parser.add_argument('dump', help="summaries or reports dump (.json, .jsonl, .gz or .tar.gz)")
+    parser.add_argument('--tiers', default=default_tier_file(), help="tier cache to import into")
+    args = parser.parse_args(argv)
+
+    try:
+        entries = parse_dump(read_dump(args.dump))
+    except (OSError, ValueError, tarfile.TarError) as e:
+        parser.error(f"can't read {args.dump}: {e}")
+    os.makedirs(os.path.dirname(os.path.abspath(args.tiers)), exist_ok=True)
+    tier_cache = TierCache(args.tiers, ttl=86400, max_entries=20000)
+    try:
+        count = tier_cache.import_snapshot(iter_tiers(entries))
+    finally:
+        tier_cache.close()
+    print(f"Imported {count} ProtonDB tiers into {args.tiers}")
+    return 0